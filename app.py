@@ -1,34 +1,88 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session, flash
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, request, jsonify, render_template, stream_template, redirect, url_for, session, flash, get_flashed_messages, g, Response, stream_with_context
 import sqlite3
 from datetime import datetime
-from flask_jwt_extended import JWTManager
+from flask_jwt_extended import JWTManager, create_access_token, create_refresh_token, jwt_required, get_jwt, get_jwt_identity
 import os
 import re
 from functools import wraps
 import logging
+import click
+import threading
+import base64
+import csv
+import io
+import json
+import hashlib
+import math
+import atexit
+from config import config
+from database import connect, ConnectionPool
+from cache import VersionedCache
+from auth import PasswordHasher, HashingBusy, TokenBucketLimiter
+from write_behind import WriteBehindQueue
+from commit_queue import CommitQueue
+from report_snapshot import ReportSnapshot
+from migrations import migrate, rebuild_service_summary, rebuild_service_rollups, VERSIONED_TABLES, ROLLUP_GRANULARITIES
+from repositories import (UserRepository, CustomerRepository, CarRepository, ServiceRepository, AuditLogRepository,
+                          TableVersionRepository, utc_timestamp)
+from validators import validate_phone, validate_email, validate_year, validate_cost, SERVICE_STATUSES
+from bulk_import import BulkImporter, ImportFormatError, parse_upload, IMPORT_KINDS
+import assets
+import instrumentation
+import metrics
+from instrumentation import InstrumentedConnection
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+app.config.from_object(config[os.environ.get('FLASK_ENV', 'default')])
 
 # Use environment variables for secrets, fallback to defaults for development
 app.secret_key = os.environ.get('SECRET_KEY', 'supersecretkey')
 app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', '2981b42de8addb76b35e1e22e8874d52b7db9aaf9b55634f2745ee7d196cccf8b3e13ca08d4036361a09f4c04b2b938b7315be4c5a661748886212788f386f8f551645bf2a3254c2e560d2379bd22ae6e0156261c01c2b1743b54b5456e0a3f847533701f50d0e72ad3fe6c52bfcb2f65552ed4bd04ff7c700e89ceaa62b40275030112dc7a8d4da3f6ac4cea7017f39e5032a9017620aaa89623ac3c3294a9cd384e68000039a7d25680e07a0fdb14f703fca76e852ffb4bab5c920bcb69f1f2e2e37278845cbb557eaf24c7f1f497987747d75729e939e85bf6906396216c87d4803aedf0e5c204ea8cccd2b48de19c968c495375a7ae1b23aaec75c0085cf')
 
 jwt = JWTManager(app)
-
-# Database configuration
-DATABASE = 'workshop.db'
+assets.init_app(app)
+instrumentation.init_app(app)
+metrics_registry = metrics.init_app(app)
+
+_pool = None
+_pool_lock = threading.Lock()
+_commit_queue = None
+_commit_queue_database = None
+_report_snapshot = None
+_report_snapshot_database = None
+# {(database, table): (table version, row count)} so /metrics scrapes only recount tables that changed
+_row_counts = {}
+
+lookup_cache = VersionedCache(
+    max_entries=app.config['LOOKUP_CACHE_MAX_ENTRIES'],
+    max_rows=app.config['LOOKUP_CACHE_MAX_ROWS'],
+)
+
+password_hasher = PasswordHasher(
+    max_workers=app.config['PASSWORD_HASH_WORKERS'],
+    max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+    timeout=app.config['PASSWORD_HASH_TIMEOUT'],
+)
+login_user_limiter = TokenBucketLimiter(app.config['LOGIN_RATE_USER_BURST'],
+                                        app.config['LOGIN_RATE_USER_PER_MINUTE'] / 60.0)
+login_ip_limiter = TokenBucketLimiter(app.config['LOGIN_RATE_IP_BURST'],
+                                      app.config['LOGIN_RATE_IP_PER_MINUTE'] / 60.0)
 
 def get_db_connection():
-    """Create and return a database connection with error handling"""
+    """Create and return a standalone database connection with error handling"""
     try:
-        conn = sqlite3.connect(DATABASE)
-        conn.row_factory = sqlite3.Row  # This enables column access by name
-        return conn
+        return connect(
+            app.config['DATABASE'],
+            busy_timeout_ms=app.config['DB_BUSY_TIMEOUT_MS'],
+            cache_size_kb=app.config['DB_CACHE_SIZE_KB'],
+            mmap_size=app.config['DB_MMAP_SIZE'],
+            statement_cache_size=app.config['DB_STATEMENT_CACHE_SIZE'],
+            factory=InstrumentedConnection,
+        )
     except sqlite3.Error as e:
         logger.error(f"Database connection error: {e}")
         return None
@@ -41,6 +95,153 @@ def close_db_connection(conn):
         except sqlite3.Error as e:
             logger.error(f"Error closing database connection: {e}")
 
+def get_pool():
+    """Return the connection pool for the configured database, creating it on first use"""
+    global _pool
+    database = app.config['DATABASE']
+    with _pool_lock:
+        if _pool is None or _pool.database != database:
+            if _pool is not None:
+                _pool.close()
+                lookup_cache.clear()
+            _pool = ConnectionPool(
+                database,
+                max_size=app.config['DB_POOL_SIZE'],
+                timeout=app.config['DB_POOL_TIMEOUT'],
+                busy_timeout_ms=app.config['DB_BUSY_TIMEOUT_MS'],
+                cache_size_kb=app.config['DB_CACHE_SIZE_KB'],
+                mmap_size=app.config['DB_MMAP_SIZE'],
+                statement_cache_size=app.config['DB_STATEMENT_CACHE_SIZE'],
+                factory=InstrumentedConnection,
+            )
+        return _pool
+
+def close_pool():
+    """Flush queued writes and stop the commit queue, report snapshot and connection pool, e.g. before the database file is removed"""
+    global _pool, _commit_queue, _report_snapshot
+    write_queue.release()
+    with _pool_lock:
+        if _commit_queue is not None:
+            _commit_queue.close()
+            _commit_queue = None
+        if _report_snapshot is not None:
+            _report_snapshot.close()
+            _report_snapshot = None
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+        lookup_cache.clear()
+        _row_counts.clear()
+
+atexit.register(close_pool)
+
+def get_commit_queue():
+    """Return this process's single-writer commit queue for the configured database"""
+    global _commit_queue, _commit_queue_database
+    database = app.config['DATABASE']
+    with _pool_lock:
+        if _commit_queue is None or _commit_queue_database != database:
+            if _commit_queue is not None:
+                _commit_queue.close()
+            _commit_queue = CommitQueue(
+                get_db_connection,
+                max_batch=app.config['COMMIT_QUEUE_MAX_BATCH'],
+                max_delay=app.config['COMMIT_QUEUE_MAX_DELAY_MS'] / 1000.0,
+                timeout=app.config['COMMIT_QUEUE_TIMEOUT'],
+            )
+            _commit_queue_database = database
+        return _commit_queue
+
+def run_write(func, *args):
+    """Apply ``func(conn, *args)`` through the commit queue and return its result
+
+    Form and API mutations go through here so each process has one writer
+    and concurrent requests share a transaction. ``func`` must not commit.
+    """
+    return get_commit_queue().execute(func, *args)
+
+def get_report_snapshot():
+    """Return the reporting snapshot of the configured database, or None when disabled"""
+    global _report_snapshot, _report_snapshot_database
+    database = app.config['DATABASE']
+    if app.config['REPORT_SNAPSHOT_INTERVAL'] <= 0:
+        return None
+    with _pool_lock:
+        if _report_snapshot is None or _report_snapshot_database != database:
+            if _report_snapshot is not None:
+                _report_snapshot.close()
+            _report_snapshot = ReportSnapshot(
+                get_db_connection,
+                app.config['REPORT_SNAPSHOT_PATH'] or f"{database}.report",
+                interval=app.config['REPORT_SNAPSHOT_INTERVAL'],
+                pages=app.config['REPORT_SNAPSHOT_PAGES'],
+                step_sleep=app.config['REPORT_SNAPSHOT_STEP_SLEEP_MS'] / 1000.0,
+                version=get_board_version,
+            )
+            # The first copy is taken in the background; reports read the live database until it is ready
+            _report_snapshot.start()
+            _report_snapshot_database = database
+        return _report_snapshot
+
+def pool_metrics():
+    """This process's pool counters for the /metrics endpoint"""
+    if _pool is None:
+        return []
+    stats = _pool.stats()
+    return [('workshop_db_pool_connections', {'state': state}, stats[state], 'gauge')
+            for state in ('open', 'idle', 'in_use')] + [
+        ('workshop_db_pool_checkouts_total', {}, stats['checkouts'], 'counter'),
+        ('workshop_db_pool_waits_total', {}, stats['waits'], 'counter'),
+        ('workshop_db_pool_timeouts_total', {}, stats['timeouts'], 'counter'),
+        ('workshop_db_pool_wait_seconds_total', {}, stats['wait_seconds'], 'counter'),
+    ]
+
+metrics_registry.set_process_gauges(pool_metrics)
+
+# Low-priority writes (last login, audit events) committed in the background
+write_queue = WriteBehindQueue(
+    lambda: get_db_connection(),
+    interval=app.config['WRITE_BEHIND_INTERVAL'],
+    max_batch=app.config['WRITE_BEHIND_MAX_BATCH'],
+    max_pending=app.config['WRITE_BEHIND_MAX_PENDING'],
+)
+atexit.register(write_queue.close)
+
+def get_db():
+    """Return the pooled connection bound to the current app context"""
+    if 'db' not in g:
+        try:
+            g.db_pool = get_pool()
+            g.db = g.db_pool.acquire()
+        except sqlite3.Error as e:
+            logger.error(f"Database connection error: {e}")
+            return None
+    return g.db
+
+def get_report_db():
+    """Return (connection, as-of time) for reports: the snapshot, or the live database if it is unavailable"""
+    if 'report_db' not in g:
+        snapshot = get_report_snapshot()
+        conn = snapshot.connect(factory=InstrumentedConnection) if snapshot is not None else None
+        if conn is None:
+            return get_db(), None
+        g.report_db = conn
+        try:
+            g.report_as_of = snapshot.as_of(conn)
+        except sqlite3.Error as e:
+            logger.error(f"Error reading report snapshot time: {e}")
+            g.report_as_of = None
+    return g.report_db, g.report_as_of
+
+@app.teardown_appcontext
+def release_db(exception=None):
+    """Hand the request's connection back to the pool and close any snapshot connection"""
+    conn = g.pop('db', None)
+    pool = g.pop('db_pool', None)
+    if conn is not None:
+        pool.release(conn)
+    close_db_connection(g.pop('report_db', None))
+
 def login_required(f):
     """Decorator to require login for routes"""
     @wraps(f)
@@ -64,181 +265,319 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def validate_phone(phone):
-    """Validate phone number format"""
-    phone_pattern = re.compile(r'^\+?[\d\s\-\(\)]{10,}$')
-    return bool(phone_pattern.match(phone))
+def encode_cursor(row, keys=('created_at', 'id')):
+    """Encode the keyset position of a row as an opaque token"""
+    raw = json.dumps([row[key] for key in keys])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
 
-def validate_email(email):
-    """Validate email format"""
-    email_pattern = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
-    return bool(email_pattern.match(email))
-
-def validate_year(year):
-    """Validate year (must be reasonable for a car)"""
+def decode_cursor(token, size=2):
+    """Decode a pagination token, returning its key values or None if invalid"""
     try:
-        year_int = int(year)
-        return 1900 <= year_int <= datetime.now().year + 1
-    except (ValueError, TypeError):
-        return False
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
 
-def validate_cost(cost):
-    """Validate cost (must be positive number)"""
+def get_page_size():
+    """Read the requested page size, clamped to the configured maximum"""
     try:
-        cost_float = float(cost)
-        return cost_float > 0
-    except (ValueError, TypeError):
-        return False
+        page_size = int(request.args.get('per_page', app.config['PAGE_SIZE']))
+    except ValueError:
+        page_size = app.config['PAGE_SIZE']
+    return max(1, min(page_size, app.config['MAX_PAGE_SIZE']))
+
+def page_url(**cursor):
+    """Build a URL to the current view keeping its filters but replacing the cursor"""
+    args = {k: v for k, v in request.args.items() if k not in ('after', 'before')}
+    args.update(cursor)
+    return url_for(request.endpoint, **args)
+
+def fetch_keyset_page(cursor, base_query, where_conditions, params, table_alias='',
+                      sort_key=None, descending=True, stream=False):
+    """Fetch one page of rows using keyset pagination
+
+    Rows are ordered by ``sort_key`` -- a list of (SQL expression, row column)
+    pairs, by default (created_at, id) newest first. Pages are addressed by the
+    ``after``/``before`` cursors in the query string rather than by OFFSET, so
+    every page costs the same index seek no matter how deep into the history it
+    is. Returns the rows and a pagination dict with next/previous URLs for the
+    template.
+
+    With ``stream`` set, a forward page is returned as a RowStream that the
+    template reads as it renders, and the pagination links are filled in once
+    its last row has gone out. Backward pages are read in reverse and flipped,
+    so they are always fetched whole.
+    """
+    page_size = get_page_size()
+    if sort_key is None:
+        prefix = f"{table_alias}." if table_alias else ''
+        sort_key = [(f"{prefix}created_at", 'created_at'), (f"{prefix}id", 'id')]
+    expressions = [expression for expression, _ in sort_key]
+    row_keys = [key for _, key in sort_key]
+    key = f"({', '.join(expressions)})"
+    placeholders = f"({', '.join('?' for _ in sort_key)})"
+    conditions = list(where_conditions)
+    params = list(params)
+
+    after = decode_cursor(request.args.get('after', ''), len(sort_key))
+    before = None if after else decode_cursor(request.args.get('before', ''), len(sort_key))
+    forward, backward = ('<', '>') if descending else ('>', '<')
+    if after:
+        conditions.append(f"{key} {forward} {placeholders}")
+        params.extend(after)
+    elif before:
+        conditions.append(f"{key} {backward} {placeholders}")
+        params.extend(before)
+
+    # Walking backwards reverses the sort, then the page is flipped back below
+    direction = 'DESC' if descending != bool(before) else 'ASC'
+    query = base_query
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY " + ", ".join(f"{expression} {direction}" for expression in expressions) + " LIMIT ?"
+    params.append(page_size + 1)
+
+    cursor.execute(query, params)
+    pagination = {'next_url': None, 'prev_url': None, 'per_page': page_size}
+
+    def link_pages(first, last, has_more):
+        if first is None:
+            return
+        if (has_more and not before) or before:
+            pagination['next_url'] = page_url(after=encode_cursor(last, row_keys))
+        if (has_more and before) or after:
+            pagination['prev_url'] = page_url(before=encode_cursor(first, row_keys))
+
+    if stream and not before:
+        # Links need the request context, which a streamed template keeps until it finishes
+        return RowStream(cursor, 'page', limit=page_size,
+                         on_end=lambda rows: link_pages(rows.first, rows.last, rows.more)), pagination
+
+    rows = cursor.fetchall()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if before:
+        rows.reverse()
+    if rows:
+        link_pages(rows[0], rows[-1], has_more)
+    return rows, pagination
+
+class RowStream:
+    """An executed cursor's rows, read ``batch_size`` at a time as a template consumes them
+
+    A database error part-way through can no longer become a flash message, so
+    it is logged and kept in ``error`` for the template to flag the rows above
+    it as incomplete. At most ``limit`` rows are yielded; ``more`` records
+    whether the cursor had another, and ``first``/``last`` the rows at either end.
+    """
+
+    def __init__(self, cursor, label, batch_size=100, limit=None, on_end=None):
+        self.cursor = cursor
+        self.label = label
+        self.batch_size = batch_size
+        self.limit = limit
+        self.on_end = on_end
+        self.error = None
+        self.more = False
+        self.first = self.last = None
+
+    def __iter__(self):
+        count = 0
+        try:
+            while True:
+                rows = self.cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    if self.limit is not None and count == self.limit:
+                        self.more = True
+                        break
+                    if self.first is None:
+                        self.first = row
+                    self.last = row
+                    count += 1
+                    yield row
+                if self.more:
+                    break
+        except sqlite3.Error as e:
+            logger.error(f"Database error streaming {self.label}: {e}")
+            self.error = e
+            return
+        if self.on_end:
+            self.on_end(self)
+
+def join_chunks(chunks, size):
+    """Merge a template's many small output strings into pieces of at least ``size`` characters"""
+    buffer = []
+    length = 0
+    try:
+        for chunk in chunks:
+            buffer.append(chunk)
+            length += len(chunk)
+            if length >= size:
+                yield ''.join(buffer)
+                buffer = []
+                length = 0
+        if buffer:
+            yield ''.join(buffer)
+    finally:
+        # Closing the stream promptly releases the request context it holds
+        chunks.close()
+
+def render_streamed(template, **context):
+    """Render a list page, streamed to the client as it renders when STREAM_TEMPLATES is on
+
+    The page head and filter form go out while rows are still being read.
+    """
+    if not app.config['STREAM_TEMPLATES']:
+        return render_template(template, **context)
+    # The session cookie is sent before the body, so take the flashed messages out of it now
+    get_flashed_messages()
+    return Response(join_chunks(stream_template(template, **context), app.config['STREAM_CHUNK_SIZE']),
+                    mimetype='text/html')
+
+_fts_available = {}
+
+def services_fts_available(cursor):
+    """Return whether the services_fts index exists and is usable, cached per database
+
+    Only a missing index or FTS5 module is remembered; any other error (a
+    locked or busy database) falls back to LIKE for this search alone.
+    """
+    database = app.config['DATABASE']
+    if database not in _fts_available:
+        try:
+            cursor.execute("SELECT rowid FROM services_fts LIMIT 0")
+            _fts_available[database] = True
+        except sqlite3.OperationalError as e:
+            if 'no such table' not in str(e) and 'no such module' not in str(e):
+                logger.warning(f"Could not check the services search index, using LIKE this time: {e}")
+                return False
+            _fts_available[database] = False
+    return _fts_available[database]
+
+def build_fts_query(search_term):
+    """Turn free text into an FTS5 prefix query, quoting each term so user input is never parsed as syntax"""
+    terms = re.findall(r'\w+', search_term)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def _customer_label(row):
+    return f"{row['name']} ({row['phone']})"
+
+def _car_label(row):
+    label = f"{row['customer_name']} - {row['name']} {row['model']} ({row['year']})"
+    return f"{label} [{row['license_plate']}]" if row['license_plate'] else label
+
+# Typeahead kinds: (tables the results depend on, repository, label builder)
+LOOKUP_QUERIES = {
+    'customers': (('customers',), CustomerRepository, _customer_label),
+    'cars': (('customers', 'cars'), CarRepository, _car_label),
+}
+
+def get_lookup(conn, kind, term, limit):
+    """Return typeahead matches for ``term``, served from the lookup cache while the tables are unchanged"""
+    tables, repository, label = LOOKUP_QUERIES[kind]
+    versions = TableVersionRepository(conn).versions(tables)
+
+    def load():
+        return [dict(row, label=label(row)) for row in repository(conn).lookup(term, limit)]
+
+    return lookup_cache.get_or_load((app.config['DATABASE'], kind, term.lower(), limit), versions, load)
+
+def _template_fingerprint():
+    """Hash the templates and asset manifest so a deploy invalidates previously issued ETags
+
+    Pages embed fingerprinted asset URLs, so rebuilt assets must change the
+    ETag even when no template did.
+    """
+    digest = hashlib.sha1()
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    for name in sorted(os.listdir(template_dir)):
+        with open(os.path.join(template_dir, name), 'rb') as f:
+            digest.update(name.encode() + f.read())
+    try:
+        with open(os.path.join(app.static_folder, assets.DIST_DIR, assets.MANIFEST_NAME), 'rb') as f:
+            digest.update(assets.MANIFEST_NAME.encode() + f.read())
+    except OSError:
+        pass
+    return digest.hexdigest()[:12]
+
+TEMPLATE_FINGERPRINT = _template_fingerprint()
+
+def conditional_get(*tables, snapshot=False):
+    """Decorator answering repeat GETs with 304 Not Modified while ``tables`` are unchanged
+
+    The ETag covers the table versions, the query string and the user's role,
+    so filtered pages and admin/user variants are validated separately. Pages
+    with pending flash messages are always rendered so messages are not lost.
+    With ``snapshot``, the page reads the report snapshot, so its as-of time
+    is the validator too.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET' or '_flashes' in session:
+                return f(*args, **kwargs)
+            conn = get_db()
+            if not conn:
+                return f(*args, **kwargs)
+            try:
+                versions = TableVersionRepository(conn).versions(tables)
+            except sqlite3.Error as e:
+                logger.error(f"Error reading table versions: {e}")
+                return f(*args, **kwargs)
+
+            as_of = get_report_db()[1] if snapshot else None
+            key = json.dumps([request.endpoint, session.get('role'), sorted(request.args.items(multi=True)),
+                              sorted(versions.items()), as_of, TEMPLATE_FINGERPRINT])
+            etag = hashlib.sha1(key.encode()).hexdigest()
+            stamps = [as_of] if as_of else [updated_at for _, updated_at in versions.values() if updated_at]
+            last_modified = datetime.strptime(max(stamps), '%Y-%m-%d %H:%M:%S') if stamps else None
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = bool(since and last_modified and last_modified <= since.replace(tzinfo=None))
+
+            response = app.make_response('' if not_modified else f(*args, **kwargs))
+            if not_modified:
+                response.status_code = 304
+            if response.status_code in (200, 304):
+                response.set_etag(etag)
+                if last_modified:
+                    response.last_modified = last_modified
+                # Revalidate every time and keep per-user pages out of shared caches
+                response.headers['Cache-Control'] = 'private, no-cache'
+                response.vary.add('Cookie')
+            return response
+        return decorated_function
+    return decorator
+
+def parse_granularity(args):
+    """Return the report's rollup granularity, raising ValueError for unknown values"""
+    granularity = args.get('granularity', '').strip() or 'month'
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise ValueError('Please select a valid granularity.')
+    return granularity
 
 def init_db():
-    """Initialize database with improved schema and error handling"""
+    """Bring the database schema up to date; a no-op beyond one version read when it already is"""
     conn = get_db_connection()
     if not conn:
         logger.error("Failed to connect to database during initialization")
         return False
-    
-    cursor = conn.cursor()
-    
+
     try:
-        # Check if database needs migration
-        cursor.execute("PRAGMA table_info(users)")
-        existing_columns = [row[1] for row in cursor.fetchall()]
-        
-        # Create or migrate users table
-        if not existing_columns:
-            # Create new table
-            cursor.execute('''
-            CREATE TABLE users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                role TEXT NOT NULL CHECK (role IN ('admin', 'user')),
-                email TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                last_login TEXT
-            )
-            ''')
-            logger.info("Created new users table")
-        else:
-            # Migrate existing table
-            if 'email' not in existing_columns:
-                cursor.execute('ALTER TABLE users ADD COLUMN email TEXT')
-            if 'created_at' not in existing_columns:
-                cursor.execute('ALTER TABLE users ADD COLUMN created_at TEXT')
-                # Update existing records with current timestamp
-                cursor.execute("UPDATE users SET created_at = datetime('now') WHERE created_at IS NULL")
-            if 'last_login' not in existing_columns:
-                cursor.execute('ALTER TABLE users ADD COLUMN last_login TEXT')
-            logger.info("Migrated existing users table")
-
-        # Check and migrate customers table
-        cursor.execute("PRAGMA table_info(customers)")
-        existing_columns = [row[1] for row in cursor.fetchall()]
-        
-        if not existing_columns:
-            cursor.execute('''
-            CREATE TABLE customers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                phone TEXT NOT NULL,
-                email TEXT,
-                address TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-            ''')
-            logger.info("Created new customers table")
-        else:
-            if 'email' not in existing_columns:
-                cursor.execute('ALTER TABLE customers ADD COLUMN email TEXT')
-            if 'address' not in existing_columns:
-                cursor.execute('ALTER TABLE customers ADD COLUMN address TEXT')
-            if 'updated_at' not in existing_columns:
-                cursor.execute('ALTER TABLE customers ADD COLUMN updated_at TEXT')
-                # Update existing records with current timestamp
-                cursor.execute('UPDATE customers SET updated_at = created_at WHERE updated_at IS NULL')
-            logger.info("Migrated existing customers table")
-
-        # Check and migrate cars table
-        cursor.execute("PRAGMA table_info(cars)")
-        existing_columns = [row[1] for row in cursor.fetchall()]
-        
-        if not existing_columns:
-            cursor.execute('''
-            CREATE TABLE cars (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                model TEXT NOT NULL,
-                year INTEGER NOT NULL,
-                engine_type TEXT NOT NULL,
-                customer_id INTEGER NOT NULL,
-                license_plate TEXT,
-                vin TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (customer_id) REFERENCES customers (id) ON DELETE CASCADE
-            )
-            ''')
-            logger.info("Created new cars table")
-        else:
-            if 'license_plate' not in existing_columns:
-                cursor.execute('ALTER TABLE cars ADD COLUMN license_plate TEXT')
-            if 'vin' not in existing_columns:
-                cursor.execute('ALTER TABLE cars ADD COLUMN vin TEXT')
-            if 'updated_at' not in existing_columns:
-                cursor.execute('ALTER TABLE cars ADD COLUMN updated_at TEXT')
-                # Update existing records with current timestamp
-                cursor.execute('UPDATE cars SET updated_at = created_at WHERE updated_at IS NULL')
-            logger.info("Migrated existing cars table")
-
-        # Check and migrate services table
-        cursor.execute("PRAGMA table_info(services)")
-        existing_columns = [row[1] for row in cursor.fetchall()]
-        
-        if not existing_columns:
-            cursor.execute('''
-            CREATE TABLE services (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                type TEXT NOT NULL,
-                cost REAL NOT NULL CHECK (cost > 0),
-                status TEXT NOT NULL CHECK (status IN ('Pending', 'In Progress', 'Completed', 'Cancelled')),
-                car_id INTEGER NOT NULL,
-                description TEXT,
-                start_date TEXT DEFAULT CURRENT_TIMESTAMP,
-                end_date TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (car_id) REFERENCES cars (id) ON DELETE CASCADE
-            )
-            ''')
-            logger.info("Created new services table")
-        else:
-            if 'description' not in existing_columns:
-                cursor.execute('ALTER TABLE services ADD COLUMN description TEXT')
-            if 'start_date' not in existing_columns:
-                cursor.execute('ALTER TABLE services ADD COLUMN start_date TEXT')
-                # Update existing records with current timestamp
-                cursor.execute('UPDATE services SET start_date = created_at WHERE start_date IS NULL')
-            if 'end_date' not in existing_columns:
-                cursor.execute('ALTER TABLE services ADD COLUMN end_date TEXT')
-            if 'updated_at' not in existing_columns:
-                cursor.execute('ALTER TABLE services ADD COLUMN updated_at TEXT')
-                # Update existing records with current timestamp
-                cursor.execute('UPDATE services SET updated_at = created_at WHERE updated_at IS NULL')
-            logger.info("Migrated existing services table")
-
-        # Create indexes for better performance
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_cars_customer_id ON cars(customer_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_services_car_id ON services(car_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_services_status ON services(status)')
-        
-        conn.commit()
-        logger.info("Database initialized and migrated successfully")
+        applied = migrate(conn)
+        if applied:
+            logger.info(f"Database migrated to schema version {applied[-1]}")
         return True
-        
     except sqlite3.Error as e:
         logger.error(f"Database initialization error: {e}")
-        conn.rollback()
         return False
     finally:
         close_db_connection(conn)
@@ -249,6 +588,37 @@ def home():
     return redirect(url_for('login'))
 
 
+def authenticate_user(conn, username, password):
+    """Return the user row if the credentials are valid, otherwise None"""
+    user = UserRepository(conn).get_credentials(username)
+    if user and password_hasher.verify(user['password'], password):
+        return user
+    return None
+
+def login_retry_after(username):
+    """Whole seconds until this username and client may try to log in again, or 0 if allowed now
+
+    An allowed attempt is charged up front so concurrent guesses cannot all
+    get through; ``refund_login_attempt`` gives it back once the password
+    checks out, so only failed verifications count against the limits.
+    """
+    wait = max(login_ip_limiter.consume(request.remote_addr or 'unknown'),
+               login_user_limiter.consume(username.lower()))
+    return math.ceil(wait)
+
+def refund_login_attempt(username):
+    """Return the tokens a successful login was charged by ``login_retry_after``"""
+    login_ip_limiter.refund(request.remote_addr or 'unknown')
+    login_user_limiter.refund(username.lower())
+
+def record_last_login(user_id):
+    """Queue an update of a user's last login time; repeated logins coalesce into one write"""
+    write_queue.put(UserRepository.LAST_LOGIN_SQL, (utc_timestamp(), user_id), key=('last_login', user_id))
+
+def record_audit_event(event, username, detail=None):
+    """Queue an audit_log entry for the current request"""
+    write_queue.put(AuditLogRepository.INSERT_SQL, (event, username, request.remote_addr, detail, utc_timestamp()))
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -260,28 +630,25 @@ def login():
             flash('Please enter both username and password.')
             return render_template('login.html')
 
-        conn = get_db_connection()
+        retry_after = login_retry_after(username)
+        if retry_after:
+            logger.warning(f"Rate limited login attempt for username: {username} from {request.remote_addr}")
+            record_audit_event('login_throttled', username)
+            flash(f'Too many login attempts. Please try again in {retry_after} seconds.')
+            return render_template('login.html'), 429, {'Retry-After': str(retry_after)}
+
+        conn = get_db()
         if not conn:
             flash('System error. Please try again later.')
             return render_template('login.html')
 
         try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id, password, role, username 
-                FROM users 
-                WHERE username = ?
-            """, (username,))
-            user = cursor.fetchone()
-
-            if user and check_password_hash(user['password'], password):
-                # Update last login time
-                cursor.execute("""
-                    UPDATE users 
-                    SET last_login = CURRENT_TIMESTAMP 
-                    WHERE id = ?
-                """, (user['id'],))
-                conn.commit()
+            user = authenticate_user(conn, username, password)
+
+            if user:
+                refund_login_attempt(username)
+                record_last_login(user['id'])
+                record_audit_event('login', username)
 
                 # Set session data
                 session['user_id'] = user['id']
@@ -293,12 +660,17 @@ def login():
                 return redirect(url_for('dashboard'))
             else:
                 logger.warning(f"Failed login attempt for username: {username}")
+                record_audit_event('login_failed', username)
                 flash('Invalid username or password.')
+        except HashingBusy as e:
+            # The password was never checked, so the attempt does not count against the limits
+            refund_login_attempt(username)
+            logger.warning(f"Login for {username} rejected, password hashing saturated: {e}")
+            flash('The system is busy. Please try again in a moment.')
+            return render_template('login.html'), 503, {'Retry-After': '1'}
         except sqlite3.Error as e:
             logger.error(f"Database error during login: {e}")
             flash('System error. Please try again later.')
-        finally:
-            close_db_connection(conn)
 
     return render_template('login.html')
 
@@ -306,7 +678,14 @@ def login():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    return render_template('dashboard.html', username=session['username'], role=session['role'])
+    summary = {}
+    conn = get_db()
+    if conn:
+        try:
+            summary = ServiceRepository(conn).summary()
+        except sqlite3.Error as e:
+            logger.error(f"Database error reading dashboard summary: {e}")
+    return render_template('dashboard.html', username=session['username'], role=session['role'], summary=summary)
 
 @app.route('/logout')
 def logout():
@@ -318,15 +697,14 @@ def logout():
 
 @app.route('/customers', methods=['GET', 'POST'])
 @login_required
+@conditional_get('customers')
 def manage_customers():
-    conn = get_db_connection()
+    conn = get_db()
     if not conn:
         flash('Database connection error. Please try again.')
-        return render_template('customers.html', customers=[])
+        return render_template('customers.html', customers=[], pagination={})
 
     try:
-        cursor = conn.cursor()
-
         if request.method == 'POST':
             name = request.form.get('name', '').strip()
             phone = request.form.get('phone', '').strip()
@@ -344,11 +722,8 @@ def manage_customers():
                 flash('Please enter a valid email address.')
             else:
                 try:
-                    cursor.execute("""
-                        INSERT INTO customers (name, phone, email, address, created_at, updated_at) 
-                        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-                    """, (name, phone, email, address))
-                    conn.commit()
+                    run_write(lambda conn: CustomerRepository(conn).insert(
+                        name=name, phone=phone, email=email, address=address))
                     flash('Customer added successfully!')
                     logger.info(f"New customer added: {name}")
                 except sqlite3.IntegrityError:
@@ -357,76 +732,48 @@ def manage_customers():
                     logger.error(f"Database error adding customer: {e}")
                     flash('Error adding customer. Please try again.')
 
-        # Get all customers with better formatting
-        cursor.execute("""
-            SELECT id, name, phone, email, address, created_at, updated_at 
-            FROM customers 
-            ORDER BY created_at DESC
-        """)
-        customers = cursor.fetchall()
+        # Get one page of customers, newest first
+        customers, pagination = fetch_keyset_page(conn.cursor(), CustomerRepository.list_query, [], [])
 
     except sqlite3.Error as e:
         logger.error(f"Database error in customers: {e}")
         flash('Database error. Please try again.')
         customers = []
-    finally:
-        close_db_connection(conn)
+        pagination = {}
 
-    return render_template('customers.html', customers=customers)
+    return render_template('customers.html', customers=customers, pagination=pagination)
 
 @app.route('/delete_customer/<int:customer_id>', methods=['POST'])
 @admin_required
 def delete_customer(customer_id):
-    conn = get_db_connection()
-    if not conn:
-        flash('Database connection error. Please try again.')
-        return redirect(url_for('manage_customers'))
-
     try:
-        cursor = conn.cursor()
-        
-        # Check if customer exists
-        cursor.execute("SELECT name FROM customers WHERE id = ?", (customer_id,))
-        customer = cursor.fetchone()
-        
+        # Checked and deleted in one queued write so a car added meanwhile cannot be orphaned
+        customer, car_count = run_write(lambda conn: CustomerRepository(conn).delete_unless_has_cars(customer_id))
+
         if not customer:
             flash('Customer not found.')
+        elif car_count > 0:
+            flash(f"Cannot delete customer '{customer['name']}' - they have {car_count} car(s) registered.")
         else:
-            # Check if customer has cars
-            cursor.execute("SELECT COUNT(*) FROM cars WHERE customer_id = ?", (customer_id,))
-            car_count = cursor.fetchone()[0]
-            
-            if car_count > 0:
-                flash(f"Cannot delete customer '{customer['name']}' - they have {car_count} car(s) registered.")
-            else:
-                cursor.execute("DELETE FROM customers WHERE id = ?", (customer_id,))
-                conn.commit()
-                flash(f"Customer '{customer['name']}' has been deleted successfully.")
-                logger.info(f"Customer {customer_id} deleted by admin {session['username']}")
+            flash(f"Customer '{customer['name']}' has been deleted successfully.")
+            logger.info(f"Customer {customer_id} deleted by admin {session['username']}")
     except sqlite3.Error as e:
         logger.error(f"Database error deleting customer: {e}")
         flash('Error deleting customer. Please try again.')
-    finally:
-        close_db_connection(conn)
 
     return redirect(url_for('manage_customers'))
 
 
 @app.route('/cars', methods=['GET', 'POST'])
 @login_required
+@conditional_get('customers', 'cars')
 def manage_cars():
-    conn = get_db_connection()
+    conn = get_db()
     if not conn:
         flash('Database connection error. Please try again.')
-        return render_template('cars.html', cars=[], customers=[])
+        return render_template('cars.html', cars=[], pagination={})
 
     try:
-        cursor = conn.cursor()
-
-        # Get customer list for dropdown
-        cursor.execute("SELECT id, name, phone FROM customers ORDER BY name")
-        customer_list = cursor.fetchall()
-
         if request.method == 'POST':
             name = request.form.get('name', '').strip()
             model = request.form.get('model', '').strip()
@@ -443,11 +790,9 @@ def manage_cars():
                 flash('Please enter a valid year.')
             else:
                 try:
-                    cursor.execute("""
-                        INSERT INTO cars (name, model, year, engine_type, customer_id, license_plate, vin, created_at, updated_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-                    """, (name, model, year, engine_type, customer_id, license_plate, vin))
-                    conn.commit()
+                    run_write(lambda conn: CarRepository(conn).insert(
+                        name=name, model=model, year=year, engine_type=engine_type,
+                        customer_id=customer_id, license_plate=license_plate, vin=vin))
                     flash('Car added successfully!')
                     logger.info(f"New car added: {name} {model}")
                 except sqlite3.IntegrityError:
@@ -456,83 +801,64 @@ def manage_cars():
                     logger.error(f"Database error adding car: {e}")
                     flash('Error adding car. Please try again.')
 
-        # Get all cars with customer information
-        cursor.execute("""
-            SELECT c.id, c.name, c.model, c.year, c.engine_type, c.license_plate, c.vin, 
-                   c.created_at, c.updated_at, cu.name as customer_name, cu.phone as customer_phone
-            FROM cars c
-            JOIN customers cu ON c.customer_id = cu.id
-            ORDER BY c.created_at DESC
-        """)
-        cars = cursor.fetchall()
+        # Get one page of cars with customer information
+        cars, pagination = fetch_keyset_page(conn.cursor(), CarRepository.list_query, [], [], table_alias='c')
 
     except sqlite3.Error as e:
         logger.error(f"Database error in cars: {e}")
         flash('Database error. Please try again.')
         cars = []
-        customer_list = []
-    finally:
-        close_db_connection(conn)
+        pagination = {}
 
-    return render_template('cars.html', cars=cars, customers=customer_list)
+    return render_template('cars.html', cars=cars, pagination=pagination)
 
 @app.route('/delete_car/<int:car_id>', methods=['POST'])
 @admin_required
 def delete_car(car_id):
-    conn = get_db_connection()
-    if not conn:
-        flash('Database connection error. Please try again.')
-        return redirect(url_for('manage_cars'))
-
     try:
-        cursor = conn.cursor()
-        
-        # Check if car exists
-        cursor.execute("SELECT name, model FROM cars WHERE id = ?", (car_id,))
-        car = cursor.fetchone()
-        
+        car, service_count = run_write(lambda conn: CarRepository(conn).delete_unless_has_services(car_id))
+
         if not car:
             flash('Car not found.')
+        elif service_count > 0:
+            flash(f"Cannot delete car '{car['name']} {car['model']}' - it has {service_count} service(s) registered.")
         else:
-            # Check if car has services
-            cursor.execute("SELECT COUNT(*) FROM services WHERE car_id = ?", (car_id,))
-            service_count = cursor.fetchone()[0]
-            
-            if service_count > 0:
-                flash(f"Cannot delete car '{car['name']} {car['model']}' - it has {service_count} service(s) registered.")
-            else:
-                cursor.execute("DELETE FROM cars WHERE id = ?", (car_id,))
-                conn.commit()
-                flash(f"Car '{car['name']} {car['model']}' has been deleted successfully.")
-                logger.info(f"Car {car_id} deleted by admin {session['username']}")
+            flash(f"Car '{car['name']} {car['model']}' has been deleted successfully.")
+            logger.info(f"Car {car_id} deleted by admin {session['username']}")
     except sqlite3.Error as e:
         logger.error(f"Database error deleting car: {e}")
         flash('Error deleting car. Please try again.')
-    finally:
-        close_db_connection(conn)
 
     return redirect(url_for('manage_cars'))
 
+def build_services_query(cursor, args, role):
+    """Build the services list query for the given search/status/customer filters
+
+    Returns the positional arguments for fetch_keyset_page. Non-admins never see
+    cancelled services; searches are ranked by bm25 when the FTS5 index exists.
+    """
+    search_term = args.get('search', '').strip()
+    fts_query = build_fts_query(search_term) if search_term and services_fts_available(cursor) else ''
+    return ServiceRepository(cursor.connection).build_list_query(
+        search_term=search_term,
+        fts_query=fts_query,
+        status=args.get('status_filter', '').strip(),
+        customer_name=args.get('customer_filter', '').strip(),
+        include_cancelled=role == 'admin',
+    )
+
 @app.route('/services', methods=['GET', 'POST'])
 @login_required
+@conditional_get('customers', 'cars', 'services')
 def manage_services():
-    conn = get_db_connection()
+    conn = get_db()
     if not conn:
         flash('Database connection error. Please try again.')
-        return render_template('services.html', services=[], cars=[], role=session.get('role'))
+        return render_template('services.html', services=[], role=session.get('role'), pagination={})
 
     try:
         cursor = conn.cursor()
 
-        # Get car list for dropdown with customer information
-        cursor.execute("""
-            SELECT c.id, c.name, c.model, c.year, cu.name as customer_name
-            FROM cars c
-            JOIN customers cu ON c.customer_id = cu.id
-            ORDER BY c.name, c.model
-        """)
-        car_list = cursor.fetchall()
-
         if request.method == 'POST':
             service_type = request.form.get('type', '').strip()
             cost = request.form.get('cost', '').strip()
@@ -545,15 +871,12 @@ def manage_services():
                 flash('Please fill in all required fields.')
             elif not validate_cost(cost):
                 flash('Please enter a valid cost (must be greater than 0).')
-            elif status not in ['Pending', 'In Progress', 'Completed', 'Cancelled']:
+            elif status not in SERVICE_STATUSES:
                 flash('Please select a valid status.')
             else:
                 try:
-                    cursor.execute("""
-                        INSERT INTO services (type, cost, status, car_id, description, start_date, created_at, updated_at)
-                        VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-                    """, (service_type, cost, status, car_id, description))
-                    conn.commit()
+                    run_write(lambda conn: ServiceRepository(conn).insert(
+                        type=service_type, cost=cost, status=status, car_id=car_id, description=description))
                     flash('Service added successfully!')
                     logger.info(f"New service added: {service_type} for car {car_id}")
                 except sqlite3.IntegrityError:
@@ -565,295 +888,714 @@ def manage_services():
         # Get services with car and customer information
         role = session.get('role')
         
-        # Build the base query
-        base_query = """
-            SELECT s.id, s.type, s.cost, s.status, s.description, s.start_date, s.end_date,
-                   s.created_at, s.updated_at, c.name as car_name, c.model as car_model,
-                   cu.name as customer_name, cu.phone as customer_phone
-            FROM services s
-            JOIN cars c ON s.car_id = c.id
-            JOIN customers cu ON c.customer_id = cu.id
-        """
-        
-        # Add WHERE conditions for filtering
-        where_conditions = []
-        params = []
-        
-        # Status filter for non-admin users
-        if role != 'admin':
-            where_conditions.append("s.status != 'Cancelled'")
-        
-        # Search filter
-        search_term = request.args.get('search', '').strip()
-        if search_term:
-            where_conditions.append("(s.type LIKE ? OR s.description LIKE ?)")
-            params.extend([f'%{search_term}%', f'%{search_term}%'])
-        
-        # Status filter
-        status_filter = request.args.get('status_filter', '').strip()
-        if status_filter:
-            where_conditions.append("s.status = ?")
-            params.append(status_filter)
-        
-        # Customer filter
-        customer_filter = request.args.get('customer_filter', '').strip()
-        if customer_filter:
-            where_conditions.append("cu.name = ?")
-            params.append(customer_filter)
-        
-        # Build final query
-        if where_conditions:
-            query = base_query + " WHERE " + " AND ".join(where_conditions) + " ORDER BY s.created_at DESC"
-        else:
-            query = base_query + " ORDER BY s.created_at DESC"
-        
-        cursor.execute(query, params)
-        services = cursor.fetchall()
+        # Fetch one page, read as the page renders; the filters stay in the query string across pages
+        services, pagination = fetch_keyset_page(cursor, *build_services_query(cursor, request.args, role),
+                                                 stream=True)
 
     except sqlite3.Error as e:
         logger.error(f"Database error in services: {e}")
         flash('Database error. Please try again.')
         services = []
-        car_list = []
-    finally:
-        close_db_connection(conn)
+        pagination = {}
 
-    return render_template('services.html', services=services, cars=car_list, role=role)
+    return render_streamed('services.html', services=services, role=role, pagination=pagination)
 
 @app.route('/end_service/<int:service_id>', methods=['POST'])
 @login_required
 def end_service(service_id):
-    conn = get_db_connection()
-    if not conn:
-        flash('Database connection error. Please try again.')
-        return redirect(url_for('manage_services'))
-
     try:
-        cursor = conn.cursor()
-        
-        # Check if service exists and get current status
-        cursor.execute("SELECT status, type FROM services WHERE id = ?", (service_id,))
-        service = cursor.fetchone()
-        
+        service, completed = run_write(lambda conn: ServiceRepository(conn).transition(service_id, 'Completed'))
+
         if not service:
             flash('Service not found.')
         elif service['status'] == 'Completed':
             flash('Service is already completed.')
-        elif service['status'] == 'Cancelled':
+        elif not completed:
             flash('Cannot complete a cancelled service.')
         else:
-            cursor.execute("""
-                UPDATE services 
-                SET status = 'Completed', end_date = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP 
-                WHERE id = ?
-            """, (service_id,))
-            conn.commit()
             flash(f"Service '{service['type']}' completed successfully!")
             logger.info(f"Service {service_id} completed by user {session['username']}")
     except sqlite3.Error as e:
         logger.error(f"Database error ending service: {e}")
         flash('Error completing service. Please try again.')
-    finally:
-        close_db_connection(conn)
 
     return redirect(url_for('manage_services'))
 
 @app.route('/start_service/<int:service_id>', methods=['POST'])
 @login_required
 def start_service(service_id):
-    conn = get_db_connection()
-    if not conn:
-        flash('Database connection error. Please try again.')
-        return redirect(url_for('manage_services'))
-
     try:
-        cursor = conn.cursor()
-        
-        # Check if service exists and get current status
-        cursor.execute("SELECT status, type FROM services WHERE id = ?", (service_id,))
-        service = cursor.fetchone()
-        
+        service, started = run_write(lambda conn: ServiceRepository(conn).transition(service_id, 'In Progress'))
+
         if not service:
             flash('Service not found.')
-        elif service['status'] != 'Pending':
+        elif not started:
             flash(f"Service is already {service['status'].lower()}.")
         else:
-            cursor.execute("""
-                UPDATE services 
-                SET status = 'In Progress', updated_at = CURRENT_TIMESTAMP 
-                WHERE id = ?
-            """, (service_id,))
-            conn.commit()
             flash(f"Service '{service['type']}' started successfully!")
             logger.info(f"Service {service_id} started by user {session['username']}")
     except sqlite3.Error as e:
         logger.error(f"Database error starting service: {e}")
         flash('Error starting service. Please try again.')
-    finally:
-        close_db_connection(conn)
 
     return redirect(url_for('manage_services'))
 
 @app.route('/delete_service/<int:service_id>', methods=['POST'])
 @admin_required
 def delete_service(service_id):
-    conn = get_db_connection()
-    if not conn:
-        flash('Database connection error. Please try again.')
-        return redirect(url_for('manage_services'))
-
     try:
-        cursor = conn.cursor()
-        
-        # Check if service exists
-        cursor.execute("SELECT type FROM services WHERE id = ?", (service_id,))
-        service = cursor.fetchone()
-        
+        service = run_write(lambda conn: ServiceRepository(conn).pop(service_id))
+
         if not service:
             flash('Service not found.')
         else:
-            cursor.execute("DELETE FROM services WHERE id = ?", (service_id,))
-            conn.commit()
             flash(f"Service '{service['type']}' has been deleted successfully.")
             logger.info(f"Service {service_id} deleted by admin {session['username']}")
     except sqlite3.Error as e:
         logger.error(f"Database error deleting service: {e}")
         flash('Error deleting service. Please try again.')
-    finally:
-        close_db_connection(conn)
 
     return redirect(url_for('manage_services'))
 
+# Past tense of each bulk transition target, for messages
+BULK_STATUS_VERBS = {'In Progress': 'started', 'Completed': 'completed'}
+
+def bulk_transition(ids, status):
+    """Move the given services to ``status`` in one queued transaction; returns per-id outcomes
+
+    Each outcome is ``updated``, ``unchanged`` (already in ``status``),
+    ``not_allowed`` (the transition rules forbid it) or ``not_found``.
+    """
+    transitions = run_write(lambda conn: ServiceRepository(conn).transition_many(ids, status))
+    results = []
+    for service_id, (previous, moved) in transitions.items():
+        if moved:
+            outcome = 'updated'
+        elif previous is None:
+            outcome = 'not_found'
+        elif previous == status:
+            outcome = 'unchanged'
+        else:
+            outcome = 'not_allowed'
+        results.append({'id': service_id, 'outcome': outcome, 'previous_status': previous})
+    return results
+
+@app.route('/services/bulk_status', methods=['POST'])
+@login_required
+def bulk_service_status():
+    status = request.form.get('status', '')
+    service_ids = request.form.getlist('service_ids', type=int)
+    if status not in BULK_STATUS_VERBS:
+        flash('Please choose a valid bulk action.')
+    elif not service_ids:
+        flash('Please select at least one service.')
+    elif len(service_ids) > app.config['BULK_STATUS_MAX_IDS']:
+        flash(f"Please select at most {app.config['BULK_STATUS_MAX_IDS']} services at a time.")
+    else:
+        try:
+            results = bulk_transition(service_ids, status)
+            counts = {}
+            for result in results:
+                counts[result['outcome']] = counts.get(result['outcome'], 0) + 1
+            message = f"{counts.get('updated', 0)} service(s) {BULK_STATUS_VERBS[status]}."
+            skipped = [f"{counts[outcome]} {label}" for outcome, label in (
+                ('unchanged', f"already {status.lower()}"),
+                ('not_allowed', 'not allowed from their current status'),
+                ('not_found', 'not found'),
+            ) if counts.get(outcome)]
+            if skipped:
+                message += f" Skipped: {', '.join(skipped)}."
+            flash(message)
+            logger.info(f"{counts.get('updated', 0)} of {len(results)} services {BULK_STATUS_VERBS[status]} "
+                        f"by user {session['username']}")
+        except sqlite3.Error as e:
+            logger.error(f"Database error in bulk status update: {e}")
+            flash('Error updating services. Please try again.')
+
+    return redirect(url_for('manage_services'))
+
+
+REPORT_EXPORT_FIELDS = ['type', 'cost', 'status', 'start_date', 'end_date', 'created_at',
+                        'car_name', 'car_model', 'car_year', 'customer_name', 'customer_phone']
+
+def build_report_filters(args):
+    """Validate the report's status/date query parameters and return the ones given
+
+    Dates are inclusive YYYY-MM-DD bounds on the service creation date. Raises
+    ValueError with a user-facing message when a parameter is invalid.
+    """
+    filters = {name: args.get(name, '').strip() for name in ('status', 'date_from', 'date_to')}
+    if filters['status'] and filters['status'] not in SERVICE_STATUSES:
+        raise ValueError('Please select a valid status.')
+    for name in ('date_from', 'date_to'):
+        if filters[name]:
+            try:
+                datetime.strptime(filters[name], '%Y-%m-%d')
+            except ValueError:
+                raise ValueError('Please enter dates as YYYY-MM-DD.')
+    return {name: value for name, value in filters.items() if value}
 
 @app.route('/report')
 @admin_required
+@conditional_get('customers', 'cars', 'services', snapshot=True)
 def report():
-    conn = get_db_connection()
+    # Heavy report queries read the snapshot so they never hold up front-desk writes
+    conn, as_of = get_report_db()
     if not conn:
         flash('Database connection error. Please try again.')
-        return render_template('report.html', report=[], summary={})
+        return render_template('report.html', report=[], summary={}, filters={}, as_of=None,
+                               rollups=[], granularity='month', range_from=None, truncated=False)
 
     try:
-        cursor = conn.cursor()
-        
-        # Get detailed report data
-        cursor.execute("""
-            SELECT s.type, s.cost, s.status, s.start_date, s.end_date, s.created_at,
-                   c.name as car_name, c.model as car_model, c.year as car_year,
-                   cu.name as customer_name, cu.phone as customer_phone
-            FROM services s 
-            JOIN cars c ON s.car_id = c.id
-            JOIN customers cu ON c.customer_id = cu.id
-            ORDER BY s.created_at DESC
-        """)
-        report_data = cursor.fetchall()
-
-        # Get summary statistics
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_services,
-                SUM(CASE WHEN status = 'Completed' THEN 1 ELSE 0 END) as completed_services,
-                SUM(CASE WHEN status = 'Pending' THEN 1 ELSE 0 END) as pending_services,
-                SUM(CASE WHEN status = 'In Progress' THEN 1 ELSE 0 END) as in_progress_services,
-                SUM(CASE WHEN status = 'Cancelled' THEN 1 ELSE 0 END) as cancelled_services,
-                SUM(cost) as total_revenue,
-                AVG(cost) as avg_service_cost
-            FROM services
-        """)
-        summary = cursor.fetchone()
+        filters = build_report_filters(request.args)
+        granularity = parse_granularity(request.args)
+    except ValueError as e:
+        flash(str(e))
+        filters, granularity = {}, 'month'
+
+    range_from = None
+    try:
+        services = ServiceRepository(conn)
+
+        # Per-period totals over the same range, a few rows per period from the rollups
+        dated = 'date_from' in filters or 'date_to' in filters
+        limit = app.config['REPORT_ROLLUP_MAX_PERIODS'] if dated else app.config['REPORT_DEFAULT_PERIODS']
+        rollups, _, truncated = services.rollups(granularity, limit=limit, **filters)
+        # A dated range with more periods than fit is named on the page rather than cut off silently
+        truncated = dated and truncated
+        if not dated and rollups:
+            # Without a date range, cover the latest periods rather than every service ever recorded
+            range_from = rollups[0]['period']
+        shown = dict(filters, date_from=range_from) if range_from else filters
+
+        # KPIs for exactly the rows listed below
+        summary = services.rollup_summary(**shown)
+
+        # Get detailed report data; rows are read as the page renders
+        report_data = RowStream(services.report(**shown), 'report')
 
     except sqlite3.Error as e:
         logger.error(f"Database error in report: {e}")
         flash('Database error. Please try again.')
         report_data = []
         summary = {}
-    finally:
-        close_db_connection(conn)
+        rollups = []
+        truncated = False
+
+    return render_streamed('report.html', report=report_data, summary=summary, filters=filters, as_of=as_of,
+                           rollups=rollups, granularity=granularity, range_from=range_from, truncated=truncated)
+
+
+def stream_report_csv(cursor, chunk_rows):
+    """Yield the report as CSV text in chunks, followed by a totals row"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(REPORT_EXPORT_FIELDS)
+    count = 0
+    total_cost = 0.0
+
+    for row in cursor:
+        writer.writerow(row)
+        count += 1
+        total_cost += row['cost'] or 0
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    writer.writerow(['TOTAL', round(total_cost, 2), f'{count} services'])
+    yield buffer.getvalue()
+
+def stream_report_ndjson(cursor, chunk_rows):
+    """Yield the report as newline-delimited JSON, ending with a summary object"""
+    lines = []
+    count = 0
+    total_cost = 0.0
+
+    for row in cursor:
+        lines.append(json.dumps(dict(zip(REPORT_EXPORT_FIELDS, row))))
+        count += 1
+        total_cost += row['cost'] or 0
+        if len(lines) >= chunk_rows:
+            yield "\n".join(lines) + "\n"
+            lines = []
+
+    lines.append(json.dumps({'summary': {'total_services': count, 'total_revenue': round(total_cost, 2)}}))
+    yield "\n".join(lines) + "\n"
+
+REPORT_EXPORT_FORMATS = {
+    'csv': ('text/csv', stream_report_csv),
+    'ndjson': ('application/x-ndjson', stream_report_ndjson),
+}
+
+@app.route('/report/export')
+@admin_required
+def export_report():
+    """Stream the filtered report straight from the cursor as CSV or NDJSON"""
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in REPORT_EXPORT_FORMATS:
+        return jsonify({'error': 'Unsupported format. Use csv or ndjson.'}), 400
 
-    return render_template('report.html', report=report_data, summary=summary)
+    try:
+        filters = build_report_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
+    conn, as_of = get_report_db()
+    if not conn:
+        return jsonify({'error': 'Database connection error. Please try again.'}), 503
 
-def add_admin_user():
-    """Add admin user with improved error handling"""
+    try:
+        cursor = ServiceRepository(conn).report(**filters)
+    except sqlite3.Error as e:
+        logger.error(f"Database error in report export: {e}")
+        return jsonify({'error': 'Database error. Please try again.'}), 500
+
+    mimetype, generate = REPORT_EXPORT_FORMATS[export_format]
+    filename = f"report-{datetime.now().strftime('%Y%m%d')}.{export_format}"
+    logger.info(f"Report export ({export_format}) started by admin {session['username']}")
+    headers = {'Content-Disposition': f'attachment; filename={filename}'}
+    if as_of:
+        headers['X-Report-As-Of'] = as_of
+    # stream_with_context keeps the connection open until the last chunk
+    return Response(
+        stream_with_context(generate(cursor, app.config['EXPORT_CHUNK_ROWS'])),
+        mimetype=mimetype,
+        headers=headers,
+    )
+
+
+@app.cli.command('rebuild-summary')
+def rebuild_summary_command():
+    """Recompute the service summary counters and period rollups and report any summary drift"""
     conn = get_db_connection()
     if not conn:
-        logger.error("Failed to connect to database for admin user creation")
-        return False
+        raise click.ClickException("Failed to connect to database")
 
     try:
         cursor = conn.cursor()
-        username = "admin"
-        password = "2079" 
-        hashed_password = generate_password_hash(password)
-
-        # Check if created_at column exists
-        cursor.execute("PRAGMA table_info(users)")
-        columns = [row[1] for row in cursor.fetchall()]
-        
-        if 'created_at' in columns:
-            cursor.execute("""
-                INSERT INTO users (username, password, role, created_at) 
-                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-            """, (username, hashed_password, 'admin'))
-        else:
-            cursor.execute("""
-                INSERT INTO users (username, password, role) 
-                VALUES (?, ?, ?)
-            """, (username, hashed_password, 'admin'))
-            
+        services = ServiceRepository(conn)
+        before = services.summary()
+        rebuild_service_summary(cursor)
+        rebuild_service_rollups(cursor)
         conn.commit()
-        logger.info(f"Admin user '{username}' created successfully")
-        return True
-    except sqlite3.IntegrityError:
-        logger.info(f"Admin user '{username}' already exists")
-        return True
+        after = services.summary()
     except sqlite3.Error as e:
-        logger.error(f"Database error creating admin user: {e}")
-        return False
+        conn.rollback()
+        raise click.ClickException(f"Database error rebuilding summary: {e}")
     finally:
         close_db_connection(conn)
 
-def add_employee_user():
-    """Add employee user with improved error handling"""
+    drift = {key: (before[key], after[key]) for key in after if before[key] != after[key]}
+    for key, (old, new) in drift.items():
+        click.echo(f"{key}: {old} -> {new}")
+    click.echo("Summary counters were out of date and have been rebuilt." if drift else "Summary counters verified: no drift.")
+
+
+@app.route('/import', methods=['POST'])
+@admin_required
+def bulk_import():
+    """Import customers, cars and services from an uploaded CSV or JSON file"""
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'Please upload a .csv or .json file.'}), 400
+
+    try:
+        sections = parse_upload(upload.read(), upload.filename, request.form.get('kind'))
+    except ImportFormatError as e:
+        return jsonify({'error': str(e)}), 400
+
+    conn = get_db()
+    if not conn:
+        return jsonify({'error': 'Database connection error. Please try again.'}), 503
+
+    try:
+        results = BulkImporter(conn, chunk_size=app.config['IMPORT_CHUNK_SIZE'], write=run_write).run(sections)
+    except sqlite3.Error as e:
+        logger.error(f"Database error during bulk import: {e}")
+        return jsonify({'error': 'Database error. Please try again.'}), 500
+
+    logger.info(f"Bulk import from {upload.filename} by admin {session['username']}")
+    return jsonify(results)
+
+@app.cli.command('import-data')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--kind', type=click.Choice(IMPORT_KINDS), help='Entity type for CSV files or JSON lists.')
+def import_data_command(path, kind):
+    """Bulk import customers, cars and services from a CSV or JSON file"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        sections = parse_upload(data, path, kind)
+    except ImportFormatError as e:
+        raise click.ClickException(str(e))
+
     conn = get_db_connection()
     if not conn:
-        logger.error("Failed to connect to database for employee user creation")
-        return False
+        raise click.ClickException("Failed to connect to database")
+    try:
+        results = BulkImporter(conn, chunk_size=app.config['IMPORT_CHUNK_SIZE'], write=run_write).run(sections)
+    except sqlite3.Error as e:
+        raise click.ClickException(f"Database error during import: {e}")
+    finally:
+        close_db_connection(conn)
 
+    for section, result in results.items():
+        click.echo(f"{section}: {result['inserted']} inserted, {len(result['errors'])} rejected")
+        for error in result['errors']:
+            click.echo(f"  row {error['row']}: {error['error']}")
+
+
+# JSON API (v1), authenticated with JWT access tokens
+
+API_FIELDS = {
+    'customers': ['id', 'name', 'phone', 'email', 'address', 'created_at', 'updated_at'],
+    'cars': ['id', 'name', 'model', 'year', 'engine_type', 'license_plate', 'vin',
+             'created_at', 'updated_at', 'customer_name', 'customer_phone'],
+    'services': ['id', 'type', 'cost', 'status', 'description', 'start_date', 'end_date',
+                 'created_at', 'updated_at', 'car_name', 'car_model', 'customer_name', 'customer_phone'],
+}
+
+def api_error(message, status):
+    """Return a JSON error response"""
+    return jsonify({'error': message}), status
+
+def api_admin_required(f):
+    """Decorator to require a JWT access token with the admin role"""
+    @wraps(f)
+    @jwt_required()
+    def decorated_function(*args, **kwargs):
+        if get_jwt().get('role') != 'admin':
+            return api_error('Administrator privileges required.', 403)
+        return f(*args, **kwargs)
+    return decorated_function
+
+def issue_tokens(user):
+    """Create access and refresh tokens carrying the user's role"""
+    claims = {'role': user['role'], 'user_id': user['id']}
+    return {
+        'access_token': create_access_token(identity=user['username'], additional_claims=claims),
+        'refresh_token': create_refresh_token(identity=user['username'], additional_claims=claims),
+    }
+
+def api_list(resource, base_query, where_conditions, params, table_alias='', sort_key=None, descending=True):
+    """Return one keyset page of ``resource`` as JSON, limited to the requested fields"""
+    allowed = API_FIELDS[resource]
+    requested = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        return api_error(f"Unknown fields: {', '.join(unknown)}", 400)
+    fields = requested or allowed
+
+    conn = get_db()
+    if not conn:
+        return api_error('Database connection error. Please try again.', 503)
     try:
-        cursor = conn.cursor()
-        username = "sa05_e60"
-        password = "saif2079"
-        hashed_password = generate_password_hash(password)
+        rows, pagination = fetch_keyset_page(conn.cursor(), base_query, where_conditions, params,
+                                             table_alias, sort_key, descending)
+    except sqlite3.Error as e:
+        logger.error(f"Database error in API {resource} list: {e}")
+        return api_error('Database error. Please try again.', 500)
+
+    return jsonify({
+        'data': [{field: row[field] for field in fields} for row in rows],
+        'next': pagination['next_url'],
+        'prev': pagination['prev_url'],
+        'per_page': pagination['per_page'],
+    })
+
+@app.route('/api/v1/auth/login', methods=['POST'])
+def api_login():
+    """Exchange a username and password for access and refresh tokens"""
+    payload = request.get_json(silent=True) or {}
+    username = str(payload.get('username', '')).strip()
+    password = str(payload.get('password', ''))
+    if not username or not password:
+        return api_error('Please provide both username and password.', 400)
+
+    retry_after = login_retry_after(username)
+    if retry_after:
+        logger.warning(f"Rate limited API login attempt for username: {username} from {request.remote_addr}")
+        record_audit_event('login_throttled', username, 'api')
+        response, status = api_error('Too many login attempts.', 429)
+        response.headers['Retry-After'] = str(retry_after)
+        return response, status
+
+    conn = get_db()
+    if not conn:
+        return api_error('System error. Please try again later.', 503)
+    try:
+        user = authenticate_user(conn, username, password)
+        if not user:
+            logger.warning(f"Failed API login attempt for username: {username}")
+            record_audit_event('login_failed', username, 'api')
+            return api_error('Invalid username or password.', 401)
+        refund_login_attempt(username)
+        record_last_login(user['id'])
+        record_audit_event('login', username, 'api')
+    except HashingBusy as e:
+        # The password was never checked, so the attempt does not count against the limits
+        refund_login_attempt(username)
+        logger.warning(f"API login for {username} rejected, password hashing saturated: {e}")
+        response, status = api_error('The system is busy. Please try again in a moment.', 503)
+        response.headers['Retry-After'] = '1'
+        return response, status
+    except sqlite3.Error as e:
+        logger.error(f"Database error during API login: {e}")
+        return api_error('System error. Please try again later.', 500)
 
-        # Check if created_at column exists
-        cursor.execute("PRAGMA table_info(users)")
-        columns = [row[1] for row in cursor.fetchall()]
-        
-        if 'created_at' in columns:
-            cursor.execute("""
-                INSERT INTO users (username, password, role, created_at) 
-                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-            """, (username, hashed_password, 'user'))
-        else:
-            cursor.execute("""
-                INSERT INTO users (username, password, role) 
-                VALUES (?, ?, ?)
-            """, (username, hashed_password, 'user'))
-            
-        conn.commit()
-        logger.info(f"Employee user '{username}' created successfully")
+    logger.info(f"User {username} logged in via API")
+    return jsonify(issue_tokens(user))
+
+@app.route('/api/v1/auth/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def api_refresh():
+    """Issue a new access token, re-reading the role in case it changed"""
+    conn = get_db()
+    if not conn:
+        return api_error('System error. Please try again later.', 503)
+    try:
+        user = UserRepository(conn).get_by_username(get_jwt_identity())
+    except sqlite3.Error as e:
+        logger.error(f"Database error during API token refresh: {e}")
+        return api_error('Database error. Please try again.', 500)
+    if not user:
+        return api_error('User no longer exists.', 401)
+    claims = {'role': user['role'], 'user_id': user['id']}
+    return jsonify({'access_token': create_access_token(identity=user['username'], additional_claims=claims)})
+
+@app.route('/api/v1/customers')
+@jwt_required()
+def api_customers():
+    return api_list('customers', CustomerRepository.list_query, [], [])
+
+@app.route('/api/v1/cars')
+@jwt_required()
+def api_cars():
+    return api_list('cars', CarRepository.list_query, [], [], table_alias='c')
+
+@app.route('/api/v1/services')
+@jwt_required()
+def api_services():
+    conn = get_db()
+    if not conn:
+        return api_error('Database connection error. Please try again.', 503)
+    return api_list('services', *build_services_query(conn.cursor(), request.args, get_jwt().get('role')))
+
+@app.route('/api/v1/services/status', methods=['POST'])
+@jwt_required()
+def api_bulk_service_status():
+    """Move a list of services to a new status in one transaction, reporting the outcome per id"""
+    body = request.get_json(silent=True) or {}
+    status = body.get('status')
+    ids = body.get('ids')
+    if status not in BULK_STATUS_VERBS:
+        return api_error(f"status must be one of: {', '.join(BULK_STATUS_VERBS)}", 400)
+    if not isinstance(ids, list) or not ids or not all(type(i) is int for i in ids):
+        return api_error('ids must be a non-empty list of service ids', 400)
+    if len(ids) > app.config['BULK_STATUS_MAX_IDS']:
+        return api_error(f"At most {app.config['BULK_STATUS_MAX_IDS']} ids per request", 400)
+    try:
+        results = bulk_transition(ids, status)
+    except sqlite3.Error as e:
+        logger.error(f"Database error in API bulk status update: {e}")
+        return api_error('Database error. Please try again.', 500)
+    updated = sum(1 for result in results if result['outcome'] == 'updated')
+    logger.info(f"{updated} of {len(results)} services {BULK_STATUS_VERBS[status]} via API by {get_jwt_identity()}")
+    return jsonify({'status': status, 'updated': updated, 'results': results})
+
+@app.route('/api/v1/report/summary')
+@api_admin_required
+def api_report_summary():
+    conn = get_db()
+    if not conn:
+        return api_error('Database connection error. Please try again.', 503)
+    try:
+        return jsonify(ServiceRepository(conn).summary())
+    except sqlite3.Error as e:
+        logger.error(f"Database error in API report summary: {e}")
+        return api_error('Database error. Please try again.', 500)
+
+@app.route('/api/v1/report/rollups')
+@api_admin_required
+def api_report_rollups():
+    """Per-period counts and revenue, with their status and type breakdown, from the reporting snapshot"""
+    try:
+        filters = build_report_filters(request.args)
+        granularity = parse_granularity(request.args)
+    except ValueError as e:
+        return api_error(str(e), 400)
+
+    conn, as_of = get_report_db()
+    if not conn:
+        return api_error('Database connection error. Please try again.', 503)
+    try:
+        periods, breakdown, truncated = ServiceRepository(conn).rollups(
+            granularity, breakdown=True, limit=app.config['REPORT_ROLLUP_MAX_PERIODS'], **filters)
+    except sqlite3.Error as e:
+        logger.error(f"Database error in API report rollups: {e}")
+        return api_error('Database error. Please try again.', 500)
+    return jsonify({
+        'granularity': granularity,
+        'as_of': as_of,
+        'periods': [dict(row) for row in periods],
+        'breakdown': [dict(row) for row in breakdown],
+        'truncated': truncated,
+    })
+
+
+@app.route('/lookup/<kind>')
+@login_required
+def lookup(kind):
+    """Typeahead matches for the customer and car pickers as a small JSON page"""
+    if kind not in LOOKUP_QUERIES:
+        return jsonify({'error': 'Unknown lookup'}), 404
+    term = request.args.get('q', '').strip()[:100]
+    limit = request.args.get('limit', app.config['LOOKUP_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['MAX_LOOKUP_PAGE_SIZE']))
+
+    conn = get_db()
+    if not conn:
+        return jsonify({'error': 'Database connection error'}), 503
+    try:
+        rows = get_lookup(conn, kind, term, limit)
+    except sqlite3.Error as e:
+        logger.error(f"Database error in {kind} lookup: {e}")
+        return jsonify({'error': 'Database error'}), 500
+    return jsonify({'data': list(rows)})
+
+# Columns of the shop-floor status board, in display order
+STATUS_BOARD_STATUSES = ('In Progress', 'Pending')
+
+def get_board_version(conn):
+    """A single number that grows whenever customers, cars or services change"""
+    return sum(version for version, _ in TableVersionRepository(conn).versions(VERSIONED_TABLES).values())
+
+def get_status_board(conn, limit):
+    """The newest active services per status plus the summary counters, tagged with the board version"""
+    # Read the version first so a concurrent write can only make the data newer than its tag
+    version = get_board_version(conn)
+    services = ServiceRepository(conn)
+    return {
+        'version': version,
+        'summary': ServiceRepository(conn).summary(),
+        'services': {status: [dict(row) for row in services.by_status(status, limit)]
+                     for status in STATUS_BOARD_STATUSES},
+    }
+
+@app.route('/status_board')
+@login_required
+def status_board():
+    """Active services for shop-floor displays; under asgi.py, ?since=<version> long-polls for changes"""
+    conn = get_db()
+    if not conn:
+        return jsonify({'error': 'Database connection error'}), 503
+    try:
+        board = get_status_board(conn, app.config['STATUS_BOARD_LIMIT'])
+    except sqlite3.Error as e:
+        logger.error(f"Database error reading status board: {e}")
+        return jsonify({'error': 'Database error'}), 500
+    response = jsonify(board)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def get_table_row_counts(conn):
+    """Rows in customers, cars and services without scanning them on every scrape
+
+    The services count comes from the trigger-maintained summary; the other
+    tables are counted again only when their version has moved.
+    """
+    versions = TableVersionRepository(conn).versions(VERSIONED_TABLES)
+    counts = {'services': ServiceRepository(conn).count()}
+    repositories = {'customers': CustomerRepository, 'cars': CarRepository}
+    for table in VERSIONED_TABLES:
+        if table in counts:
+            continue
+        key = (app.config['DATABASE'], table)
+        cached = _row_counts.get(key)
+        if cached is None or cached[0] != versions.get(table):
+            cached = (versions.get(table), repositories[table](conn).count())
+            _row_counts[key] = cached
+        counts[table] = cached[1]
+    return counts
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text metrics, merged across worker processes when METRICS_DIR is set"""
+    token = app.config['METRICS_TOKEN']
+    if not token and app.config['METRICS_REQUIRE_TOKEN']:
+        return Response('Metrics are disabled until METRICS_TOKEN is set\n', status=403, mimetype='text/plain')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+
+    database = app.config['DATABASE']
+    gauges = []
+    for file, path in (('db', database), ('wal', database + '-wal')):
+        try:
+            gauges.append(('workshop_db_file_size_bytes', {'file': file}, os.path.getsize(path)))
+        except OSError:
+            gauges.append(('workshop_db_file_size_bytes', {'file': file}, 0))
+
+    conn = get_db()
+    if conn:
+        try:
+            for table, count in get_table_row_counts(conn).items():
+                gauges.append(('workshop_table_rows', {'table': table}, count))
+        except sqlite3.Error as e:
+            logger.error(f"Database error collecting metrics: {e}")
+
+    body = metrics.render(metrics_registry.collect(), gauges)
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/db_stats')
+@admin_required
+def db_stats():
+    """Connection pool, lookup cache, password hashing, write-behind, commit queue, report snapshot, login rate limit and query-count counters"""
+    stats = get_pool().stats()
+    stats['lookup_cache'] = lookup_cache.stats()
+    stats['password_hashing'] = password_hasher.stats()
+    stats['write_behind'] = write_queue.stats()
+    stats['commit_queue'] = get_commit_queue().stats()
+    snapshot = get_report_snapshot()
+    stats['report_snapshot'] = snapshot.stats() if snapshot is not None else None
+    stats['routes_over_query_limit'] = dict(instrumentation.flagged_routes)
+    stats['login_rate_limit'] = {'username': login_user_limiter.stats(), 'ip': login_ip_limiter.stats()}
+    return jsonify(stats)
+
+
+def seed_user(username, password, role, label):
+    """Create a default user unless it already exists"""
+    conn = get_db_connection()
+    if not conn:
+        logger.error(f"Failed to connect to database for {label.lower()} user creation")
+        return False
+
+    try:
+        users_repo = UserRepository(conn)
+        # Skip the deliberately slow hash when the user is already seeded
+        if users_repo.exists(username):
+            logger.info(f"{label} user '{username}' already exists")
+            return True
+        password_hash = password_hasher.hash(password)
+        run_write(lambda conn: UserRepository(conn).insert(username=username, password=password_hash, role=role))
+        logger.info(f"{label} user '{username}' created successfully")
         return True
     except sqlite3.IntegrityError:
-        logger.info(f"Employee user '{username}' already exists")
+        logger.info(f"{label} user '{username}' already exists")
         return True
     except sqlite3.Error as e:
-        logger.error(f"Database error creating employee user: {e}")
+        logger.error(f"Database error creating {label.lower()} user: {e}")
         return False
     finally:
         close_db_connection(conn)
 
+def add_admin_user():
+    """Add admin user with improved error handling"""
+    return seed_user("admin", "2079", 'admin', 'Admin')
 
+def add_employee_user():
+    """Add employee user with improved error handling"""
+    return seed_user("sa05_e60", "saif2079", 'user', 'Employee')
 
 
 if __name__ == '__main__':
@@ -868,6 +1610,9 @@ if __name__ == '__main__':
     
     if not add_employee_user():
         logger.error("Failed to create employee user.")
+
+    # Start copying the reporting snapshot before the first report asks for it
+    get_report_snapshot()
     
     # Get configuration from environment variables
     host = os.environ.get('FLASK_HOST', '0.0.0.0')
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import sqlite3
+import logging
+import importlib.util
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+from itsdangerous import BadSignature
+from jwt import PyJWTError
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from app import app, get_db_connection, get_commit_queue, get_board_version, get_status_board
+from db_executor import DatabaseExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class BoardWatcher:
+    """Shares one version poll per interval among every client waiting in this process
+
+    However many status boards are long-polling, the database sees a single
+    small read per ``interval`` and no thread is held while clients wait.
+    """
+
+    def __init__(self, executor, interval):
+        self.executor = executor
+        self.interval = interval
+        self.version = None
+        self._waiters = 0
+        self._changed = None
+        self._task = None
+
+    async def wait(self, since, timeout):
+        """Return once the board version passes ``since`` or ``timeout`` seconds elapse"""
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        self._waiters += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll())
+        try:
+            async with self._changed:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: self.version is not None and self.version > since), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._waiters -= 1
+
+    async def _poll(self):
+        while self._waiters:
+            try:
+                version = await self.executor.aread(get_board_version)
+            except sqlite3.Error as e:
+                logger.error(f"Error polling status board version: {e}")
+            else:
+                if version != self.version:
+                    self.version = version
+                    async with self._changed:
+                        self._changed.notify_all()
+            await asyncio.sleep(self.interval)
+
+
+class WorkshopASGI:
+    """ASGI entry point: long-polled status boards natively, everything else through the Flask app
+
+    ``GET /status_board`` is answered on the event loop, with its database
+    reads on the executor's reader threads, so idle long-polls cost no
+    threads. Other requests go to the Flask views through asgiref's WSGI
+    adapter, or ``wsgi`` when given.
+    """
+
+    def __init__(self, flask_app, executor, wsgi=None):
+        self.flask_app = flask_app
+        self.executor = executor
+        self.watcher = BoardWatcher(executor, flask_app.config['STATUS_BOARD_POLL_INTERVAL'])
+        self._wsgi = wsgi
+        if wsgi is None and importlib.util.find_spec('asgiref') is None:
+            logger.warning("asgiref is not installed; only /status_board can be served over ASGI")
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http' and scope['path'] == '/status_board' and scope['method'] == 'GET':
+            return await self._status_board(scope, send)
+        return await self._wsgi_app()(scope, receive, send)
+
+    def _wsgi_app(self):
+        if self._wsgi is None:
+            try:
+                from asgiref.wsgi import WsgiToAsgi
+            except ImportError:
+                raise RuntimeError("Serving the Flask views over ASGI requires asgiref (pip install asgiref)")
+            self._wsgi = WsgiToAsgi(self.flask_app)
+        return self._wsgi
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.to_thread(self.executor.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _authenticated(self, scope):
+        """Accept the Flask session cookie of a logged-in user or a JWT access token"""
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        authorization = headers.get('authorization', '')
+        if authorization.startswith('Bearer '):
+            try:
+                with self.flask_app.app_context():
+                    return decode_token(authorization[len('Bearer '):])['type'] == 'access'
+            except (PyJWTError, JWTExtendedException):
+                return False
+
+        cookie = SimpleCookie(headers.get('cookie', '')).get(self.flask_app.config['SESSION_COOKIE_NAME'])
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        if cookie is None or serializer is None:
+            return False
+        try:
+            max_age = int(self.flask_app.permanent_session_lifetime.total_seconds())
+            return 'username' in serializer.loads(cookie.value, max_age=max_age)
+        except BadSignature:
+            return False
+
+    async def _status_board(self, scope, send):
+        if not self._authenticated(scope):
+            return await _send_json(send, 401, {'error': 'Authentication required'})
+
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        since = query.get('since', [None])[0]
+        if since is not None and not since.isdigit():
+            return await _send_json(send, 400, {'error': 'since must be a board version'})
+
+        config = self.flask_app.config
+        try:
+            board = await self.executor.aread(get_status_board, config['STATUS_BOARD_LIMIT'])
+            if since is not None and board['version'] == int(since):
+                await self.watcher.wait(int(since), config['STATUS_BOARD_TIMEOUT'])
+                board = await self.executor.aread(get_status_board, config['STATUS_BOARD_LIMIT'])
+        except sqlite3.Error as e:
+            logger.error(f"Database error reading status board: {e}")
+            return await _send_json(send, 500, {'error': 'Database error'})
+        await _send_json(send, 200, board)
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'cache-control', b'no-store'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+# e.g. `uvicorn asgi:application`; threads start on first use
+application = WorkshopASGI(app, DatabaseExecutor(get_db_connection, readers=app.config['DB_READER_THREADS'],
+                                                 commit_queue=get_commit_queue()))
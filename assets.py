@@ -0,0 +1,197 @@
+import os
+import gzip
+import json
+import hashlib
+import logging
+from io import BytesIO
+import mimetypes
+import click
+from markupsafe import Markup
+from flask import request, send_from_directory, url_for
+
+logger = logging.getLogger(__name__)
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Background widths generated for small, medium and full-size viewports
+IMAGE_WIDTHS = (640, 1280)
+WEBP_QUALITY = 80
+AVIF_QUALITY = 50
+JPEG_QUALITY = 82
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def _hashed_name(path, data):
+    """Insert a short content hash before the extension, e.g. garage.3f2a1b9c.png"""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+def _write(root, relative_path, data):
+    target = os.path.join(root, relative_path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as f:
+        f.write(data)
+    return target
+
+def _encode_image(image, fmt, **options):
+    buffer = BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+def _precompress(root, relative_path, data):
+    """Write .gz (and .br when brotli is installed) siblings for text assets"""
+    _write(root, relative_path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    try:
+        import brotli
+    except ImportError:
+        return
+    _write(root, relative_path + '.br', brotli.compress(data, quality=11))
+
+def build_assets(static_folder):
+    """Generate fingerprinted, resized and precompressed assets plus a manifest
+
+    Background PNGs get a recompressed full-size PNG, and at each responsive
+    width a progressive JPEG fallback plus WebP (and AVIF when the installed
+    Pillow supports it). Scripts and
+    stylesheets get a hashed copy with gzip/brotli siblings. Requires Pillow.
+    """
+    try:
+        from PIL import Image, features
+    except ImportError:
+        raise click.ClickException("Building assets requires Pillow: pip install Pillow")
+
+    dist_root = os.path.join(static_folder, DIST_DIR)
+    manifest = {}
+    formats = [('webp', 'WEBP', {'quality': WEBP_QUALITY, 'method': 6}),
+               ('jpeg', 'JPEG', {'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True})]
+    if features.check('avif'):
+        formats.insert(0, ('avif', 'AVIF', {'quality': AVIF_QUALITY}))
+
+    for name in sorted(os.listdir(static_folder)):
+        source = os.path.join(static_folder, name)
+        if not os.path.isfile(source) or not name.lower().endswith('.png'):
+            continue
+        with Image.open(source) as original:
+            image = original.convert('RGB')
+        stem = os.path.splitext(name)[0]
+
+        png = _encode_image(image, 'PNG', optimize=True)
+        entry = {'file': f"{DIST_DIR}/{_hashed_name(name, png)}", 'variants': []}
+        _write(static_folder, entry['file'], png)
+
+        widths = [w for w in IMAGE_WIDTHS if w < image.width] + [image.width]
+        for width in widths:
+            height = round(image.height * width / image.width)
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            variant = {'width': width}
+            for key, fmt, options in formats:
+                data = _encode_image(resized, fmt, **options)
+                extension = 'jpg' if key == 'jpeg' else key
+                variant[key] = f"{DIST_DIR}/{_hashed_name(f'{stem}-{width}.{extension}', data)}"
+                _write(static_folder, variant[key], data)
+            entry['variants'].append(variant)
+        manifest[name] = entry
+        logger.info(f"Built {len(entry['variants'])} responsive variants of {name}")
+
+    for directory, _, files in os.walk(static_folder):
+        if os.path.abspath(directory).startswith(os.path.abspath(dist_root)):
+            continue
+        for name in sorted(files):
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            relative = os.path.relpath(os.path.join(directory, name), static_folder).replace(os.sep, '/')
+            with open(os.path.join(static_folder, relative), 'rb') as f:
+                data = f.read()
+            hashed = f"{DIST_DIR}/{_hashed_name(relative, data)}"
+            _write(static_folder, hashed, data)
+            _precompress(static_folder, hashed, data)
+            manifest[relative] = {'file': hashed}
+
+    _write(static_folder, f"{DIST_DIR}/{MANIFEST_NAME}", json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+def load_manifest(static_folder):
+    """Read the asset manifest, or return an empty one if assets were never built"""
+    path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def init_app(app):
+    """Resolve static URLs through the manifest and serve built assets with long-lived caching"""
+    app.extensions['asset_manifest'] = load_manifest(app.static_folder)
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static':
+            entry = app.extensions['asset_manifest'].get(values.get('filename'))
+            if entry:
+                values['filename'] = entry['file']
+
+    def responsive_background(selector, filename):
+        """CSS rules serving the smallest background that fits the viewport
+
+        Each width lists its modern formats in ``image-set`` after a plain
+        ``url()`` of the same width's JPEG, which browsers without
+        ``image-set`` keep.
+        """
+        entry = app.extensions['asset_manifest'].get(filename)
+        original = url_for('static', filename=filename)
+        if not entry:
+            return Markup(f'{selector} {{ background-image: url("{original}"); }}')
+        rules = []
+        variants = sorted(entry['variants'], key=lambda v: v['width'], reverse=True)
+        for index, variant in enumerate(variants):
+            candidates = [
+                f'url("{url_for("static", filename=variant[key])}") type("image/{key}")'
+                for key in ('avif', 'webp', 'jpeg') if key in variant
+            ]
+            # Manifests built before the JPEG fallbacks only have the full-size PNG
+            fallback = url_for('static', filename=variant['jpeg']) if 'jpeg' in variant else original
+            if 'jpeg' not in variant:
+                candidates.append(f'url("{original}") type("image/png")')
+            rule = (f'{selector} {{ background-image: url("{fallback}"); '
+                    f'background-image: image-set({", ".join(candidates)}); }}')
+            if index > 0:
+                rule = f'@media (max-width: {variant["width"]}px) {{ {rule} }}'
+            rules.append(rule)
+        return Markup('\n'.join(rules))
+
+    app.jinja_env.globals['responsive_background'] = responsive_background
+
+    serve_static = app.view_functions['static']
+
+    def static_with_precompression(filename):
+        """Serve a .br/.gz sibling of a built asset when the client accepts it"""
+        if filename.startswith(f"{DIST_DIR}/"):
+            for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+                if encoding in request.accept_encodings and \
+                        os.path.isfile(os.path.join(app.static_folder, filename + suffix)):
+                    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                    response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype)
+                    response.headers['Content-Encoding'] = encoding
+                    response.vary.add('Accept-Encoding')
+                    return response
+        return serve_static(filename=filename)
+
+    app.view_functions['static'] = static_with_precompression
+
+    @app.after_request
+    def cache_fingerprinted_assets(response):
+        if request.endpoint == 'static' and (request.view_args or {}).get('filename', '').startswith(f"{DIST_DIR}/"):
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+            if (request.view_args or {}).get('filename', '').endswith(COMPRESSIBLE_EXTENSIONS):
+                response.vary.add('Accept-Encoding')
+        return response
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Generate resized JPEG/WebP backgrounds, hashed filenames and precompressed scripts and stylesheets"""
+        manifest = build_assets(app.static_folder)
+        app.extensions['asset_manifest'] = manifest
+        click.echo(f"Built {len(manifest)} assets into {os.path.join(app.static_folder, DIST_DIR)}")
@@ -0,0 +1,145 @@
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from werkzeug.security import generate_password_hash, check_password_hash
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusy(RuntimeError):
+    """Raised when the password hashing executor is saturated"""
+
+
+class PasswordHasher:
+    """Runs password hashing on a small dedicated thread pool
+
+    Hashing is deliberately slow, so a burst of logins could otherwise occupy
+    every CPU and starve ordinary page requests. At most ``max_workers``
+    hashes run at once and at most ``max_pending`` more may wait; callers
+    beyond that fail fast with ``HashingBusy``.
+    """
+
+    def __init__(self, max_workers=2, max_pending=16, timeout=10.0):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._lock = threading.Lock()
+        self._operations = 0
+        self._rejected = 0
+        self._hash_seconds = 0.0
+        self._max_hash_seconds = 0.0
+        self._queue_seconds = 0.0
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise HashingBusy("Too many concurrent password checks")
+        submitted = time.monotonic()
+
+        def timed():
+            started = time.monotonic()
+            try:
+                return func(*args)
+            finally:
+                finished = time.monotonic()
+                with self._lock:
+                    self._operations += 1
+                    self._queue_seconds += started - submitted
+                    self._hash_seconds += finished - started
+                    self._max_hash_seconds = max(self._max_hash_seconds, finished - started)
+
+        try:
+            future = self._executor.submit(timed)
+            future.add_done_callback(lambda _: self._slots.release())
+        except RuntimeError:
+            self._slots.release()
+            raise
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HashingBusy(f"Password check did not finish within {self.timeout}s")
+
+    def verify(self, password_hash, password):
+        """Check ``password`` against ``password_hash`` off the request thread"""
+        return self._run(check_password_hash, password_hash, password)
+
+    def hash(self, password):
+        """Hash ``password`` off the request thread"""
+        return self._run(generate_password_hash, password)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        """Return a snapshot of hashing counters and timings"""
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'operations': self._operations,
+                'rejected': self._rejected,
+                'hash_seconds_total': round(self._hash_seconds, 6),
+                'hash_seconds_max': round(self._max_hash_seconds, 6),
+                'hash_seconds_avg': round(self._hash_seconds / self._operations, 6) if self._operations else None,
+                'queue_seconds_total': round(self._queue_seconds, 6),
+            }
+
+
+class TokenBucketLimiter:
+    """In-memory token buckets keyed by arbitrary strings
+
+    Each key may spend up to ``capacity`` tokens in a burst, refilled at
+    ``refill_per_second``. At most ``max_keys`` buckets are tracked; the least
+    recently used are forgotten first, which only ever errs towards allowing.
+    """
+
+    def __init__(self, capacity, refill_per_second, max_keys=10000):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._allowed = 0
+        self._limited = 0
+
+    def consume(self, key, tokens=1):
+        """Take ``tokens`` from ``key``'s bucket; return seconds to wait, or 0 if allowed"""
+        now = time.monotonic()
+        with self._lock:
+            level, updated = self._buckets.pop(key, (self.capacity, now))
+            level = min(self.capacity, level + (now - updated) * self.refill_per_second)
+            if level >= tokens:
+                level -= tokens
+                retry_after = 0
+                self._allowed += 1
+            else:
+                retry_after = (tokens - level) / self.refill_per_second
+                self._limited += 1
+            self._buckets[key] = (level, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+    def refund(self, key, tokens=1):
+        """Give back ``tokens`` taken by ``consume``, never beyond ``capacity``"""
+        with self._lock:
+            if key in self._buckets:
+                level, updated = self._buckets[key]
+                self._buckets[key] = (min(self.capacity, level + tokens), updated)
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tracked_keys': len(self._buckets),
+                'allowed': self._allowed,
+                'limited': self._limited,
+            }
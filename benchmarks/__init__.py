@@ -0,0 +1,4 @@
+"""Load-testing benchmarks for the workshop app
+
+Run ``python -m benchmarks --help`` from the repository root.
+"""
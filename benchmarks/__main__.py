@@ -0,0 +1,115 @@
+import os
+import json
+import logging
+import tempfile
+import click
+from app import app, init_db, get_db_connection, close_pool, write_queue, issue_tokens
+from benchmarks.datagen import generate
+from benchmarks.runner import DEFAULT_ROUTES, run_benchmarks, environment
+
+logger = logging.getLogger('benchmarks')
+
+
+def _seed_values(conn):
+    """Concrete values for the route templates, taken from the seeded data"""
+    row = conn.execute("SELECT name FROM customers ORDER BY id LIMIT 1").fetchone()
+    customer = row['name'] if row else ''
+    return {'customer': customer, 'term': customer[:3]}
+
+def _compare(baseline, results):
+    """Print p50/p95/p99 changes against a previous results file"""
+    click.echo(f"{'route':<22}{'p50 ms':>18}{'p95 ms':>18}{'p99 ms':>18}{'req/s':>18}")
+    for name, result in results.items():
+        before = baseline.get('routes', {}).get(name)
+        if not before:
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps'):
+            old, new = before.get(key), result.get(key)
+            change = f"{(new - old) / old * 100:+.0f}%" if old else 'n/a'
+            cells.append(f"{old}->{new} ({change})")
+        click.echo(f"{name:<22}" + ''.join(f"{cell:>18}" for cell in cells))
+
+
+@click.command()
+@click.option('--customers', default=1000, show_default=True, help='Customers to generate')
+@click.option('--cars-per-customer', default=2.0, show_default=True, help='Mean cars per customer')
+@click.option('--services', default=10000, show_default=True, help='Services to generate')
+@click.option('--days', default=365, show_default=True, help='Days of history the services span')
+@click.option('--seed', default=42, show_default=True, help='Random seed for the generator')
+@click.option('--database', type=click.Path(dir_okay=False), help='Database file (default: a temporary file)')
+@click.option('--reuse/--no-reuse', default=False, help='Benchmark an existing --database without reseeding')
+@click.option('--clients', default=4, show_default=True, help='Concurrent clients per route')
+@click.option('--requests', 'requests_per_route', default=200, show_default=True, help='Requests per route')
+@click.option('--warmup', default=5, show_default=True, help='Untimed requests per route first')
+@click.option('--routes', help='Comma-separated route names to run (default: all)')
+@click.option('--role', type=click.Choice(['admin', 'user']), default='admin', show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), default='benchmark-results.json', show_default=True)
+@click.option('--baseline', type=click.File(), help='Earlier results file to compare against')
+def main(customers, cars_per_customer, services, days, seed, database, reuse, clients, requests_per_route,
+         warmup, routes, role, output, baseline):
+    """Seed a synthetic workshop and measure latency, throughput and memory per route"""
+    logging.basicConfig(level=logging.INFO)
+    # Per-request app logging would dominate the output and the timings
+    logging.getLogger('app').setLevel(logging.WARNING)
+    temporary = database is None
+    if temporary:
+        fd, database = tempfile.mkstemp(suffix='.db', prefix='workshop-bench-')
+        os.close(fd)
+        os.unlink(database)
+    elif not reuse and os.path.exists(database):
+        raise click.ClickException(f"{database} exists; pass --reuse to benchmark it as is")
+
+    app.config['DATABASE'] = database
+    app.config['TESTING'] = True
+    selected = DEFAULT_ROUTES
+    if routes:
+        wanted = set(routes.split(','))
+        selected = [route for route in DEFAULT_ROUTES if route[0] in wanted]
+        if not selected:
+            raise click.ClickException(f"No routes match {routes}")
+
+    try:
+        with app.app_context():
+            if not init_db():
+                raise click.ClickException("Database initialisation failed")
+        conn = get_db_connection()
+        try:
+            if not reuse:
+                counts = generate(conn, customers, cars_per_customer, services, days, seed)
+            else:
+                counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                          for table in ('customers', 'cars', 'services')}
+            values = _seed_values(conn)
+        finally:
+            conn.close()
+
+        with app.app_context():
+            token = issue_tokens({'id': 1, 'username': 'benchmark', 'role': role})['access_token']
+        paths = [(name, path.format(**values)) for name, path in selected]
+        results = run_benchmarks(app, paths, clients, requests_per_route, warmup, role, token)
+    finally:
+        close_pool()
+        write_queue.flush()
+        if temporary:
+            for suffix in ('', '-wal', '-shm', '.report'):
+                if os.path.exists(database + suffix):
+                    os.unlink(database + suffix)
+
+    report = {
+        'environment': environment(),
+        'dataset': dict(counts, seed=seed, days=days, cars_per_customer=cars_per_customer),
+        'settings': {'clients': clients, 'requests_per_route': requests_per_route, 'warmup': warmup, 'role': role},
+        'routes': results,
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+    click.echo(f"Wrote {output}")
+
+    if baseline:
+        _compare(json.load(baseline), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import random
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+FIRST_NAMES = ['Ahmed', 'Sara', 'Omar', 'Lina', 'John', 'Maria', 'Ali', 'Noor', 'David', 'Fatima',
+               'Yusuf', 'Hana', 'Adam', 'Layla', 'James', 'Zainab', 'Karim', 'Emma', 'Hassan', 'Mona']
+LAST_NAMES = ['Hassan', 'Smith', 'Al-Saadi', 'Khalil', 'Brown', 'Haddad', 'Jones', 'Rahman',
+              'Garcia', 'Nasser', 'Taylor', 'Aziz', 'Wilson', 'Farouk', 'Lee', 'Salem']
+CAR_MODELS = {
+    'Toyota': ['Corolla', 'Camry', 'Land Cruiser', 'Hilux', 'Yaris'],
+    'Hyundai': ['Elantra', 'Sonata', 'Tucson', 'Accent'],
+    'Kia': ['Cerato', 'Sportage', 'Optima', 'Rio'],
+    'Nissan': ['Sunny', 'Altima', 'Patrol', 'X-Trail'],
+    'Ford': ['Focus', 'Fusion', 'Ranger', 'Explorer'],
+    'BMW': ['320i', '530i', 'X5'],
+    'Mercedes': ['C200', 'E300', 'GLE'],
+    'Honda': ['Civic', 'Accord', 'CR-V'],
+}
+ENGINE_TYPES = [('Petrol', 70), ('Diesel', 15), ('Hybrid', 10), ('Electric', 5)]
+SERVICE_TYPES = [
+    ('Oil Change', 30, 80), ('Brake Pads', 80, 250), ('Tyre Rotation', 20, 60),
+    ('Engine Diagnostics', 50, 150), ('Transmission Service', 150, 600), ('Battery Replacement', 90, 220),
+    ('Air Conditioning Repair', 100, 450), ('Wheel Alignment', 40, 120), ('Suspension Repair', 200, 900),
+    ('Timing Belt Replacement', 300, 1000),
+]
+DESCRIPTIONS = ['routine maintenance', 'customer reported noise', 'warning light on dashboard',
+                'scheduled inspection', 'parts ordered', 'follow-up visit', '']
+
+# Share of services per status; recent services are more likely to still be open
+CLOSED_STATUS_WEIGHTS = [('Completed', 88), ('Cancelled', 12)]
+OPEN_STATUS_WEIGHTS = [('Pending', 45), ('In Progress', 40), ('Completed', 15)]
+OPEN_WINDOW_DAYS = 14
+
+INSERT_CHUNK = 10000
+
+
+def _weighted(rng, weights):
+    values, cumulative = zip(*weights)
+    return rng.choices(values, weights=cumulative)[0]
+
+def _timestamp(moment):
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+def _insert_chunks(conn, sql, rows):
+    """executemany in fixed-size chunks so memory stays flat at large scales"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= INSERT_CHUNK:
+            conn.executemany(sql, chunk)
+            chunk = []
+    if chunk:
+        conn.executemany(sql, chunk)
+
+
+def generate(conn, customers=1000, cars_per_customer=2.0, services=10000, days=365, seed=42, now=None):
+    """Seed customers, cars and services into an initialised database
+
+    Rows go through the real schema, so the summary, version and search
+    triggers do the same work as in production. Output is deterministic
+    for a given ``seed`` and ``now``.
+    """
+    rng = random.Random(seed)
+    now = now or datetime(2025, 1, 1, 12, 0, 0)
+    start = now - timedelta(days=days)
+
+    def moment_between(lower, upper):
+        return lower + timedelta(seconds=rng.randint(0, max(0, int((upper - lower).total_seconds()))))
+
+    customer_created = [moment_between(start, now) for _ in range(customers)]
+    customer_created.sort()
+    conn.execute("BEGIN")
+    _insert_chunks(conn, """
+        INSERT INTO customers (name, phone, email, address, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (
+        (f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i + 1}",
+         f"07{rng.randint(100000000, 999999999)}",
+         f"customer{i + 1}@example.com" if rng.random() < 0.6 else '',
+         f"{rng.randint(1, 300)} Street {rng.randint(1, 60)}",
+         _timestamp(created), _timestamp(created))
+        for i, created in enumerate(customer_created)
+    ))
+    first_customer = conn.execute("SELECT MAX(id) FROM customers").fetchone()[0] - customers + 1
+
+    # Car counts per customer follow a geometric-like spread around the mean
+    car_rows = []
+    for offset, created in enumerate(customer_created):
+        count = 1
+        while rng.random() < 1 - 1 / max(cars_per_customer, 1.0):
+            count += 1
+        for _ in range(count):
+            make = rng.choice(list(CAR_MODELS))
+            car_created = moment_between(created, now)
+            car_rows.append((make, rng.choice(CAR_MODELS[make]), rng.randint(2005, now.year),
+                             _weighted(rng, ENGINE_TYPES), first_customer + offset,
+                             f"{rng.choice('ABCDEFGHKLMNPRSTUVWXYZ')}{rng.randint(1000, 99999)}",
+                             None, _timestamp(car_created), _timestamp(car_created)))
+    _insert_chunks(conn, """
+        INSERT INTO cars (name, model, year, engine_type, customer_id, license_plate, vin, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, car_rows)
+    first_car = conn.execute("SELECT MAX(id) FROM cars").fetchone()[0] - len(car_rows) + 1
+    car_created = [datetime.strptime(row[7], '%Y-%m-%d %H:%M:%S') for row in car_rows]
+    del car_rows
+
+    def service_rows():
+        open_since = now - timedelta(days=OPEN_WINDOW_DAYS)
+        for _ in range(services):
+            car_offset = rng.randrange(len(car_created))
+            created = moment_between(car_created[car_offset], now)
+            status = _weighted(rng, OPEN_STATUS_WEIGHTS if created >= open_since else CLOSED_STATUS_WEIGHTS)
+            service_type, low, high = rng.choice(SERVICE_TYPES)
+            end_date = None
+            if status in ('Completed', 'Cancelled'):
+                end_date = _timestamp(min(now, created + timedelta(hours=rng.randint(1, 96))))
+            yield (service_type, round(rng.uniform(low, high), 2), status, first_car + car_offset,
+                   rng.choice(DESCRIPTIONS), _timestamp(created), end_date, _timestamp(created),
+                   end_date or _timestamp(created))
+
+    _insert_chunks(conn, """
+        INSERT INTO services (type, cost, status, car_id, description, start_date, end_date, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, service_rows())
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.commit()
+
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+              for table in ('customers', 'cars', 'services')}
+    logger.info(f"Seeded {counts['customers']} customers, {counts['cars']} cars, {counts['services']} services")
+    return counts
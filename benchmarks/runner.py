@@ -0,0 +1,151 @@
+import os
+import sys
+import math
+import time
+import sqlite3
+import platform
+import resource
+import subprocess
+import threading
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# (name, path) pairs driven as an admin; {customer} and {term} are filled from the seeded data
+DEFAULT_ROUTES = [
+    ('dashboard', '/dashboard'),
+    ('customers', '/customers'),
+    ('cars', '/cars'),
+    ('services', '/services'),
+    ('services_status', '/services?status_filter=Pending'),
+    ('services_customer', '/services?customer_filter={customer}'),
+    ('services_search', '/services?search=brake'),
+    ('report', '/report'),
+    ('report_filtered', '/report?status=Completed&date_from=2024-12-01'),
+    ('report_export_csv', '/report/export?format=csv&date_from=2024-12-25'),
+    ('lookup_customers', '/lookup/customers?q={term}'),
+    ('lookup_cars', '/lookup/cars?q=to'),
+    ('api_services', '/api/v1/services?per_page=50'),
+]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+def process_peak_rss_kb():
+    """Peak resident set size of the whole process so far, in KiB; never falls between routes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KiB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def current_rss_kb():
+    """Current resident set size in KiB, where /proc is available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError):
+        return None
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _client(app, role, token):
+    """A test client carrying a logged-in session and an API token, without paying for a password hash"""
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['username'] = 'benchmark'
+        sess['role'] = role
+        sess['login_time'] = datetime.now().isoformat()
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    return client
+
+def run_route(app, path, clients, requests, role, token):
+    """Issue ``requests`` GETs of ``path`` from ``clients`` concurrent threads and time each one"""
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    per_client = [requests // clients + (1 if i < requests % clients else 0) for i in range(clients)]
+    barrier = threading.Barrier(clients + 1)
+
+    def worker(count):
+        client = _client(app, role, token)
+        local, local_statuses = [], {}
+        barrier.wait()
+        for _ in range(count):
+            started = time.perf_counter()
+            response = client.get(path)
+            # Consume streamed bodies so the full response is timed
+            response.get_data()
+            local.append(time.perf_counter() - started)
+            local_statuses[response.status_code] = local_statuses.get(response.status_code, 0) + 1
+            response.close()
+        with lock:
+            latencies.extend(local)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    threads = [threading.Thread(target=worker, args=(count,)) for count in per_client]
+    for thread in threads:
+        thread.start()
+    rss_before = current_rss_kb()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    rss_after = current_rss_kb()
+
+    latencies.sort()
+    return {
+        'path': path,
+        'requests': len(latencies),
+        'concurrency': clients,
+        'status_codes': {str(status): count for status, count in sorted(statuses.items())},
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'rss_kb': rss_after,
+        'rss_delta_kb': rss_after - rss_before if rss_after is not None and rss_before is not None else None,
+        'process_peak_rss_kb': process_peak_rss_kb(),
+    }
+
+def run_benchmarks(app, routes, clients=4, requests=200, warmup=5, role='admin', token=None):
+    """Benchmark every (name, path) route in turn and return {name: result}"""
+    results = {}
+    for name, path in routes:
+        if warmup:
+            run_route(app, path, 1, warmup, role, token)
+        results[name] = run_route(app, path, clients, requests, role, token)
+        result = results[name]
+        logger.info(f"{name}: p50 {result['p50_ms']}ms p95 {result['p95_ms']}ms "
+                    f"p99 {result['p99_ms']}ms {result['throughput_rps']} req/s")
+        unexpected = {status for status in result['status_codes'] if not status.startswith('2')}
+        if unexpected:
+            logger.warning(f"{name} returned status {', '.join(sorted(unexpected))}")
+    return results
+
+def environment():
+    """Versions and machine details recorded alongside the numbers"""
+    return {
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'run_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+    }
@@ -0,0 +1,299 @@
+import csv
+import io
+import json
+import sqlite3
+import logging
+from datetime import datetime
+from validators import validate_phone, validate_email, validate_year, validate_cost, SERVICE_STATUSES
+from repositories import CustomerRepository, CarRepository, ServiceRepository, utc_timestamp
+
+logger = logging.getLogger(__name__)
+
+IMPORT_KINDS = ('customers', 'cars', 'services')
+
+# Validated records are tuples in each repository's ``columns`` order
+REPOSITORIES = {'customers': CustomerRepository, 'cars': CarRepository, 'services': ServiceRepository}
+
+class ImportFormatError(ValueError):
+    """Raised when an upload cannot be parsed at all"""
+
+
+def _insert_chunk(conn, kind, rows):
+    """Insert a chunk with one prepared statement; return the id of its last row"""
+    repository = REPOSITORIES[kind](conn)
+    repository.insert_many(rows)
+    # AUTOINCREMENT ids are contiguous while this write holds the write lock
+    return repository.max_id()
+
+def _insert_rows(conn, kind, rows):
+    """Insert rows one at a time; return each row's new id or the IntegrityError that rejected it"""
+    repository = REPOSITORIES[kind](conn)
+    outcomes = []
+    for params in rows:
+        try:
+            outcomes.append(repository.insert_row(params))
+        except sqlite3.IntegrityError as e:
+            outcomes.append(e)
+    return outcomes
+
+
+def _text(record, field):
+    value = record.get(field)
+    return '' if value is None else str(value).strip()
+
+def _timestamp(record, field, default):
+    """Read an optional YYYY-MM-DD[ HH:MM:SS] timestamp, normalised for SQLite"""
+    value = _text(record, field)
+    if not value:
+        return default
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            continue
+    raise ValueError(f"{field} must be YYYY-MM-DD or YYYY-MM-DD HH:MM:SS")
+
+
+def parse_upload(data, filename, kind=None):
+    """Parse an uploaded CSV or JSON document into {kind: [record, ...]}
+
+    CSV files hold a single entity type named by ``kind``. JSON may be either a
+    list of records for ``kind`` or an object keyed by entity type.
+    """
+    if isinstance(data, bytes):
+        try:
+            data = data.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ImportFormatError("Files must be UTF-8 encoded")
+
+    if filename.lower().endswith('.json'):
+        try:
+            document = json.loads(data)
+        except ValueError as e:
+            raise ImportFormatError(f"Invalid JSON: {e}")
+        if isinstance(document, list):
+            if kind not in IMPORT_KINDS:
+                raise ImportFormatError("A JSON list needs kind=customers, cars or services")
+            return {kind: document}
+        if isinstance(document, dict):
+            unknown = set(document) - set(IMPORT_KINDS)
+            if unknown:
+                raise ImportFormatError(f"Unknown sections: {', '.join(sorted(unknown))}")
+            if not all(isinstance(records, list) for records in document.values()):
+                raise ImportFormatError("Each section must be a list of records")
+            return document
+        raise ImportFormatError("JSON must be a list or an object of lists")
+
+    if filename.lower().endswith('.csv'):
+        if kind not in IMPORT_KINDS:
+            raise ImportFormatError("CSV imports need kind=customers, cars or services")
+        return {kind: list(csv.DictReader(io.StringIO(data)))}
+
+    raise ImportFormatError("Upload a .csv or .json file")
+
+
+class BulkImporter:
+    """Validate and insert customers, cars and services in chunked transactions
+
+    Customer and car references are resolved against in-memory maps loaded once
+    per import, so a file can refer to rows created earlier in the same import
+    (``customer_ref``/``car_ref`` matching a record's ``ref``) as well as to
+    existing rows by id, phone number, licence plate or VIN.
+
+    Lookups read through ``conn``. Each chunk is written by one call to
+    ``write(func, *args)``, which must run ``func(conn, *args)`` in a write
+    transaction and return its result, such as the app's commit queue; by
+    default every chunk is its own ``BEGIN IMMEDIATE`` transaction on ``conn``.
+    """
+
+    def __init__(self, conn, chunk_size=5000, write=None):
+        self.conn = conn
+        self.chunk_size = chunk_size
+        self.write = write or self._write_directly
+        self.customer_refs = {}
+        self.car_refs = {}
+        self._load_existing()
+
+    def _write_directly(self, func, *args):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(self.conn, *args)
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        return result
+
+    def _load_existing(self):
+        self.customer_ids = set()
+        self.customers_by_phone = {}
+        for row in CustomerRepository(self.conn).all_phones():
+            self.customer_ids.add(row['id'])
+            self.customers_by_phone.setdefault(row['phone'], row['id'])
+
+        self.car_ids = set()
+        self.cars_by_plate = {}
+        self.cars_by_vin = {}
+        for row in CarRepository(self.conn).all_identifiers():
+            self.car_ids.add(row['id'])
+            if row['license_plate']:
+                self.cars_by_plate.setdefault(row['license_plate'], row['id'])
+            if row['vin']:
+                self.cars_by_vin.setdefault(row['vin'], row['id'])
+
+    def run(self, sections):
+        """Import every section in dependency order and return per-kind results"""
+        results = {}
+        for kind in IMPORT_KINDS:
+            records = sections.get(kind)
+            if records:
+                results[kind] = self._import(kind, records)
+        return results
+
+    def _import(self, kind, records):
+        validate = getattr(self, f'_validate_{kind[:-1]}')
+        now = utc_timestamp()
+        result = {'inserted': 0, 'errors': []}
+
+        # Row numbers are 1-based to match what a spreadsheet shows under the header
+        chunk = []
+        for row_number, record in enumerate(records, start=1):
+            if not isinstance(record, dict):
+                result['errors'].append({'row': row_number, 'error': 'Record must be an object'})
+                continue
+            try:
+                chunk.append((row_number, record, validate(record, now)))
+            except ValueError as e:
+                result['errors'].append({'row': row_number, 'error': str(e)})
+                continue
+            if len(chunk) >= self.chunk_size:
+                self._flush(kind, chunk, result)
+                chunk = []
+        if chunk:
+            self._flush(kind, chunk, result)
+
+        logger.info(f"Bulk import of {kind}: {result['inserted']} inserted, {len(result['errors'])} rejected")
+        return result
+
+    def _flush(self, kind, chunk, result):
+        """Insert one chunk as a single write, isolating bad rows if it fails"""
+        try:
+            last_id = self.write(_insert_chunk, kind, [params for _, _, params in chunk])
+        except sqlite3.IntegrityError:
+            self._flush_row_by_row(kind, chunk, result)
+            return
+
+        first_id = last_id - len(chunk) + 1
+        for offset, (_, record, params) in enumerate(chunk):
+            self._remember(kind, record, params, first_id + offset)
+        result['inserted'] += len(chunk)
+
+    def _flush_row_by_row(self, kind, chunk, result):
+        outcomes = self.write(_insert_rows, kind, [params for _, _, params in chunk])
+        for (row_number, record, params), outcome in zip(chunk, outcomes):
+            if isinstance(outcome, sqlite3.IntegrityError):
+                result['errors'].append({'row': row_number, 'error': f'Rejected by database: {outcome}'})
+                continue
+            self._remember(kind, record, params, outcome)
+            result['inserted'] += 1
+
+    def _remember(self, kind, record, params, row_id):
+        """Make a freshly inserted row resolvable by later records"""
+        ref = _text(record, 'ref')
+        if kind == 'customers':
+            self.customer_ids.add(row_id)
+            self.customers_by_phone.setdefault(params[1], row_id)
+            if ref:
+                self.customer_refs[ref] = row_id
+        elif kind == 'cars':
+            self.car_ids.add(row_id)
+            if params[5]:
+                self.cars_by_plate.setdefault(params[5], row_id)
+            if params[6]:
+                self.cars_by_vin.setdefault(params[6], row_id)
+            if ref:
+                self.car_refs[ref] = row_id
+
+    def _validate_customer(self, record, now):
+        name = _text(record, 'name')
+        phone = _text(record, 'phone')
+        email = _text(record, 'email')
+        if not name:
+            raise ValueError('Customer name is required.')
+        if not phone:
+            raise ValueError('Phone number is required.')
+        if not validate_phone(phone):
+            raise ValueError('Please enter a valid phone number.')
+        if email and not validate_email(email):
+            raise ValueError('Please enter a valid email address.')
+        created_at = _timestamp(record, 'created_at', now)
+        return (name, phone, email, _text(record, 'address'), created_at, created_at)
+
+    def _validate_car(self, record, now):
+        fields = [_text(record, field) for field in ('name', 'model', 'year', 'engine_type')]
+        if not all(fields):
+            raise ValueError('name, model, year and engine_type are required.')
+        if not validate_year(fields[2]):
+            raise ValueError('Please enter a valid year.')
+        customer_id = self._resolve_customer(record)
+        created_at = _timestamp(record, 'created_at', now)
+        return (fields[0], fields[1], int(fields[2]), fields[3], customer_id,
+                _text(record, 'license_plate'), _text(record, 'vin'), created_at, created_at)
+
+    def _validate_service(self, record, now):
+        service_type = _text(record, 'type')
+        cost = _text(record, 'cost')
+        status = _text(record, 'status') or 'Pending'
+        if not service_type or not cost:
+            raise ValueError('type and cost are required.')
+        if not validate_cost(cost):
+            raise ValueError('Please enter a valid cost (must be greater than 0).')
+        if status not in SERVICE_STATUSES:
+            raise ValueError('Please select a valid status.')
+        car_id = self._resolve_car(record)
+        created_at = _timestamp(record, 'created_at', now)
+        start_date = _timestamp(record, 'start_date', created_at)
+        end_date = _timestamp(record, 'end_date', None)
+        return (service_type, float(cost), status, car_id, _text(record, 'description'),
+                start_date, end_date, created_at, created_at)
+
+    def _resolve_customer(self, record):
+        ref = _text(record, 'customer_ref')
+        if ref:
+            if ref not in self.customer_refs:
+                raise ValueError(f"Unknown customer_ref '{ref}'.")
+            return self.customer_refs[ref]
+        customer_id = _text(record, 'customer_id')
+        if customer_id:
+            if not customer_id.isdigit() or int(customer_id) not in self.customer_ids:
+                raise ValueError(f"Unknown customer_id '{customer_id}'.")
+            return int(customer_id)
+        phone = _text(record, 'customer_phone')
+        if phone:
+            if phone not in self.customers_by_phone:
+                raise ValueError(f"No customer with phone '{phone}'.")
+            return self.customers_by_phone[phone]
+        raise ValueError('customer_ref, customer_id or customer_phone is required.')
+
+    def _resolve_car(self, record):
+        ref = _text(record, 'car_ref')
+        if ref:
+            if ref not in self.car_refs:
+                raise ValueError(f"Unknown car_ref '{ref}'.")
+            return self.car_refs[ref]
+        car_id = _text(record, 'car_id')
+        if car_id:
+            if not car_id.isdigit() or int(car_id) not in self.car_ids:
+                raise ValueError(f"Unknown car_id '{car_id}'.")
+            return int(car_id)
+        plate = _text(record, 'license_plate')
+        if plate:
+            if plate not in self.cars_by_plate:
+                raise ValueError(f"No car with license plate '{plate}'.")
+            return self.cars_by_plate[plate]
+        vin = _text(record, 'vin')
+        if vin:
+            if vin not in self.cars_by_vin:
+                raise ValueError(f"No car with VIN '{vin}'.")
+            return self.cars_by_vin[vin]
+        raise ValueError('car_ref, car_id, license_plate or vin is required.')
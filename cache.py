@@ -0,0 +1,74 @@
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class VersionedCache:
+    """Bounded in-process LRU cache for query results tagged with table versions
+
+    Each entry remembers the versions of the tables it was built from. A
+    lookup with different versions is treated as a miss and the entry is
+    rebuilt, so any write that bumps a version (from this or another worker
+    process) invalidates dependent entries without explicit purges.
+    """
+
+    def __init__(self, max_entries=32, max_rows=10000):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._evictions = 0
+        self._uncacheable = 0
+
+    def get_or_load(self, key, versions, loader):
+        """Return the cached rows for ``key`` at ``versions``, calling ``loader()`` on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == versions:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+            if entry is not None:
+                self._stale += 1
+
+        # Load outside the lock; concurrent misses for one key just both query
+        rows = tuple(dict(row) for row in loader())
+        with self._lock:
+            if len(rows) > self.max_rows:
+                self._uncacheable += 1
+                self._entries.pop(key, None)
+                return rows
+            self._entries[key] = (versions, rows)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._evictions += 1
+                logger.debug(f"Evicted lookup cache entry {evicted}")
+        return rows
+
+    def clear(self):
+        """Drop every entry, keeping the counters"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return a snapshot of cache counters"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'max_rows': self.max_rows,
+                'hits': self._hits,
+                'misses': self._misses,
+                'stale': self._stale,
+                'evictions': self._evictions,
+                'uncacheable': self._uncacheable,
+                'hit_ratio': round(self._hits / lookups, 4) if lookups else None,
+            }
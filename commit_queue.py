@@ -0,0 +1,181 @@
+import sqlite3
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+logger = logging.getLogger(__name__)
+
+
+class CommitTimeout(sqlite3.OperationalError):
+    """Raised when a queued write was not started in time; it has been withdrawn and not applied"""
+
+
+class CommitQueue:
+    """Serialises a process's writes through one thread and commits them in groups
+
+    Callers hand over ``func(conn, *args)`` and wait for its result. The
+    writer thread takes every job waiting (up to ``max_batch``, lingering at
+    most ``max_delay`` seconds for company), opens one ``BEGIN IMMEDIATE``
+    transaction, runs each job in its own savepoint and commits once. A job
+    that raises is rolled back to its savepoint and its exception is
+    returned to its caller alone; the rest of the group still commits.
+
+    Taking the write lock up front means the busy timeout applies, instead of
+    deferred transactions failing with SQLITE_BUSY when they try to upgrade
+    while another worker process is writing, and the lock and the WAL sync
+    are paid once per group rather than once per request. Jobs must not
+    commit or roll back themselves.
+    """
+
+    def __init__(self, connect, max_batch=64, max_delay=0.001, timeout=10.0):
+        self.connect = connect
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._conn = None
+        self._jobs = 0
+        self._failed_jobs = 0
+        self._batches = 0
+        self._failed_batches = 0
+        self._largest_batch = 0
+        self._queue_seconds = 0.0
+        self._commit_seconds = 0.0
+
+    def submit(self, func, *args):
+        """Queue a write; returns a Future for its result"""
+        future = Future()
+        with self._cond:
+            if self._stopping:
+                raise sqlite3.ProgrammingError("Commit queue is closed")
+            self._pending.append((future, func, args, time.monotonic()))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='commit-queue', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def execute(self, func, *args):
+        """Run a write through the queue and return its result, re-raising its exception"""
+        future = self.submit(func, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            if future.cancel():
+                raise CommitTimeout(f"Write was not started within {self.timeout}s")
+            # Already running; it will finish shortly either way
+            return future.result()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                # Give concurrent requests a moment to join this group
+                deadline = time.monotonic() + self.max_delay
+                while len(self._pending) < self.max_batch and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+            self._commit(batch)
+
+    def _commit(self, batch):
+        started = time.monotonic()
+        outcomes = []
+        claimed = []
+        try:
+            if self._conn is None:
+                self._conn = self.connect()
+                if self._conn is None:
+                    raise sqlite3.OperationalError("no database connection")
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            for future, func, args, queued in batch:
+                # Withdrawn (timed out) jobs are skipped
+                if not future.set_running_or_notify_cancel():
+                    continue
+                claimed.append((future, queued))
+                conn.execute("SAVEPOINT queued_write")
+                try:
+                    outcomes.append((future, func(conn, *args), None))
+                    conn.execute("RELEASE queued_write")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO queued_write")
+                    conn.execute("RELEASE queued_write")
+                    outcomes.append((future, None, e))
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Group commit of {len(batch)} writes failed: {e}")
+            self._discard_connection()
+            with self._cond:
+                self._failed_batches += 1
+                self._failed_jobs += len(claimed)
+            for future, _, _, _ in batch:
+                if future.running() or future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+            return
+
+        finished = time.monotonic()
+        if not claimed:
+            return
+        with self._cond:
+            self._batches += 1
+            self._jobs += len(claimed)
+            self._largest_batch = max(self._largest_batch, len(claimed))
+            self._commit_seconds += finished - started
+            self._queue_seconds += sum(started - queued for _, queued in claimed)
+            self._failed_jobs += sum(1 for _, _, error in outcomes if error is not None)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _discard_connection(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        try:
+            conn.rollback()
+            conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Error discarding commit queue connection: {e}")
+
+    def close(self):
+        """Commit whatever is queued, stop the writer thread and close its connection"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"Error closing commit queue connection: {e}")
+            self._conn = None
+
+    def stats(self):
+        """Return a snapshot of group commit counters"""
+        with self._cond:
+            return {
+                'pending': len(self._pending),
+                'jobs': self._jobs,
+                'failed_jobs': self._failed_jobs,
+                'batches': self._batches,
+                'failed_batches': self._failed_batches,
+                'largest_batch': self._largest_batch,
+                'avg_batch': round(self._jobs / self._batches, 2) if self._batches else None,
+                'queue_seconds_total': round(self._queue_seconds, 6),
+                'commit_seconds_total': round(self._commit_seconds, 6),
+            }
@@ -6,6 +6,87 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'supersecretkey'
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'your-jwt-secret-key'
     DATABASE = 'workshop.db'
+
+    # Database connection pool and pragma tuning
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5.0))
+    DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+    DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 16384))
+    DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 64 * 1024 * 1024))
+    DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 256))
+
+    # List view pagination
+    PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 50))
+    MAX_PAGE_SIZE = 200
+
+    # Rows buffered per chunk when streaming report exports
+    EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 500))
+
+    # Stream the services and report pages while they render, in pieces of at least STREAM_CHUNK_SIZE characters
+    STREAM_TEMPLATES = os.environ.get('STREAM_TEMPLATES', 'true').lower() == 'true'
+    STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 8192))
+
+    # Reports and exports read a snapshot copied from the live database every REPORT_SNAPSHOT_INTERVAL
+    # seconds (0 reads the live database), REPORT_SNAPSHOT_PAGES pages per backup step
+    REPORT_SNAPSHOT_PATH = os.environ.get('REPORT_SNAPSHOT_PATH', '')
+    REPORT_SNAPSHOT_INTERVAL = float(os.environ.get('REPORT_SNAPSHOT_INTERVAL', 60.0))
+    REPORT_SNAPSHOT_PAGES = int(os.environ.get('REPORT_SNAPSHOT_PAGES', 256))
+    REPORT_SNAPSHOT_STEP_SLEEP_MS = float(os.environ.get('REPORT_SNAPSHOT_STEP_SLEEP_MS', 5))
+    # Most periods the report's day/week/month rollup table lists
+    REPORT_ROLLUP_MAX_PERIODS = int(os.environ.get('REPORT_ROLLUP_MAX_PERIODS', 366))
+    # Latest periods the report covers when no date range is given
+    REPORT_DEFAULT_PERIODS = int(os.environ.get('REPORT_DEFAULT_PERIODS', 12))
+
+    # Rows per transaction for bulk imports
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 5000))
+
+    # Password hashing runs on a bounded pool so login bursts cannot starve page requests
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 16))
+    PASSWORD_HASH_TIMEOUT = 10.0
+
+    # Login attempts allowed in a burst and refilled per minute, per username and per client address
+    LOGIN_RATE_USER_BURST = 5
+    LOGIN_RATE_USER_PER_MINUTE = 5
+    LOGIN_RATE_IP_BURST = 20
+    LOGIN_RATE_IP_PER_MINUTE = 30
+
+    # Background flushing of low-priority writes such as last_login and audit events
+    WRITE_BEHIND_INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL', 1.0))
+    WRITE_BEHIND_MAX_BATCH = 500
+    WRITE_BEHIND_MAX_PENDING = 10000
+
+    # Single-writer commit queue: writes per group commit, how long a group waits to fill, and how long callers wait
+    COMMIT_QUEUE_MAX_BATCH = int(os.environ.get('COMMIT_QUEUE_MAX_BATCH', 64))
+    COMMIT_QUEUE_MAX_DELAY_MS = float(os.environ.get('COMMIT_QUEUE_MAX_DELAY_MS', 1.0))
+    COMMIT_QUEUE_TIMEOUT = float(os.environ.get('COMMIT_QUEUE_TIMEOUT', 10.0))
+
+    # Most services one bulk start/complete request may move
+    BULK_STATUS_MAX_IDS = int(os.environ.get('BULK_STATUS_MAX_IDS', 500))
+
+    # Per-request SQL instrumentation: Server-Timing header, slow-query log and query-count warnings
+    SERVER_TIMING = os.environ.get('SERVER_TIMING', 'true').lower() == 'true'
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+    MAX_QUERIES_PER_REQUEST = int(os.environ.get('MAX_QUERIES_PER_REQUEST', 20))
+
+    # Prometheus /metrics: shared snapshot directory for multi-process servers and a bearer token,
+    # without which the endpoint is refused when METRICS_REQUIRE_TOKEN is set
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_WRITE_INTERVAL = 5.0
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_REQUIRE_TOKEN = os.environ.get('METRICS_REQUIRE_TOKEN', 'false').lower() == 'true'
+
+    # Typeahead lookup page size and bounds for the in-process result cache
+    LOOKUP_PAGE_SIZE = 10
+    MAX_LOOKUP_PAGE_SIZE = 50
+    LOOKUP_CACHE_MAX_ENTRIES = int(os.environ.get('LOOKUP_CACHE_MAX_ENTRIES', 32))
+    LOOKUP_CACHE_MAX_ROWS = int(os.environ.get('LOOKUP_CACHE_MAX_ROWS', 10000))
+
+    # Async (ASGI) serving: reader threads beside the single writer thread, and status board long-polling
+    DB_READER_THREADS = int(os.environ.get('DB_READER_THREADS', 4))
+    STATUS_BOARD_LIMIT = 50
+    STATUS_BOARD_TIMEOUT = float(os.environ.get('STATUS_BOARD_TIMEOUT', 25.0))
+    STATUS_BOARD_POLL_INTERVAL = float(os.environ.get('STATUS_BOARD_POLL_INTERVAL', 1.0))
     
     # Session configuration
     PERMANENT_SESSION_LIFETIME = timedelta(hours=8)
@@ -35,6 +116,7 @@ class ProductionConfig(Config):
     TESTING = False
     SESSION_COOKIE_SECURE = True
     WTF_CSRF_ENABLED = True
+    METRICS_REQUIRE_TOKEN = os.environ.get('METRICS_REQUIRE_TOKEN', 'true').lower() == 'true'
 
 class TestingConfig(Config):
     """Testing configuration"""
@@ -0,0 +1,140 @@
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def connect(database, busy_timeout_ms=5000, cache_size_kb=16384, mmap_size=67108864, statement_cache_size=256,
+            factory=sqlite3.Connection):
+    """Open a SQLite connection with WAL journaling and tuned pragmas"""
+    # A statement cache large enough for every query the repositories issue keeps them prepared
+    conn = sqlite3.connect(database, timeout=busy_timeout_ms / 1000.0, check_same_thread=False,
+                           cached_statements=statement_cache_size, factory=factory)
+    conn.row_factory = sqlite3.Row  # This enables column access by name
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+    # Negative cache_size is in KiB rather than pages
+    conn.execute(f"PRAGMA cache_size = -{int(cache_size_kb)}")
+    conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections
+
+    Connections are opened lazily up to ``max_size`` and reused across
+    requests, so the pragma setup and page cache warm-up are paid once per
+    connection instead of once per request.
+    """
+
+    def __init__(self, database, max_size=8, timeout=5.0, **connect_options):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self.connect_options = connect_options
+        self._idle = []
+        self._open = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_time = 0.0
+
+    def acquire(self):
+        """Check out a connection, waiting up to ``timeout`` seconds if the pool is exhausted"""
+        deadline = None
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._open < self.max_size:
+                    # Reserve the slot before connecting outside the lock
+                    self._open += 1
+                    conn = None
+                    break
+                if deadline is None:
+                    deadline = time.monotonic() + self.timeout
+                    waited = True
+                    self._waits += 1
+                    wait_start = time.monotonic()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    self._wait_time += time.monotonic() - wait_start
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                self._cond.wait(remaining)
+            self._checkouts += 1
+            if waited:
+                self._wait_time += time.monotonic() - wait_start
+
+        if conn is None:
+            try:
+                conn = connect(self.database, **self.connect_options)
+            except sqlite3.Error:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding it if it is no longer usable"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            # Closed by the caller or broken; drop it and free the slot
+            logger.warning(f"Discarding unusable pooled connection: {e}")
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            if self._closed:
+                self._open -= 1
+                conn.close()
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def close(self):
+        """Close idle connections and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            for conn in self._idle:
+                try:
+                    conn.close()
+                except sqlite3.Error as e:
+                    logger.error(f"Error closing pooled connection: {e}")
+                self._open -= 1
+            self._idle = []
+            self._cond.notify_all()
+
+    def stats(self):
+        """Return a snapshot of pool counters"""
+        with self._cond:
+            return {
+                'database': self.database,
+                'max_size': self.max_size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._open - len(self._idle),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'wait_seconds': round(self._wait_time, 6),
+            }
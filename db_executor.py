@@ -0,0 +1,117 @@
+import asyncio
+import sqlite3
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseExecutor:
+    """Runs database work on dedicated threads: one writer and ``readers`` readers
+
+    Each thread opens its own connection from ``connect`` and keeps it for its
+    lifetime. Writes are serialised on the single writer thread and committed,
+    or rolled back on error, around the callable, so they never queue on
+    SQLite's write lock against each other; reads run side by side under WAL.
+
+    ``read``/``write`` take ``func(conn, *args)`` and return futures;
+    ``aread``/``awrite`` await the same from an event loop without blocking it.
+    Given a ``commit_queue``, writes are handed to it instead so the process
+    keeps a single writer shared with the Flask views.
+    """
+
+    def __init__(self, connect, readers=4, commit_queue=None):
+        self.connect = connect
+        self.readers = readers
+        self.commit_queue = commit_queue
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._reader_pool = ThreadPoolExecutor(readers, 'db-reader', initializer=self._open)
+        self._writer_pool = ThreadPoolExecutor(1, 'db-writer', initializer=self._open)
+        self._reads = 0
+        self._writes = 0
+        self._failures = 0
+        self._read_seconds = 0.0
+        self._write_seconds = 0.0
+
+    def _open(self):
+        conn = self.connect()
+        if conn is None:
+            raise sqlite3.OperationalError("no database connection")
+        self._local.conn = conn
+        with self._lock:
+            self._connections.append(conn)
+
+    def _run_read(self, func, args):
+        started = time.perf_counter()
+        try:
+            return func(self._local.conn, *args)
+        except Exception:
+            with self._lock:
+                self._failures += 1
+            raise
+        finally:
+            with self._lock:
+                self._reads += 1
+                self._read_seconds += time.perf_counter() - started
+
+    def _run_write(self, func, args):
+        conn = self._local.conn
+        started = time.perf_counter()
+        try:
+            result = func(conn, *args)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            with self._lock:
+                self._failures += 1
+            raise
+        finally:
+            with self._lock:
+                self._writes += 1
+                self._write_seconds += time.perf_counter() - started
+
+    def read(self, func, *args):
+        """Run ``func(conn, *args)`` on a reader thread; returns a Future"""
+        return self._reader_pool.submit(self._run_read, func, args)
+
+    def write(self, func, *args):
+        """Run ``func(conn, *args)`` on the writer thread inside a transaction; returns a Future"""
+        if self.commit_queue is not None:
+            return self.commit_queue.submit(func, *args)
+        return self._writer_pool.submit(self._run_write, func, args)
+
+    async def aread(self, func, *args):
+        return await asyncio.wrap_future(self.read(func, *args))
+
+    async def awrite(self, func, *args):
+        return await asyncio.wrap_future(self.write(func, *args))
+
+    def shutdown(self):
+        """Finish queued work, then close every thread's connection"""
+        self._writer_pool.shutdown(wait=True)
+        self._reader_pool.shutdown(wait=True)
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"Error closing executor connection: {e}")
+
+    def stats(self):
+        """Return a snapshot of executor counters"""
+        with self._lock:
+            return {
+                'readers': self.readers,
+                'open_connections': len(self._connections),
+                'reads': self._reads,
+                'writes': self._writes,
+                'failures': self._failures,
+                'read_seconds_total': round(self._read_seconds, 6),
+                'write_seconds_total': round(self._write_seconds, 6),
+            }
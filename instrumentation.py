@@ -0,0 +1,170 @@
+import re
+import time
+import sqlite3
+import threading
+import logging
+from contextvars import ContextVar
+from flask import g, request, before_render_template, template_rendered
+
+logger = logging.getLogger(__name__)
+
+# Statements at or above this duration are logged; set from SLOW_QUERY_MS by init_app
+slow_query_seconds = 0.1
+
+_current = ContextVar('sql_request_stats', default=None)
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def normalize_sql(sql):
+    """Collapse whitespace and replace literals with ? so similar statements log identically"""
+    return _LITERALS.sub('?', ' '.join(sql.split()))
+
+
+class RequestStats:
+    """Statement and render timings collected for one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self._render_started = None
+
+
+def _record(sql, param_count, elapsed, statement=True):
+    stats = _current.get()
+    if stats is not None:
+        stats.db_seconds += elapsed
+        if statement:
+            stats.queries += 1
+    if statement and elapsed >= slow_query_seconds:
+        params = 'batch' if param_count is None else f"{param_count} params"
+        logger.warning(f"Slow query ({elapsed * 1000:.1f} ms, {params}): {normalize_sql(sql)}")
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times statements and fetches into the current request's stats"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record(sql, len(parameters), time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record(sql, None, time.perf_counter() - started)
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            _record(sql_script, None, time.perf_counter() - started)
+
+    # Stepping through results happens in the fetch calls, so time them as db work too
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            _record('', 0, time.perf_counter() - started, statement=False)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            _record('', 0, time.perf_counter() - started, statement=False)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            _record('', 0, time.perf_counter() - started, statement=False)
+
+    # Streamed exports step the cursor with ``for row in cursor``
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            _record('', 0, time.perf_counter() - started, statement=False)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements, including the execute shortcuts, go through InstrumentedCursor"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+_flagged_lock = threading.Lock()
+flagged_routes = {}
+
+def init_app(app):
+    """Collect per-request SQL and render timings, emit Server-Timing and flag chatty routes"""
+    global slow_query_seconds
+    slow_query_seconds = app.config['SLOW_QUERY_MS'] / 1000.0
+
+    @app.before_request
+    def start_request_stats():
+        stats = RequestStats()
+        g.request_stats = stats
+        g.request_stats_token = _current.set(stats)
+
+    def render_started(sender, template, context, **extra):
+        stats = _current.get()
+        if stats is not None:
+            stats._render_started = time.perf_counter()
+
+    def render_finished(sender, template, context, **extra):
+        stats = _current.get()
+        if stats is not None and stats._render_started is not None:
+            stats.render_seconds += time.perf_counter() - stats._render_started
+            stats._render_started = None
+
+    before_render_template.connect(render_started, app, weak=False)
+    template_rendered.connect(render_finished, app, weak=False)
+
+    @app.after_request
+    def emit_server_timing(response):
+        stats = g.get('request_stats')
+        if stats is None:
+            return response
+        total = time.perf_counter() - stats.started
+        max_queries = app.config['MAX_QUERIES_PER_REQUEST']
+        if app.config['SERVER_TIMING']:
+            response.headers['Server-Timing'] = ', '.join([
+                f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.queries} queries"',
+                f'render;dur={stats.render_seconds * 1000:.2f}',
+                f'total;dur={total * 1000:.2f}' + (
+                    # Sent ahead of a streamed body, so the timings stop at the first byte
+                    ';desc="to first byte"' if response.is_streamed and not response.direct_passthrough else ''),
+            ])
+        if max_queries and stats.queries > max_queries:
+            logger.warning(f"{request.method} {request.path} ({request.endpoint}) issued {stats.queries} queries, "
+                           f"more than {max_queries}")
+            with _flagged_lock:
+                flagged_routes[request.endpoint] = max(flagged_routes.get(request.endpoint, 0), stats.queries)
+        return response
+
+    @app.teardown_request
+    def stop_request_stats(exception=None):
+        token = g.pop('request_stats_token', None)
+        if token is not None:
+            _current.reset(token)
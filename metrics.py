@@ -0,0 +1,337 @@
+import os
+import json
+import time
+import atexit
+import threading
+import logging
+from contextlib import contextmanager
+from flask import g, request
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Request latency histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    'workshop_http_requests_total': ('counter', 'HTTP requests by endpoint, method and status code'),
+    'workshop_http_request_duration_seconds': ('histogram', 'Time to produce a response, by endpoint'),
+    'workshop_http_requests_in_flight': ('gauge', 'Requests currently being handled'),
+    'workshop_db_pool_connections': ('gauge', 'Pooled SQLite connections by state'),
+    'workshop_db_pool_checkouts_total': ('counter', 'Connections checked out of the pool'),
+    'workshop_db_pool_waits_total': ('counter', 'Checkouts that had to wait for a free connection'),
+    'workshop_db_pool_timeouts_total': ('counter', 'Checkouts that gave up waiting'),
+    'workshop_db_pool_wait_seconds_total': ('counter', 'Time spent waiting for pooled connections'),
+    'workshop_db_file_size_bytes': ('gauge', 'Size of the SQLite database and its WAL file'),
+    'workshop_table_rows': ('gauge', 'Rows per table'),
+    'workshop_metrics_processes': ('gauge', 'Worker processes whose metrics are included'),
+}
+
+
+# Counters and histograms of exited workers are folded into this file under the lock file
+ARCHIVE_FILE = 'metrics-archive.json'
+LOCK_FILE = 'metrics.lock'
+# Without fcntl the lock is an exclusively created file; one older than this was left by a crash
+LOCK_STALE_SECONDS = 30.0
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class MetricsRegistry:
+    """Per-process metric values that can be merged across worker processes
+
+    With ``directory`` set, each process periodically writes its values to
+    ``metrics-<pid>-<start>.json`` there, the start time telling a reused pid
+    apart from the worker that exited. ``collect`` folds the counters and
+    histograms of exited workers into one archive file and deletes theirs,
+    sums counters and histograms over the archive and the live files, and
+    takes gauges from live processes only.
+    """
+
+    def __init__(self, directory=None, write_interval=5.0):
+        self.directory = directory
+        self.write_interval = write_interval
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._in_flight = 0
+        self._process_gauges = None
+        self._last_write = 0.0
+        self._pid = None
+        self._start = None
+
+    def _identity(self):
+        pid = os.getpid()
+        if pid != self._pid:
+            # A worker forked from the process that built the registry needs its own file
+            self._pid = pid
+            self._start = _process_start(pid) or int(time.time() * 1000)
+        return pid, self._start
+
+    def set_process_gauges(self, func):
+        """Register ``func() -> [(name, labels, value, kind)]`` for per-process values such as pool stats"""
+        self._process_gauges = func
+
+    def inc_in_flight(self, amount):
+        with self._lock:
+            self._in_flight += amount
+
+    def observe_request(self, endpoint, method, status, duration):
+        with self._lock:
+            key = _key('workshop_http_requests_total', {'endpoint': endpoint, 'method': method, 'status': str(status)})
+            self._counters[key] = self._counters.get(key, 0) + 1
+            key = _key('workshop_http_request_duration_seconds', {'endpoint': endpoint})
+            buckets, total, count = self._histograms.get(key, ([0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0))
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    break
+            else:
+                index = len(LATENCY_BUCKETS)
+            buckets[index] += 1
+            self._histograms[key] = (buckets, total + duration, count + 1)
+        if self.directory and time.monotonic() - self._last_write >= self.write_interval:
+            self.write()
+
+    def snapshot(self):
+        """This process's values as a JSON-serialisable dict"""
+        counters, gauges = [], []
+        if self._process_gauges:
+            try:
+                for name, labels, value, kind in self._process_gauges():
+                    (counters if kind == 'counter' else gauges).append([name, sorted(labels.items()), value])
+            except Exception as e:
+                logger.error(f"Error collecting process metrics: {e}")
+        with self._lock:
+            counters += [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            gauges.append(['workshop_http_requests_in_flight', [], self._in_flight])
+            histograms = [[name, list(labels), list(buckets), total, count]
+                          for (name, labels), (buckets, total, count) in self._histograms.items()]
+        pid, start = self._identity()
+        return {'pid': pid, 'start': start, 'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+    def write(self):
+        """Publish this process's snapshot for other workers to aggregate"""
+        self._last_write = time.monotonic()
+        pid, start = self._identity()
+        path = os.path.join(self.directory, f'metrics-{pid}-{start}.json')
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            logger.error(f"Error writing metrics snapshot: {e}")
+
+    def _read_snapshots(self):
+        snapshots = []
+        try:
+            names = [name for name in os.listdir(self.directory)
+                     if name.startswith('metrics-') and name.endswith('.json')]
+        except OSError:
+            names = []
+        for name in names:
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshots.append((name, json.load(f)))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable metrics file {name}: {e}")
+        return snapshots
+
+    def _archive_exited(self, snapshots):
+        """Fold exited workers' files into the archive; return the archive and live snapshots"""
+        counters, histograms = {}, {}
+        live, exited = [], []
+        for name, snap in snapshots:
+            if name != ARCHIVE_FILE and _process_alive(snap['pid'], snap.get('start')):
+                live.append(snap)
+                continue
+            _merge(counters, histograms, snap)
+            if name != ARCHIVE_FILE:
+                exited.append(name)
+        archive = {
+            'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'gauges': [],
+            'histograms': [[name, list(labels), list(buckets), total, count]
+                           for (name, labels), (buckets, total, count) in histograms.items()],
+        }
+        if exited:
+            path = os.path.join(self.directory, ARCHIVE_FILE)
+            try:
+                with open(path + '.tmp', 'w') as f:
+                    json.dump(archive, f)
+                os.replace(path + '.tmp', path)
+                for name in exited:
+                    os.unlink(os.path.join(self.directory, name))
+            except OSError as e:
+                logger.error(f"Error archiving metrics of exited workers: {e}")
+        return [archive] + live
+
+    def _snapshots(self):
+        if not self.directory:
+            return [self.snapshot()]
+        self.write()
+        try:
+            with _directory_lock(os.path.join(self.directory, LOCK_FILE)):
+                # Serialise folding so two scrapes never archive one worker twice
+                return self._archive_exited(self._read_snapshots())
+        except OSError as e:
+            logger.error(f"Error locking metrics directory: {e}")
+            return [snap for _, snap in self._read_snapshots()]
+
+    def collect(self):
+        """Merge every process's snapshot into {'counters', 'gauges', 'histograms'}"""
+        counters, gauges, histograms = {}, {}, {}
+        live = 0
+        for snap in self._snapshots():
+            _merge(counters, histograms, snap)
+            if 'pid' not in snap or not _process_alive(snap['pid'], snap.get('start')):
+                continue
+            live += 1
+            for name, labels, value in snap['gauges']:
+                key = (name, tuple(map(tuple, labels)))
+                gauges[key] = gauges.get(key, 0) + value
+        gauges[('workshop_metrics_processes', ())] = live
+        return {'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+
+@contextmanager
+def _directory_lock(path):
+    """Hold an exclusive lock shared by every worker: flock where available, else a lock file"""
+    if fcntl is not None:
+        with open(path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+        return
+
+    deadline = time.monotonic() + LOCK_STALE_SECONDS
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > LOCK_STALE_SECONDS:
+                    os.unlink(path)
+                    continue
+            except OSError:
+                continue
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.unlink(path)
+
+
+def _merge(counters, histograms, snap):
+    """Add a snapshot's counters and histograms into the merged dicts"""
+    for name, labels, value in snap['counters']:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, buckets, total, count in snap['histograms']:
+        key = (name, tuple(map(tuple, labels)))
+        merged = histograms.get(key, ([0] * len(buckets), 0.0, 0))
+        histograms[key] = ([a + b for a, b in zip(merged[0], buckets)], merged[1] + total, merged[2] + count)
+
+
+def _process_start(pid):
+    """Start time of ``pid`` in clock ticks since boot, or None where /proc is unavailable"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces, so count fields from its closing parenthesis
+    return int(stat.rsplit(')', 1)[1].split()[19])
+
+def _process_alive(pid, start):
+    if not _pid_alive(pid):
+        return False
+    current = _process_start(pid)
+    return start is None or current is None or current == start
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render(collected, extra_gauges=()):
+    """Prometheus text exposition (version 0.0.4) for merged values plus scrape-time gauges"""
+    samples = {}
+    for (name, labels), value in list(collected['counters'].items()) + list(collected['gauges'].items()):
+        samples.setdefault(name, []).append(f"{name}{_labels(labels)} {_number(value)}")
+    for name, labels, value in extra_gauges:
+        samples.setdefault(name, []).append(f"{name}{_labels(sorted(labels.items()))} {_number(value)}")
+    for name in samples:
+        samples[name].sort()
+
+    # Histogram lines stay in bucket order
+    for (name, labels), (buckets, total, count) in sorted(collected['histograms'].items()):
+        lines = samples.setdefault(name, [])
+        cumulative = 0
+        for bound, bucket in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+            cumulative += bucket
+            le = bound if bound == '+Inf' else repr(bound)
+            lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(float(total))}")
+        lines.append(f"{name}_count{_labels(labels)} {count}")
+
+    output = []
+    for name in sorted(samples):
+        kind, help_text = METRIC_HELP.get(name, ('untyped', name))
+        output.append(f"# HELP {name} {help_text}")
+        output.append(f"# TYPE {name} {kind}")
+        output.extend(samples[name])
+    return '\n'.join(output) + '\n'
+
+
+def init_app(app):
+    """Count, time and track in-flight requests; returns the registry for the /metrics view"""
+    registry = MetricsRegistry(app.config.get('METRICS_DIR'), app.config.get('METRICS_WRITE_INTERVAL', 5.0))
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        registry.inc_in_flight(1)
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.get('metrics_started')
+        if started is not None:
+            registry.observe_request(request.endpoint or 'unmatched', request.method,
+                                     response.status_code, time.perf_counter() - started)
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exception=None):
+        if g.pop('metrics_started', None) is not None:
+            registry.inc_in_flight(-1)
+
+    if registry.directory:
+        atexit.register(registry.write)
+    return registry
@@ -0,0 +1,426 @@
+import sqlite3
+import time
+import logging
+from validators import SERVICE_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# Created only while a step is deferred; lists the versions to retry on the next run
+DEFERRED_TABLE = 'deferred_migrations'
+
+
+class MigrationDeferred(Exception):
+    """Raised by a step that cannot run on this SQLite build; later steps still apply and it is retried next run"""
+
+# Tables whose changes bump the trigger-maintained counters in table_versions
+VERSIONED_TABLES = ('customers', 'cars', 'services')
+
+# Current table definitions: (table, CREATE statement, {added column: (definition, backfill)})
+# Columns listed as added are filled in on databases created before they existed
+TABLES = [
+    ('users', '''
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        role TEXT NOT NULL CHECK (role IN ('admin', 'user')),
+        email TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        last_login TEXT
+    )
+    ''', {
+        'email': ('TEXT', None),
+        'created_at': ('TEXT', "UPDATE users SET created_at = datetime('now') WHERE created_at IS NULL"),
+        'last_login': ('TEXT', None),
+    }),
+    ('customers', '''
+    CREATE TABLE customers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        email TEXT,
+        address TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''', {
+        'email': ('TEXT', None),
+        'address': ('TEXT', None),
+        'updated_at': ('TEXT', 'UPDATE customers SET updated_at = created_at WHERE updated_at IS NULL'),
+    }),
+    ('cars', '''
+    CREATE TABLE cars (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        model TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        engine_type TEXT NOT NULL,
+        customer_id INTEGER NOT NULL,
+        license_plate TEXT,
+        vin TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (customer_id) REFERENCES customers (id) ON DELETE CASCADE
+    )
+    ''', {
+        'license_plate': ('TEXT', None),
+        'vin': ('TEXT', None),
+        'updated_at': ('TEXT', 'UPDATE cars SET updated_at = created_at WHERE updated_at IS NULL'),
+    }),
+    ('services', '''
+    CREATE TABLE services (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        type TEXT NOT NULL,
+        cost REAL NOT NULL CHECK (cost > 0),
+        status TEXT NOT NULL CHECK (status IN ('Pending', 'In Progress', 'Completed', 'Cancelled')),
+        car_id INTEGER NOT NULL,
+        description TEXT,
+        start_date TEXT DEFAULT CURRENT_TIMESTAMP,
+        end_date TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (car_id) REFERENCES cars (id) ON DELETE CASCADE
+    )
+    ''', {
+        'description': ('TEXT', None),
+        'start_date': ('TEXT', 'UPDATE services SET start_date = created_at WHERE start_date IS NULL'),
+        'end_date': ('TEXT', None),
+        'updated_at': ('TEXT', 'UPDATE services SET updated_at = created_at WHERE updated_at IS NULL'),
+    }),
+]
+
+SERVICE_SUMMARY_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_service_summary_insert AFTER INSERT ON services
+    BEGIN
+        UPDATE service_summary
+        SET service_count = service_count + 1, revenue = revenue + NEW.cost
+        WHERE status = NEW.status;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_service_summary_delete AFTER DELETE ON services
+    BEGIN
+        UPDATE service_summary
+        SET service_count = service_count - 1, revenue = revenue - OLD.cost
+        WHERE status = OLD.status;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_service_summary_update AFTER UPDATE OF status, cost ON services
+    BEGIN
+        UPDATE service_summary
+        SET service_count = service_count - 1, revenue = revenue - OLD.cost
+        WHERE status = OLD.status;
+        UPDATE service_summary
+        SET service_count = service_count + 1, revenue = revenue + NEW.cost
+        WHERE status = NEW.status;
+    END
+    ''',
+]
+
+# External-content FTS5 index kept in sync with the services table
+SERVICES_FTS_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_services_fts_insert AFTER INSERT ON services
+    BEGIN
+        INSERT INTO services_fts (rowid, type, description) VALUES (NEW.id, NEW.type, NEW.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_services_fts_delete AFTER DELETE ON services
+    BEGIN
+        INSERT INTO services_fts (services_fts, rowid, type, description)
+        VALUES ('delete', OLD.id, OLD.type, OLD.description);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_services_fts_update AFTER UPDATE OF type, description ON services
+    BEGIN
+        INSERT INTO services_fts (services_fts, rowid, type, description)
+        VALUES ('delete', OLD.id, OLD.type, OLD.description);
+        INSERT INTO services_fts (rowid, type, description) VALUES (NEW.id, NEW.type, NEW.description);
+    END
+    ''',
+]
+
+# Service count and revenue per period, status and type: granularity -> (table, period of a timestamp)
+# Periods are keyed on the creation date and named by their first day; weeks start on Monday
+ROLLUP_GRANULARITIES = {
+    'day': ('service_rollup_daily', "date({0})"),
+    'week': ('service_rollup_weekly', "date({0}, 'weekday 0', '-6 days')"),
+    'month': ('service_rollup_monthly', "date({0}, 'start of month')"),
+}
+
+
+def _rollup_add_sql(table, period, row):
+    # UPSERT from a SELECT needs a WHERE clause to parse; it also skips undated rows
+    return f'''
+        INSERT INTO {table} (period, status, type, service_count, revenue)
+        SELECT {period.format(f'{row}.created_at')}, {row}.status, {row}.type, 1, {row}.cost
+        WHERE {row}.created_at IS NOT NULL
+        ON CONFLICT (period, status, type) DO UPDATE
+        SET service_count = service_count + 1, revenue = revenue + excluded.revenue;'''
+
+def _rollup_remove_sql(table, period, row):
+    match = f"period = {period.format(f'{row}.created_at')} AND status = {row}.status AND type = {row}.type"
+    return f'''
+        UPDATE {table} SET service_count = service_count - 1, revenue = revenue - {row}.cost WHERE {match};
+        DELETE FROM {table} WHERE {match} AND service_count = 0;'''
+
+def _table_exists(cursor, name):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return cursor.fetchone() is not None
+
+def rebuild_service_summary(cursor):
+    """Recompute the per-status service counters from the services table"""
+    cursor.execute("DELETE FROM service_summary")
+    cursor.executemany(
+        "INSERT INTO service_summary (status, service_count, revenue) VALUES (?, 0, 0)",
+        [(status,) for status in SERVICE_STATUSES],
+    )
+    cursor.execute("""
+        UPDATE service_summary
+        SET service_count = (SELECT COUNT(*) FROM services WHERE services.status = service_summary.status),
+            revenue = (SELECT COALESCE(SUM(cost), 0) FROM services WHERE services.status = service_summary.status)
+    """)
+
+def rebuild_service_rollups(cursor):
+    """Recompute the period rollups from the services table"""
+    for table, period in ROLLUP_GRANULARITIES.values():
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"""
+            INSERT INTO {table} (period, status, type, service_count, revenue)
+            SELECT {period.format('created_at')}, status, type, COUNT(*), SUM(cost)
+            FROM services
+            WHERE created_at IS NOT NULL
+            GROUP BY 1, 2, 3
+        """)
+
+
+# Every step is idempotent, so databases created by the old start-up checks
+# (user_version 0 but partly or fully built) are brought up to date safely
+
+def create_base_tables(cursor):
+    for table, create_sql, added_columns in TABLES:
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing_columns = [row[1] for row in cursor.fetchall()]
+        if not existing_columns:
+            cursor.execute(create_sql)
+            continue
+        for column, (definition, backfill) in added_columns.items():
+            if column not in existing_columns:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                if backfill:
+                    cursor.execute(backfill)
+                logger.info(f"Added {table}.{column}")
+
+def create_list_indexes(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cars_customer_id ON cars(customer_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_services_car_id ON services(car_id)')
+    # List views page through (created_at, id) newest first
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_customers_created_at ON customers(created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cars_created_at ON cars(created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_services_created_at ON services(created_at, id)')
+    # Status filters keep date order; supersedes the old single-column status index
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_services_status_created_at ON services(status, created_at, id)')
+    cursor.execute('DROP INDEX IF EXISTS idx_services_status')
+    # Covering indexes for the customer and car dropdowns and the customer name filter
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_customers_name_phone ON customers(name, phone)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cars_name_model ON cars(name, model, year, customer_id)')
+
+def create_service_summary(cursor):
+    # Summary counters kept current by triggers so KPIs are a single small read
+    summary_exists = _table_exists(cursor, 'service_summary')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS service_summary (
+        status TEXT PRIMARY KEY,
+        service_count INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0
+    )
+    ''')
+    for trigger in SERVICE_SUMMARY_TRIGGERS:
+        cursor.execute(trigger)
+    if not summary_exists:
+        rebuild_service_summary(cursor)
+
+def create_table_versions(cursor):
+    # Per-table change counters used as HTTP validators and cache keys
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS table_versions (
+        table_name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    for table in VERSIONED_TABLES:
+        cursor.execute("INSERT OR IGNORE INTO table_versions (table_name) VALUES (?)", (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()} AFTER {event} ON {table}
+            BEGIN
+                UPDATE table_versions
+                SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE table_name = '{table}';
+            END
+            ''')
+
+def create_services_fts(cursor):
+    # Full-text index for service search, when SQLite is built with FTS5
+    fts_exists = _table_exists(cursor, 'services_fts')
+    try:
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS services_fts USING fts5(
+            type, description, content='services', content_rowid='id', prefix='2 3'
+        )
+        ''')
+    except sqlite3.OperationalError as e:
+        if 'no such module' not in str(e):
+            raise
+        # Left unapplied so a later run on an FTS5-enabled build creates it; search uses LIKE until then
+        raise MigrationDeferred(f"FTS5 unavailable, service search will fall back to LIKE: {e}") from e
+    for trigger in SERVICES_FTS_TRIGGERS:
+        cursor.execute(trigger)
+    if not fts_exists:
+        cursor.execute("INSERT INTO services_fts (services_fts) VALUES ('rebuild')")
+
+def create_audit_log(cursor):
+    # Login and other audit events, written through the write-behind queue
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS audit_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event TEXT NOT NULL,
+        username TEXT,
+        ip_address TEXT,
+        detail TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_log_created_at ON audit_log(created_at)')
+
+def create_lookup_indexes(cursor):
+    # Case-insensitive prefix search for the typeahead lookups
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_customers_name_nocase ON customers(name COLLATE NOCASE)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_customers_phone ON customers(phone)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cars_name_nocase ON cars(name COLLATE NOCASE)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cars_model_nocase ON cars(model COLLATE NOCASE)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cars_license_plate_nocase ON cars(license_plate COLLATE NOCASE)')
+
+def create_service_rollups(cursor):
+    # Daily, weekly and monthly rollups kept current by triggers so date-range reports read a few rows per period
+    for table, period in ROLLUP_GRANULARITIES.values():
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            period TEXT NOT NULL,
+            status TEXT NOT NULL,
+            type TEXT NOT NULL,
+            service_count INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, status, type)
+        ) WITHOUT ROWID
+        ''')
+    granularities = ROLLUP_GRANULARITIES.values()
+    add_new = ''.join(_rollup_add_sql(table, period, 'NEW') for table, period in granularities)
+    remove_old = ''.join(_rollup_remove_sql(table, period, 'OLD') for table, period in granularities)
+    for name, event, body in (
+        ('insert', 'INSERT', add_new),
+        ('delete', 'DELETE', remove_old),
+        ('update', 'UPDATE OF status, cost, type, created_at', remove_old + add_new),
+    ):
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_service_rollup_{name} AFTER {event} ON services BEGIN{body}\nEND")
+    rebuild_service_rollups(cursor)
+
+
+# Append new steps at the end; never renumber or edit one that has shipped
+MIGRATIONS = [
+    (1, 'base tables', create_base_tables),
+    (2, 'list and filter indexes', create_list_indexes),
+    (3, 'service summary counters', create_service_summary),
+    (4, 'table version counters', create_table_versions),
+    (5, 'services full-text index', create_services_fts),
+    (6, 'audit log', create_audit_log),
+    (7, 'typeahead lookup indexes', create_lookup_indexes),
+    (8, 'service revenue rollups', create_service_rollups),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def _schema_state(conn):
+    """The schema version and whether any step is waiting to be retried, in one read"""
+    return tuple(conn.execute(
+        "SELECT (SELECT user_version FROM pragma_user_version), "
+        "EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?)",
+        (DEFERRED_TABLE,),
+    ).fetchone())
+
+def _deferred_versions(cursor):
+    if not _table_exists(cursor, DEFERRED_TABLE):
+        return set()
+    cursor.execute(f"SELECT version FROM {DEFERRED_TABLE}")
+    return {row[0] for row in cursor.fetchall()}
+
+def migrate(conn):
+    """Apply pending migrations, each in its own transaction; return the list of versions applied
+
+    The schema version lives in ``PRAGMA user_version``, so an up-to-date
+    database costs a single small read. A step that raises MigrationDeferred
+    is rolled back and listed in ``deferred_migrations``; the version still
+    moves past it so later steps apply, and it is tried again on every run
+    until it succeeds.
+    """
+    current, has_deferred = _schema_state(conn)
+    if current == SCHEMA_VERSION and not has_deferred:
+        return []
+    if current > SCHEMA_VERSION:
+        logger.warning(f"Database schema version {current} is newer than this code ({SCHEMA_VERSION})")
+        return []
+
+    applied = []
+    cursor = conn.cursor()
+    retry = _deferred_versions(cursor)
+    for version, description, step in MIGRATIONS:
+        if version <= current and version not in retry:
+            continue
+        started = time.perf_counter()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the write lock
+            current = schema_version(conn)
+            deferred = _deferred_versions(cursor)
+            if version <= current and version not in deferred:
+                conn.rollback()
+                continue
+            cursor.execute("SAVEPOINT migration_step")
+            try:
+                step(cursor)
+            except MigrationDeferred as e:
+                cursor.execute("ROLLBACK TO migration_step")
+                logger.warning(f"Migration {version} ({description}) deferred to a later run: {e}")
+                cursor.execute(f"CREATE TABLE IF NOT EXISTS {DEFERRED_TABLE} (version INTEGER PRIMARY KEY)")
+                cursor.execute(f"INSERT OR IGNORE INTO {DEFERRED_TABLE} (version) VALUES (?)", (version,))
+                done = False
+            else:
+                if deferred - {version}:
+                    cursor.execute(f"DELETE FROM {DEFERRED_TABLE} WHERE version = ?", (version,))
+                elif deferred:
+                    cursor.execute(f"DROP TABLE {DEFERRED_TABLE}")
+                done = True
+            cursor.execute("RELEASE migration_step")
+            if version > current:
+                cursor.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        current = max(current, version)
+        if done:
+            applied.append(version)
+            logger.info(f"Applied migration {version} ({description}) in {time.perf_counter() - started:.3f}s")
+
+    if applied:
+        cursor.execute('PRAGMA optimize')
+    return applied
@@ -1,85 +1,43 @@
 # models/workshop.py
-import sqlite3
-from datetime import datetime
+from contextlib import closing, contextmanager
 from werkzeug.security import generate_password_hash
-
-def init_db():
-    with sqlite3.connect('workshop.db') as conn:
-        c = conn.cursor()
-
-        c.execute('''CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT CHECK(role IN ('admin', 'user')) NOT NULL
-        )''')
-
-        c.execute("SELECT * FROM users WHERE username = ?", ('admin',))
-        if not c.fetchone():
-            c.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", (
-                'admin',
-                generate_password_hash('admin123'),
-                'admin'
-            ))
-
-        c.execute('''CREATE TABLE IF NOT EXISTS customers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            phone TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS cars (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            model TEXT,
-            year INTEGER,
-            engine_type TEXT,
-            customer_id INTEGER,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (customer_id) REFERENCES customers(id)
-        )''')
-
-        c.execute('''CREATE TABLE IF NOT EXISTS services (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            type TEXT,
-            cost REAL,
-            status TEXT,
-            car_id INTEGER,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (car_id) REFERENCES cars(id)
-        )''')
-
-def create_customer(name, phone):
-    created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    with sqlite3.connect('workshop.db') as conn:
-        c = conn.cursor()
-        c.execute("INSERT INTO customers (name, phone, created_at) VALUES (?, ?, ?)", (name, phone, created_at))
-
-def create_car(name, model, year, engine_type, customer_id):
-    created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    with sqlite3.connect('workshop.db') as conn:
-        c = conn.cursor()
-        c.execute("""
-        INSERT INTO cars (name, model, year, engine_type, customer_id, created_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """, (name, model, year, engine_type, customer_id, created_at))
-
-def create_service(type, cost, status, car_id):
-    created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    with sqlite3.connect('workshop.db') as conn:
-        c = conn.cursor()
-        c.execute("""
-        INSERT INTO services (type, cost, status, car_id, created_at)
-        VALUES (?, ?, ?, ?, ?)
-        """, (type, cost, status, car_id, created_at))
-
-def get_all_customers():
-    with sqlite3.connect('workshop.db') as conn:
-        c = conn.cursor()
-        return c.execute("SELECT * FROM customers").fetchall()
-
-def get_all_cars():
-    with sqlite3.connect('workshop.db') as conn:
-        c = conn.cursor()
-        return c.execute("SELECT * FROM cars").fetchall()
+from config import Config
+from database import connect as open_connection
+from migrations import migrate
+from repositories import UserRepository, CustomerRepository, CarRepository, ServiceRepository
+
+@contextmanager
+def connect(database=None):
+    """Open a tuned connection that commits on success, rolls back on error and is always closed"""
+    with closing(open_connection(database or Config.DATABASE)) as conn:
+        with conn:
+            yield conn
+
+def init_db(database=None):
+    """Create or upgrade the schema through the shared migrations and seed the admin user"""
+    with connect(database) as conn:
+        migrate(conn)
+        users = UserRepository(conn)
+        if not users.exists('admin'):
+            users.insert(username='admin', password=generate_password_hash('admin123'), role='admin')
+
+def create_customer(name, phone, database=None):
+    with connect(database) as conn:
+        return CustomerRepository(conn).insert(name=name, phone=phone, email='', address='')
+
+def create_car(name, model, year, engine_type, customer_id, database=None):
+    with connect(database) as conn:
+        return CarRepository(conn).insert(name=name, model=model, year=year, engine_type=engine_type,
+                                          customer_id=customer_id)
+
+def create_service(type, cost, status, car_id, database=None):
+    with connect(database) as conn:
+        return ServiceRepository(conn).insert(type=type, cost=cost, status=status, car_id=car_id)
+
+def get_all_customers(database=None):
+    with connect(database) as conn:
+        return conn.execute(CustomerRepository.list_query).fetchall()
+
+def get_all_cars(database=None):
+    with connect(database) as conn:
+        return conn.execute(CarRepository.list_query).fetchall()
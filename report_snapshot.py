@@ -0,0 +1,188 @@
+import os
+import sqlite3
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class ReportSnapshot:
+    """Read-only copy of the database for reports, refreshed with SQLite's online backup API
+
+    ``refresh`` copies the live database ``pages`` pages at a time, sleeping
+    ``step_sleep`` seconds between steps so the copy never holds a read lock
+    for long, into a temporary file that then atomically replaces ``path``.
+    Connections from ``connect`` open the snapshot as immutable: they take no
+    locks, and one opened before a refresh keeps reading the file it opened.
+
+    ``start`` launches a daemon thread that first takes a fresh copy, so a
+    file left by an earlier run is never served, and then refreshes every
+    ``interval`` seconds. Until that first copy is in place ``connect`` returns
+    None and callers read the live database, so no request waits for a full
+    backup. When ``version`` is given, ``version(conn)`` and the
+    schema version are compared with the key recorded in the snapshot and
+    unchanged databases are not copied again, which also lets several worker
+    processes share one snapshot file.
+    """
+
+    META_TABLE = 'report_snapshot_meta'
+
+    def __init__(self, connect, path, interval=60.0, pages=256, step_sleep=0.005, version=None):
+        self.connect_source = connect
+        self.path = path
+        self.interval = interval
+        self.pages = pages
+        self.step_sleep = step_sleep
+        self.version = version
+        self._refresh_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._primed = False
+        self._refreshes = 0
+        self._skipped = 0
+        self._failures = 0
+        self._steps = 0
+        self._last_seconds = None
+
+    def connect(self, factory=sqlite3.Connection):
+        """Open the current snapshot read-only; None until the first copy of this run is ready"""
+        self.start()
+        with self._cond:
+            primed = self._primed
+        if not primed or not os.path.exists(self.path):
+            return None
+        uri = Path(self.path).resolve().as_uri() + '?immutable=1'
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=factory)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def wait_ready(self, timeout=None):
+        """Block until the first copy is in place or ``timeout`` seconds pass; returns whether it is"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._primed or self._stopping, timeout) and self._primed
+
+    def as_of(self, conn):
+        """UTC time the snapshot open on ``conn`` was taken"""
+        return conn.execute(f"SELECT as_of FROM {self.META_TABLE}").fetchone()[0]
+
+    def source_key(self, source):
+        """Key the snapshot of ``source`` is recorded under: schema and data versions; None if unversioned"""
+        if self.version is None:
+            return None
+        schema = source.execute("PRAGMA schema_version").fetchone()[0]
+        user = source.execute("PRAGMA user_version").fetchone()[0]
+        return f"{user}:{schema}:{self.version(source)}"
+
+    def _recorded_version(self):
+        if not os.path.exists(self.path):
+            return None
+        uri = Path(self.path).resolve().as_uri() + '?immutable=1'
+        conn = sqlite3.connect(uri, uri=True)
+        try:
+            return conn.execute(f"SELECT source_version FROM {self.META_TABLE}").fetchone()[0]
+        except sqlite3.Error:
+            return None
+        finally:
+            conn.close()
+
+    def refresh(self, force=False):
+        """Copy the live database into the snapshot; returns False if it was already current"""
+        with self._refresh_lock:
+            started = time.monotonic()
+            source = self.connect_source()
+            if source is None:
+                raise sqlite3.OperationalError("no database connection")
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            steps = 0
+            try:
+                current = self.source_key(source)
+                if not force and current is not None and current == self._recorded_version():
+                    with self._cond:
+                        self._skipped += 1
+                    return False
+
+                def progress(status, remaining, total):
+                    nonlocal steps
+                    steps += 1
+
+                dest = sqlite3.connect(tmp_path)
+                try:
+                    source.backup(dest, pages=self.pages, progress=progress, sleep=self.step_sleep)
+                    as_of = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+                    dest.execute(f"CREATE TABLE {self.META_TABLE} (as_of TEXT, source_version TEXT)")
+                    dest.execute(f"INSERT INTO {self.META_TABLE} VALUES (?, ?)", (as_of, current))
+                    dest.commit()
+                    # Immutable readers cannot use a WAL, so the copy goes back to a rollback journal
+                    dest.execute("PRAGMA journal_mode = DELETE")
+                finally:
+                    dest.close()
+                os.replace(tmp_path, self.path)
+            except (sqlite3.Error, OSError):
+                with self._cond:
+                    self._failures += 1
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+            finally:
+                source.close()
+
+            elapsed = time.monotonic() - started
+            with self._cond:
+                if force:
+                    self._primed = True
+                    self._cond.notify_all()
+                self._refreshes += 1
+                self._steps += steps
+                self._last_seconds = elapsed
+            logger.info(f"Report snapshot refreshed in {elapsed:.3f}s ({steps} backup steps)")
+            return True
+
+    def start(self):
+        """Start the refresh thread, which takes the first copy straight away"""
+        with self._cond:
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name='report-snapshot', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._primed:
+                    self._cond.wait_for(lambda: self._stopping, self.interval)
+                if self._stopping:
+                    return
+                primed = self._primed
+            try:
+                self.refresh(force=not primed)
+            except (sqlite3.Error, OSError) as e:
+                logger.error(f"Report snapshot refresh failed: {e}")
+                if not primed:
+                    # Keep serving live data and try the first copy again after an interval
+                    with self._cond:
+                        self._cond.wait_for(lambda: self._stopping, self.interval)
+
+    def close(self):
+        """Stop the refresh thread; the snapshot file is left for the next start"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def stats(self):
+        """Return a snapshot of refresh counters"""
+        with self._cond:
+            return {
+                'path': self.path,
+                'ready': self._primed,
+                'refreshes': self._refreshes,
+                'skipped': self._skipped,
+                'failures': self._failures,
+                'backup_steps': self._steps,
+                'last_refresh_seconds': round(self._last_seconds, 6) if self._last_seconds is not None else None,
+            }
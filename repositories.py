@@ -0,0 +1,531 @@
+import re
+import json
+from datetime import datetime, timezone
+from migrations import ROLLUP_GRANULARITIES
+
+# Statuses a service may be moved to, and the statuses it may be moved from
+SERVICE_TRANSITIONS = {
+    'In Progress': ('Pending',),
+    'Completed': ('Pending', 'In Progress'),
+}
+
+
+def utc_timestamp():
+    """Current UTC time in the same format as SQLite's CURRENT_TIMESTAMP"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def like_prefix(term):
+    """LIKE pattern matching values that start with ``term``, for use with ESCAPE '\\'"""
+    return re.sub(r'([\\%_])', r'\\\1', term) + '%'
+
+def glob_prefix(term):
+    """GLOB pattern matching values that start with ``term``"""
+    return re.sub(r'([*?\[])', r'[\1]', term) + '*'
+
+def id_list(ids):
+    """Encode ids as one JSON parameter for ``IN (SELECT value FROM json_each(?))``
+
+    Any number of ids then binds to the same SQL text, so a batch of 3 and a
+    batch of 3000 share one prepared statement instead of one per length.
+    """
+    return json.dumps([int(row_id) for row_id in ids])
+
+
+class Repository:
+    """Queries for one table, run on a caller-supplied connection
+
+    Every method uses fixed SQL text, so repeated calls on a pooled connection
+    hit SQLite's prepared-statement cache. Repositories never commit; the
+    caller owns the transaction.
+    """
+
+    table = None
+    # Columns written by insert/insert_many, in parameter order
+    columns = ()
+    # Columns returned by get/get_many
+    select_columns = ('*',)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        select = ', '.join(cls.select_columns)
+        cls._get_sql = f"SELECT {select} FROM {cls.table} WHERE id = ?"
+        cls._get_many_sql = f"SELECT {select} FROM {cls.table} WHERE id IN (SELECT value FROM json_each(?))"
+        cls._insert_sql = (f"INSERT INTO {cls.table} ({', '.join(cls.columns)}) "
+                           f"VALUES ({', '.join('?' for _ in cls.columns)})")
+        cls._delete_sql = f"DELETE FROM {cls.table} WHERE id = ?"
+        cls._pop_sql = f"DELETE FROM {cls.table} WHERE id = ? RETURNING {select}"
+        cls._count_sql = f"SELECT COUNT(*) FROM {cls.table}"
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get(self, row_id):
+        return self.conn.execute(self._get_sql, (row_id,)).fetchone()
+
+    def get_many(self, ids):
+        """Return {id: row} for ``ids`` in one query; unknown ids are left out"""
+        ids = list(ids)
+        if not ids:
+            return {}
+        return {row[0]: row for row in self.conn.execute(self._get_many_sql, (id_list(ids),)).fetchall()}
+
+    def insert_row(self, params):
+        """Insert one tuple of values in ``columns`` order and return the new id"""
+        return self.conn.execute(self._insert_sql, params).lastrowid
+
+    def insert(self, **values):
+        """Insert one row from keyword values; omitted columns take their defaults from ``defaults``"""
+        row = self.defaults()
+        row.update(values)
+        return self.insert_row([row[column] for column in self.columns])
+
+    def insert_many(self, rows):
+        """Insert tuples in ``columns`` order with a single prepared statement; return the row count"""
+        cursor = self.conn.executemany(self._insert_sql, rows)
+        return cursor.rowcount
+
+    def delete(self, row_id):
+        return self.conn.execute(self._delete_sql, (row_id,)).rowcount
+
+    def pop(self, row_id):
+        """Delete a row and return it, or None if it did not exist"""
+        rows = self.conn.execute(self._pop_sql, (row_id,)).fetchall()
+        return rows[0] if rows else None
+
+    def max_id(self):
+        return self.conn.execute(f"SELECT MAX(id) FROM {self.table}").fetchone()[0]
+
+    def count(self):
+        return self.conn.execute(self._count_sql).fetchone()[0]
+
+    def defaults(self):
+        """Values for columns the caller did not supply"""
+        now = utc_timestamp()
+        return {'created_at': now, 'updated_at': now}
+
+
+class UserRepository(Repository):
+    table = 'users'
+    columns = ('username', 'password', 'role', 'created_at')
+    select_columns = ('id', 'username', 'role', 'email', 'created_at', 'last_login')
+
+    # Queued through the write-behind queue rather than executed here
+    LAST_LOGIN_SQL = "UPDATE users SET last_login = ? WHERE id = ?"
+
+    def get_credentials(self, username):
+        """Return id, password hash, role and username for ``username``, or None"""
+        return self.conn.execute(
+            "SELECT id, password, role, username FROM users WHERE username = ?", (username,)
+        ).fetchone()
+
+    def get_by_username(self, username):
+        return self.conn.execute(
+            "SELECT id, role, username FROM users WHERE username = ?", (username,)
+        ).fetchone()
+
+    def exists(self, username):
+        return self.conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone() is not None
+
+
+class AuditLogRepository(Repository):
+    table = 'audit_log'
+    columns = ('event', 'username', 'ip_address', 'detail', 'created_at')
+
+    # Queued through the write-behind queue rather than executed here
+    INSERT_SQL = "INSERT INTO audit_log (event, username, ip_address, detail, created_at) VALUES (?, ?, ?, ?, ?)"
+
+
+class TableVersionRepository(Repository):
+    table = 'table_versions'
+
+    def versions(self, tables):
+        """Return {table: (version, updated_at)} from the trigger-maintained counters"""
+        placeholders = ', '.join('?' for _ in tables)
+        rows = self.conn.execute(
+            f"SELECT table_name, version, updated_at FROM table_versions WHERE table_name IN ({placeholders})",
+            tables,
+        ).fetchall()
+        return {row['table_name']: (row['version'], row['updated_at']) for row in rows}
+
+
+class CustomerRepository(Repository):
+    table = 'customers'
+    columns = ('name', 'phone', 'email', 'address', 'created_at', 'updated_at')
+    select_columns = ('id', 'name', 'phone', 'email', 'address', 'created_at', 'updated_at')
+
+    list_query = """
+        SELECT id, name, phone, email, address, created_at, updated_at
+        FROM customers
+    """
+
+    # Each branch is a bounded index range scan and only the merged handful
+    # of ids is sorted, so cost does not grow with the table
+    lookup_query = """
+        SELECT id, name, phone FROM customers
+        WHERE id IN (
+            SELECT id FROM (SELECT id FROM customers WHERE name LIKE :like ESCAPE '\\'
+                            ORDER BY name COLLATE NOCASE LIMIT :limit)
+            UNION
+            SELECT id FROM (SELECT id FROM customers WHERE phone GLOB :glob ORDER BY phone LIMIT :limit)
+        )
+        ORDER BY name COLLATE NOCASE, id
+        LIMIT :limit
+    """
+
+    # An empty term matches everyone: walk the name index and stop after one page
+    first_page_query = """
+        SELECT id, name, phone FROM customers
+        ORDER BY name COLLATE NOCASE, id
+        LIMIT :limit
+    """
+
+    def lookup(self, term, limit):
+        """Up to ``limit`` customers whose name or phone starts with ``term``"""
+        if not term:
+            return self.conn.execute(self.first_page_query, {'limit': limit}).fetchall()
+        params = {'like': like_prefix(term), 'glob': glob_prefix(term), 'limit': limit}
+        return self.conn.execute(self.lookup_query, params).fetchall()
+
+    def car_count(self, customer_id):
+        return self.conn.execute("SELECT COUNT(*) FROM cars WHERE customer_id = ?", (customer_id,)).fetchone()[0]
+
+    def delete_unless_has_cars(self, customer_id):
+        """Delete the customer if no cars refer to it; returns (customer or None, car count)"""
+        customer = self.get(customer_id)
+        if customer is None:
+            return None, 0
+        car_count = self.car_count(customer_id)
+        if not car_count:
+            self.delete(customer_id)
+        return customer, car_count
+
+    def all_phones(self):
+        """(id, phone) for every customer, for resolving import references"""
+        return self.conn.execute("SELECT id, phone FROM customers")
+
+
+class CarRepository(Repository):
+    table = 'cars'
+    columns = ('name', 'model', 'year', 'engine_type', 'customer_id', 'license_plate', 'vin',
+               'created_at', 'updated_at')
+    select_columns = ('id', 'name', 'model', 'year', 'engine_type', 'customer_id', 'license_plate', 'vin',
+                      'created_at', 'updated_at')
+
+    list_query = """
+        SELECT c.id, c.name, c.model, c.year, c.engine_type, c.license_plate, c.vin,
+               c.created_at, c.updated_at, cu.name as customer_name, cu.phone as customer_phone
+        FROM cars c
+        JOIN customers cu ON c.customer_id = cu.id
+    """
+
+    lookup_query = """
+        SELECT c.id, c.name, c.model, c.year, c.license_plate, cu.name as customer_name
+        FROM cars c
+        JOIN customers cu ON c.customer_id = cu.id
+        WHERE c.id IN (
+            SELECT id FROM (SELECT id FROM cars WHERE name LIKE :like ESCAPE '\\'
+                            ORDER BY name COLLATE NOCASE LIMIT :limit)
+            UNION
+            SELECT id FROM (SELECT id FROM cars WHERE model LIKE :like ESCAPE '\\'
+                            ORDER BY model COLLATE NOCASE LIMIT :limit)
+            UNION
+            SELECT id FROM (SELECT id FROM cars WHERE license_plate LIKE :like ESCAPE '\\'
+                            ORDER BY license_plate COLLATE NOCASE LIMIT :limit)
+            UNION
+            SELECT id FROM (SELECT cars.id FROM customers JOIN cars ON cars.customer_id = customers.id
+                            WHERE customers.name LIKE :like ESCAPE '\\'
+                            ORDER BY customers.name COLLATE NOCASE LIMIT :limit)
+        )
+        ORDER BY c.name COLLATE NOCASE, c.model COLLATE NOCASE, c.id
+        LIMIT :limit
+    """
+
+    # An empty term matches every car: take one page off the name index, then
+    # order that handful like the matches above
+    first_page_query = """
+        SELECT c.id, c.name, c.model, c.year, c.license_plate, cu.name as customer_name
+        FROM cars c
+        JOIN customers cu ON c.customer_id = cu.id
+        WHERE c.id IN (SELECT id FROM cars ORDER BY name COLLATE NOCASE LIMIT :limit)
+        ORDER BY c.name COLLATE NOCASE, c.model COLLATE NOCASE, c.id
+        LIMIT :limit
+    """
+
+    def defaults(self):
+        values = super().defaults()
+        values.update(license_plate='', vin='')
+        return values
+
+    def lookup(self, term, limit):
+        """Up to ``limit`` cars whose name, model, plate or owner's name starts with ``term``"""
+        if not term:
+            return self.conn.execute(self.first_page_query, {'limit': limit}).fetchall()
+        params = {'like': like_prefix(term), 'limit': limit}
+        return self.conn.execute(self.lookup_query, params).fetchall()
+
+    def service_count(self, car_id):
+        return self.conn.execute("SELECT COUNT(*) FROM services WHERE car_id = ?", (car_id,)).fetchone()[0]
+
+    def delete_unless_has_services(self, car_id):
+        """Delete the car if no services refer to it; returns (car or None, service count)"""
+        car = self.get(car_id)
+        if car is None:
+            return None, 0
+        service_count = self.service_count(car_id)
+        if not service_count:
+            self.delete(car_id)
+        return car, service_count
+
+    def all_identifiers(self):
+        """(id, license_plate, vin) for every car, for resolving import references"""
+        return self.conn.execute("SELECT id, license_plate, vin FROM cars")
+
+
+class ServiceRepository(Repository):
+    table = 'services'
+    columns = ('type', 'cost', 'status', 'car_id', 'description', 'start_date', 'end_date',
+               'created_at', 'updated_at')
+    select_columns = ('id', 'type', 'cost', 'status', 'car_id', 'description', 'start_date', 'end_date',
+                      'created_at', 'updated_at')
+
+    _update_status_sql = """
+        UPDATE services
+        SET status = :status, updated_at = CURRENT_TIMESTAMP,
+            end_date = CASE WHEN :status = 'Completed' THEN CURRENT_TIMESTAMP ELSE end_date END
+        WHERE id IN (SELECT value FROM json_each(:ids))
+          AND status IN (SELECT value FROM json_each(:from_statuses))
+        RETURNING id
+    """
+
+    _by_status_sql = """
+        SELECT s.id, s.type, s.status, s.start_date, s.created_at, c.name as car_name, c.model as car_model,
+               c.license_plate, cu.name as customer_name
+        FROM services s
+        JOIN cars c ON s.car_id = c.id
+        JOIN customers cu ON c.customer_id = cu.id
+        WHERE s.status = ?
+        ORDER BY s.created_at DESC, s.id DESC
+        LIMIT ?
+    """
+
+    report_query = """
+        SELECT s.type, s.cost, s.status, s.start_date, s.end_date, s.created_at,
+               c.name as car_name, c.model as car_model, c.year as car_year,
+               cu.name as customer_name, cu.phone as customer_phone
+        FROM services s
+        JOIN cars c ON s.car_id = c.id
+        JOIN customers cu ON c.customer_id = cu.id
+    """
+
+    def defaults(self):
+        values = super().defaults()
+        values.update(status='Pending', description='', start_date=values['created_at'], end_date=None)
+        return values
+
+    def count(self):
+        """Rows in services, from the trigger-maintained summary rather than a scan"""
+        return self.conn.execute("SELECT COALESCE(SUM(service_count), 0) FROM service_summary").fetchone()[0]
+
+    def summary(self):
+        """Report KPIs from the trigger-maintained service_summary table"""
+        rows = self.conn.execute("SELECT status, service_count, revenue FROM service_summary").fetchall()
+        by_status = {row['status']: row for row in rows}
+
+        def count(status):
+            return by_status[status]['service_count'] if status in by_status else 0
+
+        total_services = sum(row['service_count'] for row in by_status.values())
+        total_revenue = sum(row['revenue'] for row in by_status.values())
+        return {
+            'total_services': total_services,
+            'completed_services': count('Completed'),
+            'pending_services': count('Pending'),
+            'in_progress_services': count('In Progress'),
+            'cancelled_services': count('Cancelled'),
+            'total_revenue': round(total_revenue, 2),
+            'avg_service_cost': round(total_revenue / total_services, 2) if total_services else None,
+        }
+
+    def rollup_summary(self, date_from=None, date_to=None, status=None):
+        """Report KPIs for an inclusive YYYY-MM-DD range, summed from the daily rollups
+
+        Day periods line up with the report's date filters, so the figures cover
+        exactly the services ``report`` lists for the same arguments.
+        """
+        conditions = []
+        params = []
+        if date_from:
+            conditions.append("period >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("period <= ?")
+            params.append(date_to)
+        if status:
+            conditions.append("+status = ?")
+            params.append(status)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+        summary = dict(self.conn.execute(f"""
+            SELECT COALESCE(SUM(service_count), 0) AS total_services,
+                   COALESCE(SUM(CASE WHEN status = 'Completed' THEN service_count END), 0) AS completed_services,
+                   COALESCE(SUM(CASE WHEN status = 'Pending' THEN service_count END), 0) AS pending_services,
+                   COALESCE(SUM(CASE WHEN status = 'In Progress' THEN service_count END), 0) AS in_progress_services,
+                   COALESCE(SUM(CASE WHEN status = 'Cancelled' THEN service_count END), 0) AS cancelled_services,
+                   COALESCE(SUM(revenue), 0) AS total_revenue
+            FROM service_rollup_daily{where}
+        """, params).fetchone())
+        total_revenue = summary['total_revenue']
+        summary['total_revenue'] = round(total_revenue, 2)
+        summary['avg_service_cost'] = (round(total_revenue / summary['total_services'], 2)
+                                       if summary['total_services'] else None)
+        return summary
+
+    def rollups(self, granularity, date_from=None, date_to=None, status=None, limit=366, breakdown=False):
+        """Read per-period service counts and revenue from the trigger-maintained rollups
+
+        Returns ``(periods, breakdown, truncated)``: one row per period for the
+        latest ``limit`` periods and, if asked for, their rows by status and
+        type, both oldest first, and whether older periods in the range were
+        left out. Date bounds select whole periods, from the one containing
+        ``date_from`` to the one containing ``date_to``.
+        """
+        table, period = ROLLUP_GRANULARITIES[granularity]
+        conditions = []
+        params = []
+        if date_from:
+            conditions.append(f"period >= {period.format('?')}")
+            params.append(date_from)
+        if date_to:
+            conditions.append(f"period <= {period.format('?')}")
+            params.append(date_to)
+        if status:
+            # Unary + keeps the planner walking the primary key in (period, status, type) order
+            conditions.append("+status = ?")
+            params.append(status)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+        periods = self.conn.execute(f"""
+            SELECT period, SUM(service_count) AS service_count, ROUND(SUM(revenue), 2) AS revenue,
+                   ROUND(SUM(CASE WHEN status = 'Completed' THEN revenue ELSE 0 END), 2) AS completed_revenue
+            FROM {table}{where}
+            GROUP BY period
+            ORDER BY period DESC
+            LIMIT ?
+        """, params + [limit + 1]).fetchall()
+        truncated = len(periods) > limit
+        periods = periods[:limit][::-1]
+        if not periods or not breakdown:
+            return periods, [], truncated
+
+        return periods, self.conn.execute(f"""
+            SELECT period, status, type, service_count, ROUND(revenue, 2) AS revenue
+            FROM {table}
+            WHERE {" AND ".join(["period >= ?"] + conditions)}
+            ORDER BY period, status, type
+        """, [periods[0]['period']] + params).fetchall(), truncated
+
+    def report(self, status=None, date_from=None, date_to=None):
+        """Cursor over the report rows, newest first; dates are inclusive YYYY-MM-DD bounds on creation"""
+        conditions = []
+        params = []
+        if status:
+            conditions.append("s.status = ?")
+            params.append(status)
+        if date_from:
+            conditions.append("s.created_at >= ?")
+            params.append(date_from)
+        if date_to:
+            # Include the whole end day
+            conditions.append("s.created_at < date(?, '+1 day')")
+            params.append(date_to)
+        query = self.report_query
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return self.conn.execute(query + " ORDER BY s.created_at DESC", params)
+
+    def build_list_query(self, search_term='', fts_query='', status='', customer_name='', include_cancelled=True):
+        """Build the services list query for fetch_keyset_page
+
+        Returns (base_query, where_conditions, params, table_alias, sort_key,
+        descending). With ``fts_query`` the rows are ranked by bm25; otherwise
+        ``search_term`` falls back to a LIKE scan.
+        """
+        where_conditions = []
+        params = []
+
+        if not include_cancelled:
+            where_conditions.append("s.status != 'Cancelled'")
+
+        search_columns = ""
+        search_join = ""
+        sort_key = None
+        descending = True
+        if fts_query:
+            # bm25 is lower for better matches; type is weighted above description
+            search_columns = ", f.score AS search_rank"
+            search_join = """
+            JOIN (SELECT rowid, bm25(services_fts, 2.0, 1.0) AS score
+                  FROM services_fts WHERE services_fts MATCH ?) f ON f.rowid = s.id"""
+            sort_key = [('f.score', 'search_rank'), ('s.id', 'id')]
+            descending = False
+            params.append(fts_query)
+        elif search_term:
+            where_conditions.append("(s.type LIKE ? OR s.description LIKE ?)")
+            params.extend([f'%{search_term}%', f'%{search_term}%'])
+
+        base_query = f"""
+            SELECT s.id, s.type, s.cost, s.status, s.description, s.start_date, s.end_date,
+                   s.created_at, s.updated_at, c.name as car_name, c.model as car_model,
+                   cu.name as customer_name, cu.phone as customer_phone{search_columns}
+            FROM services s{search_join}
+            JOIN cars c ON s.car_id = c.id
+            JOIN customers cu ON c.customer_id = cu.id
+        """
+
+        if status:
+            where_conditions.append("s.status = ?")
+            params.append(status)
+        if customer_name:
+            where_conditions.append("cu.name = ?")
+            params.append(customer_name)
+
+        return base_query, where_conditions, params, 's', sort_key, descending
+
+    def by_status(self, status, limit):
+        """The newest ``limit`` services in ``status`` with their car and customer, read in index order"""
+        return self.conn.execute(self._by_status_sql, (status, limit)).fetchall()
+
+    def update_status_many(self, ids, status):
+        """Move every service in ``ids`` that is allowed to reach ``status``; return the set of ids moved
+
+        Allowed source statuses come from SERVICE_TRANSITIONS, and completing a
+        service stamps its end date. One statement covers the whole batch.
+        """
+        ids = list(ids)
+        if not ids:
+            return set()
+        params = {
+            'status': status,
+            'ids': id_list(ids),
+            'from_statuses': json.dumps(SERVICE_TRANSITIONS[status]),
+        }
+        return {row[0] for row in self.conn.execute(self._update_status_sql, params).fetchall()}
+
+    def update_status(self, service_id, status):
+        """Move one service to ``status``; return whether it was allowed to"""
+        return service_id in self.update_status_many([service_id], status)
+
+    def transition_many(self, ids, status):
+        """Move the services in ``ids`` to ``status`` where allowed; returns {id: (status it had, or None, moved)}"""
+        ids = list(dict.fromkeys(ids))
+        before = self.get_many(ids)
+        moved = self.update_status_many(ids, status)
+        return {service_id: (before[service_id]['status'] if service_id in before else None, service_id in moved)
+                for service_id in ids}
+
+    def transition(self, service_id, status):
+        """Move one service to ``status`` if allowed; returns (service as it was, or None, and whether it moved)"""
+        service = self.get(service_id)
+        if service is None:
+            return None, False
+        return service, self.update_status(service_id, status)
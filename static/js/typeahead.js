@@ -0,0 +1,57 @@
+// Async typeahead for inputs marked with data-lookup-url.
+// Matches are fetched as the user types and offered through the input's <datalist>.
+// When data-lookup-target names a hidden field, the chosen match's id is copied
+// into it and the form cannot be submitted until a listed match is picked.
+(function () {
+  var DEBOUNCE_MS = 200;
+
+  function attach(input) {
+    var list = document.getElementById(input.getAttribute('list'));
+    var hidden = input.dataset.lookupTarget ? input.form.elements[input.dataset.lookupTarget] : null;
+    var valueField = input.dataset.lookupValue || 'label';
+    var ids = {};
+    var timer = null;
+    var controller = null;
+
+    function sync() {
+      if (!hidden) return;
+      hidden.value = ids[input.value] || '';
+      input.setCustomValidity(hidden.value || !input.value ? '' : 'Choose a match from the list.');
+    }
+
+    function search() {
+      if (controller) controller.abort();
+      controller = new AbortController();
+      var url = input.dataset.lookupUrl + '?q=' + encodeURIComponent(input.value.trim());
+      fetch(url, { signal: controller.signal, credentials: 'same-origin', headers: { 'Accept': 'application/json' } })
+        .then(function (response) { return response.ok ? response.json() : { data: [] }; })
+        .then(function (body) {
+          var options = document.createDocumentFragment();
+          ids = {};
+          body.data.forEach(function (row) {
+            var option = document.createElement('option');
+            option.value = row[valueField];
+            if (valueField !== 'label') option.label = row.label;
+            ids[row[valueField]] = row.id;
+            options.appendChild(option);
+          });
+          list.replaceChildren(options);
+          sync();
+        })
+        .catch(function (error) {
+          if (error.name !== 'AbortError') console.warn('Lookup failed', error);
+        });
+    }
+
+    input.addEventListener('input', function () {
+      sync();
+      clearTimeout(timer);
+      timer = setTimeout(search, DEBOUNCE_MS);
+    });
+    input.addEventListener('focus', function () {
+      if (!list.children.length) search();
+    }, { once: true });
+  }
+
+  document.querySelectorAll('input[data-lookup-url]').forEach(attach);
+})();
@@ -1,8 +1,47 @@
 import unittest
+import re
 import tempfile
 import os
 import sqlite3
-from app import app, init_db, get_db_connection, validate_phone, validate_email, validate_year, validate_cost
+import json
+import io
+import gzip
+import importlib.util
+import asyncio
+import threading
+from flask import Flask, url_for
+from flask.testing import FlaskClient
+import assets
+import instrumentation
+import metrics
+import subprocess
+import sys
+from write_behind import WriteBehindQueue
+from benchmarks.datagen import generate
+from benchmarks.runner import run_benchmarks, percentile
+from auth import PasswordHasher, HashingBusy, TokenBucketLimiter
+from cache import VersionedCache
+from migrations import migrate, schema_version, rebuild_service_rollups, MigrationDeferred, MIGRATIONS, SCHEMA_VERSION
+from models import workshop
+from repositories import CustomerRepository, CarRepository, ServiceRepository
+from commit_queue import CommitQueue, CommitTimeout
+from report_snapshot import ReportSnapshot
+from db_executor import DatabaseExecutor
+from asgi import WorkshopASGI
+from app import app, _template_fingerprint, write_queue, lookup_cache, password_hasher, login_user_limiter, login_ip_limiter, init_db, get_db_connection, get_db, fetch_keyset_page, _fts_available, services_fts_available, get_pool, get_commit_queue, get_report_snapshot, get_board_version, close_pool, add_admin_user, add_employee_user, validate_phone, validate_email, validate_year, validate_cost
+
+class BufferedClient(FlaskClient):
+    """Test client that reads and closes every response body, as a WSGI server would
+
+    Streamed pages hold their request context until closed; left unread,
+    they would be closed by the garbage collector in the middle of a later
+    request.
+    """
+
+    def open(self, *args, **kwargs):
+        kwargs.setdefault('buffered', True)
+        return super().open(*args, **kwargs)
+
 
 class WorkshopManagementTestCase(unittest.TestCase):
     """Test cases for the Workshop Management System"""
@@ -13,7 +52,9 @@ class WorkshopManagementTestCase(unittest.TestCase):
         self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
         app.config['TESTING'] = True
         app.config['WTF_CSRF_ENABLED'] = False
-        self.app = app.test_client()
+        self.app = BufferedClient(app, app.response_class)
+        login_user_limiter.reset()
+        login_ip_limiter.reset()
         
         # Initialize test database
         with app.app_context():
@@ -21,14 +62,17 @@ class WorkshopManagementTestCase(unittest.TestCase):
 
     def tearDown(self):
         """Clean up after each test"""
+        close_pool()
         os.close(self.db_fd)
         os.unlink(app.config['DATABASE'])
+        if os.path.exists(app.config['DATABASE'] + '.report'):
+            os.unlink(app.config['DATABASE'] + '.report')
 
     def test_home_page_redirect(self):
         """Test that home page redirects to login"""
         response = self.app.get('/')
         self.assertEqual(response.status_code, 302)  # Redirect
-        self.assertIn(b'login', response.location.lower())
+        self.assertIn('login', response.location.lower())
 
     def test_login_page_loads(self):
         """Test that login page loads correctly"""
@@ -98,5 +142,1447 @@ class WorkshopManagementTestCase(unittest.TestCase):
         response = self.app.get('/report', follow_redirects=True)
         self.assertIn(b'login', response.data)
 
+    def login_admin(self):
+        """Create the default admin user and log in as them"""
+        add_admin_user()
+        return self.app.post('/login', data={'username': 'admin', 'password': '2079'})
+
+    def seed_services(self, services):
+        """Insert one customer and car plus the given (type, cost, status, created_at) services"""
+        conn = get_db_connection()
+        conn.execute("INSERT INTO customers (name, phone) VALUES ('Test Customer', '1234567890')")
+        conn.execute("""
+            INSERT INTO cars (name, model, year, engine_type, customer_id)
+            VALUES ('Toyota', 'Corolla', 2020, 'Petrol', 1)
+        """)
+        conn.executemany(
+            "INSERT INTO services (type, cost, status, car_id, created_at) VALUES (?, ?, ?, 1, ?)",
+            services,
+        )
+        conn.commit()
+        conn.close()
+
+    def test_pooled_connection_uses_wal(self):
+        """Test that pooled connections are opened with WAL journaling"""
+        with app.app_context():
+            conn = get_db()
+            self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(conn.execute('PRAGMA synchronous').fetchone()[0], 1)  # NORMAL
+            self.assertIs(get_db(), conn)
+
+    def test_pool_reuses_connections_across_requests(self):
+        """Test that connections are returned to the pool and reused"""
+        with app.app_context():
+            first = get_db()
+        with app.app_context():
+            second = get_db()
+        self.assertIs(first, second)
+        stats = get_pool().stats()
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['open'], 1)
+        self.assertEqual(stats['in_use'], 0)
+
+    def test_db_stats_requires_admin(self):
+        """Test that pool statistics are only exposed to admins"""
+        response = self.app.get('/db_stats')
+        self.assertEqual(response.status_code, 302)
+        self.login_admin()
+        response = self.app.get('/db_stats')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('checkouts', response.get_json())
+
+    def test_customers_keyset_pagination(self):
+        """Test that customers are paged by (created_at, id) with next/previous links"""
+        conn = get_db_connection()
+        conn.executemany(
+            "INSERT INTO customers (name, phone, created_at) VALUES (?, ?, ?)",
+            [(f'Customer {i}', '1234567890', f'2024-01-0{i} 10:00:00') for i in range(1, 6)],
+        )
+        conn.commit()
+        conn.close()
+        self.login_admin()
+
+        with app.test_request_context('/customers?per_page=2'):
+            conn = get_db()
+            rows, pagination = fetch_keyset_page(conn.cursor(), "SELECT * FROM customers", [], [])
+            self.assertEqual([r['name'] for r in rows], ['Customer 5', 'Customer 4'])
+            self.assertIsNone(pagination['prev_url'])
+            next_url = pagination['next_url']
+
+        with app.test_request_context(next_url):
+            rows, pagination = fetch_keyset_page(get_db().cursor(), "SELECT * FROM customers", [], [])
+            self.assertEqual([r['name'] for r in rows], ['Customer 3', 'Customer 2'])
+            prev_url = pagination['prev_url']
+
+        with app.test_request_context(prev_url):
+            rows, pagination = fetch_keyset_page(get_db().cursor(), "SELECT * FROM customers", [], [])
+            self.assertEqual([r['name'] for r in rows], ['Customer 5', 'Customer 4'])
+            self.assertIsNone(pagination['prev_url'])
+
+        response = self.app.get(next_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Customer 3', response.data)
+        self.assertNotIn(b'Customer 5', response.data)
+
+    def test_report_export_streams_csv_with_filters(self):
+        """Test that the CSV export applies date/status filters and appends totals"""
+        self.seed_services([
+            ('Oil Change', 50.0, 'Completed', '2024-03-01 09:00:00'),
+            ('Brakes', 200.0, 'Completed', '2024-03-15 09:00:00'),
+            ('Tyres', 300.0, 'Pending', '2024-03-20 09:00:00'),
+            ('Battery', 120.0, 'Completed', '2024-04-02 09:00:00'),
+        ])
+        self.login_admin()
+        response = self.app.get('/report/export?format=csv&status=Completed&date_from=2024-03-01&date_to=2024-03-31')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/csv')
+        lines = response.get_data(as_text=True).strip().splitlines()
+        self.assertEqual(lines[0].split(',')[0], 'type')
+        self.assertEqual(len(lines), 4)  # header, two rows, totals
+        self.assertEqual(lines[-1], 'TOTAL,250.0,2 services')
+
+    def test_report_export_ndjson_summary(self):
+        """Test that the NDJSON export ends with a summary object"""
+        self.seed_services([
+            ('Oil Change', 50.0, 'Completed', '2024-03-01 09:00:00'),
+            ('Brakes', 25.5, 'Pending', '2024-03-02 09:00:00'),
+        ])
+        self.login_admin()
+        response = self.app.get('/report/export?format=ndjson')
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(lines[0]['type'], 'Brakes')
+        self.assertEqual(lines[-1]['summary'], {'total_services': 2, 'total_revenue': 75.5})
+
+    def test_report_export_rejects_bad_parameters(self):
+        """Test that unknown formats and malformed dates are rejected"""
+        self.login_admin()
+        self.assertEqual(self.app.get('/report/export?format=xml').status_code, 400)
+        self.assertEqual(self.app.get('/report/export?date_from=03/01/2024').status_code, 400)
+
+    def test_report_reads_snapshot_until_refreshed(self):
+        """Test that reports read the backup snapshot, show its time and only see writes after a refresh"""
+        self.seed_services([('Oil Change', 50.0, 'Completed', '2024-03-01 09:00:00')])
+        self.login_admin()
+        snapshot = get_report_snapshot()
+        self.assertTrue(snapshot.wait_ready(5))
+        response = self.app.get('/report')
+        self.assertIn(b'Figures as of', response.data)
+        self.assertIn(b'Oil Change', response.data)
+
+        conn = snapshot.connect()
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'delete')
+        conn.close()
+        self.assertFalse(snapshot.refresh())  # nothing changed
+
+        with app.app_context():
+            conn = get_db()
+            conn.execute("UPDATE services SET type = 'Timing Belt' WHERE id = 1")
+            conn.commit()
+        self.assertNotIn(b'Timing Belt', self.app.get('/report').data)
+        self.assertTrue(snapshot.refresh())
+        response = self.app.get('/report/export?format=ndjson')
+        self.assertIn('X-Report-As-Of', response.headers)
+        self.assertIn('Timing Belt', response.get_data(as_text=True))
+        stats = snapshot.stats()
+        self.assertEqual((stats['refreshes'], stats['skipped']), (2, 1))
+
+    def test_report_snapshot_follows_schema_changes(self):
+        """Test that a migration between refreshes is copied and a new snapshot object never serves an old file"""
+        self.login_admin()
+        snapshot = get_report_snapshot()
+        self.assertTrue(snapshot.wait_ready(5))
+        self.assertFalse(snapshot.refresh())
+
+        with app.app_context():
+            conn = get_db()
+            conn.execute("CREATE TABLE service_notes (id INTEGER PRIMARY KEY, service_id INTEGER, note TEXT)")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+            conn.commit()
+        self.assertTrue(snapshot.refresh())
+        conn = snapshot.connect()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM service_notes").fetchone()[0], 0)
+        conn.close()
+
+        # A fresh object (a restarted worker) copies once even though nothing changed
+        restarted = ReportSnapshot(get_db_connection, snapshot.path, version=get_board_version)
+        try:
+            restarted.start()
+            self.assertTrue(restarted.wait_ready(5))
+            restarted.connect().close()
+            self.assertEqual((restarted.stats()['refreshes'], restarted.stats()['skipped']), (1, 0))
+            self.assertFalse(restarted.refresh())
+        finally:
+            restarted.close()
+
+    def test_report_snapshot_primes_in_the_background(self):
+        """Test that no caller waits for the first copy; reports use the live database until it is ready"""
+        release = threading.Event()
+
+        def slow_source():
+            release.wait(5)
+            return get_db_connection()
+
+        path = app.config['DATABASE'] + '.primed'
+        snapshot = ReportSnapshot(slow_source, path, version=get_board_version)
+        try:
+            self.assertIsNone(snapshot.connect())
+            self.assertFalse(snapshot.stats()['ready'])
+            release.set()
+            self.assertTrue(snapshot.wait_ready(5))
+            conn = snapshot.connect()
+            self.assertIsNotNone(snapshot.as_of(conn))
+            conn.close()
+        finally:
+            release.set()
+            snapshot.close()
+            if os.path.exists(path):
+                os.unlink(path)
+
+        # A snapshot that cannot be written never becomes ready, and the page reads the live database
+        self.seed_services([('Oil Change', 50.0, 'Completed', '2024-03-01 09:00:00')])
+        self.login_admin()
+        close_pool()
+        app.config['REPORT_SNAPSHOT_PATH'] = os.path.join(path, 'missing', 'report.db')
+        try:
+            page = self.app.get('/report').data
+        finally:
+            app.config['REPORT_SNAPSHOT_PATH'] = ''
+        self.assertIn(b'Live figures.', page)
+        self.assertIn(b'Oil Change', page)
+
+    def test_service_rollups_track_writes(self):
+        """Test that the period rollups follow inserts, transitions and deletes and feed the report and API"""
+        self.seed_services([
+            ('Oil Change', 50.0, 'Completed', '2024-02-28 09:00:00'),
+            ('Oil Change', 40.0, 'Pending', '2024-03-04 09:00:00'),
+            ('Brakes', 200.0, 'Pending', '2024-03-06 09:00:00'),
+            ('Tyres', 300.0, 'Pending', '2024-03-10 09:00:00'),
+        ])
+        conn = get_db_connection()
+        services = ServiceRepository(conn)
+        services.update_status(2, 'Completed')
+        services.delete(4)
+        conn.commit()
+        periods, breakdown, truncated = services.rollups('week', date_from='2024-03-05', breakdown=True)
+        self.assertEqual([(row['period'], row['service_count'], row['revenue'], row['completed_revenue'])
+                          for row in periods], [('2024-03-04', 2, 240.0, 40.0)])
+        self.assertFalse(truncated)
+        self.assertEqual([tuple(row) for row in breakdown], [
+            ('2024-03-04', 'Completed', 'Oil Change', 1, 40.0),
+            ('2024-03-04', 'Pending', 'Brakes', 1, 200.0),
+        ])
+        monthly = {row['period']: row['revenue'] for row in services.rollups('month')[0]}
+        self.assertEqual(monthly, {'2024-02-01': 50.0, '2024-03-01': 240.0})
+        # The incremental rollups match a rebuild from scratch
+        before = conn.execute("SELECT * FROM service_rollup_daily").fetchall()
+        rebuild_service_rollups(conn.cursor())
+        self.assertEqual([tuple(row) for row in conn.execute("SELECT * FROM service_rollup_daily")],
+                         [tuple(row) for row in before])
+        conn.close()
+
+        self.login_admin()
+        response = self.app.get('/report?granularity=month&status=Completed')
+        self.assertIn(b'Month starting', response.data)
+        self.assertIn(b'2024-02-01', response.data)
+        self.assertIn(b'Please select a valid granularity.',
+                      self.app.get('/report?granularity=year', follow_redirects=True).data)
+
+        add_admin_user()
+        headers = {'Authorization': f"Bearer {self.api_tokens()['access_token']}"}
+        self.assertTrue(get_report_snapshot().wait_ready(5))
+        body = self.app.get('/api/v1/report/rollups?granularity=day&status=Completed', headers=headers).get_json()
+        self.assertEqual([(row['period'], row['revenue']) for row in body['periods']],
+                         [('2024-02-28', 50.0), ('2024-03-04', 40.0)])
+        self.assertIsNotNone(body['as_of'])
+        self.assertEqual(self.app.get('/api/v1/report/rollups?granularity=year', headers=headers).status_code, 400)
+
+    def test_report_names_a_truncated_range(self):
+        """Test that a dated range with more periods than the limit says so on the page and in the API"""
+        self.seed_services([(f'Job {day}', 10.0, 'Completed', f'2024-03-{day:02d} 09:00:00') for day in range(1, 6)])
+        self.login_admin()
+        add_admin_user()
+        headers = {'Authorization': f"Bearer {self.api_tokens()['access_token']}"}
+        limit = app.config['REPORT_ROLLUP_MAX_PERIODS']
+        app.config['REPORT_ROLLUP_MAX_PERIODS'] = 3
+        try:
+            page = self.app.get('/report?granularity=day&date_from=2024-03-01&date_to=2024-03-31').data
+            body = self.app.get('/api/v1/report/rollups?granularity=day&date_from=2024-03-01',
+                                headers=headers).get_json()
+            fitting = self.app.get('/report?granularity=week&date_from=2024-03-01&date_to=2024-03-31').data
+        finally:
+            app.config['REPORT_ROLLUP_MAX_PERIODS'] = limit
+        self.assertIn(b'range-truncated', page)
+        self.assertIn(b'only the latest 3, from 2024-03-03', page)
+        # The totals still cover the whole range
+        self.assertIn(b'Total: <strong>5</strong>', page)
+        self.assertTrue(body['truncated'])
+        self.assertEqual([row['period'] for row in body['periods']], ['2024-03-03', '2024-03-04', '2024-03-05'])
+        self.assertNotIn(b'range-truncated', fitting)
+
+    def test_report_defaults_to_latest_periods(self):
+        """Test that an undated report covers the latest periods and its totals match the listed rows"""
+        self.seed_services([(f'Job {month:02d}', 10.0, 'Completed' if month % 2 else 'Pending',
+                             f'{2023 + (month - 1) // 12}-{(month - 1) % 12 + 1:02d}-15 09:00:00')
+                            for month in range(1, 15)])
+        self.login_admin()
+        page = self.app.get('/report').data
+        self.assertIn(b'Showing the latest 12 months, from 2023-03-01', page)
+        self.assertNotIn(b'Job 02', page)
+        self.assertIn(b'Job 03', page)
+        self.assertIn(b'Total: <strong>12</strong>', page)
+        self.assertIn(b'Revenue: <strong>120.0$</strong>', page)
+
+        page = self.app.get('/report?status=Pending&date_from=2023-01-01&date_to=2023-03-31').data
+        self.assertNotIn(b'Showing the latest', page)
+        self.assertIn(b'Job 02', page)
+        self.assertIn(b'Total: <strong>1</strong>', page)
+        self.assertIn(b'Pending: <strong>1</strong>', page)
+        self.assertIn(b'Completed: <strong>0</strong>', page)
+
+    def test_report_page_streams_rows(self):
+        """Test that the report streams in chunks, totals the streamed rows and shows flashes exactly once"""
+        self.seed_services([(f'Service {i}', 10.5, 'Completed', f'2024-03-{i % 28 + 1:02d} 09:00:00')
+                            for i in range(200)])
+        self.login_admin()
+        with self.app.get('/report', buffered=False) as response:
+            chunks = list(response.response)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) >= app.config['STREAM_CHUNK_SIZE'] for chunk in chunks[:-1]))
+        page = b''.join(chunks)
+        self.assertEqual(page.count(b'<td>10.5$</td>'), 200)
+        self.assertIn(b'2100.0$', page)
+
+        self.assertIn(b'Please select a valid granularity.', self.app.get('/report?granularity=year').data)
+        self.assertNotIn(b'Please select a valid granularity.', self.app.get('/report').data)
+
+        app.config['STREAM_TEMPLATES'] = False
+        try:
+            with self.app.get('/report', buffered=False) as response:
+                self.assertEqual(len(list(response.response)), 1)
+        finally:
+            app.config['STREAM_TEMPLATES'] = True
+
+    def test_streamed_report_flags_a_database_error(self):
+        """Test that an error part-way through a streamed report marks the page incomplete"""
+        self.seed_services([(f'Service {i}', 10.0, 'Completed', f'2024-03-{i % 28 + 1:02d} 09:00:00')
+                            for i in range(150)])
+        self.login_admin()
+
+        class FailingCursor:
+            def __init__(self, cursor):
+                self.cursor = cursor
+                self.batches = 0
+
+            def fetchmany(self, size):
+                self.batches += 1
+                if self.batches > 1:
+                    raise sqlite3.OperationalError('disk I/O error')
+                return self.cursor.fetchmany(size)
+
+        report = ServiceRepository.report
+        ServiceRepository.report = lambda self, **filters: FailingCursor(report(self, **filters))
+        try:
+            page = self.app.get('/report').data
+        finally:
+            ServiceRepository.report = report
+        self.assertEqual(page.count(b'<td>10.0$</td>'), 100)
+        self.assertIn(b'stream-error', page)
+        self.assertNotIn(b'stream-error', self.app.get('/report').data)
+
+    def test_services_page_streams_with_pagination(self):
+        """Test that the streamed services list still links to the next and previous pages"""
+        self.seed_services([(f'Job {i}', 10.0, 'Pending', f'2024-03-0{i} 09:00:00') for i in range(1, 6)])
+        self.login_admin()
+        with self.app.get('/services?per_page=2', buffered=False) as response:
+            page = b''.join(response.response)
+        self.assertIn(b'Job 5', page)
+        self.assertIn(b'Job 4', page)
+        self.assertNotIn(b'Job 3', page)
+        self.assertNotIn(b'Previous', page)
+        next_url = re.search(rb'href="([^"]*after=[^"]*)"', page).group(1).decode().replace('&amp;', '&')
+
+        page = self.app.get(next_url).data
+        self.assertIn(b'Job 3', page)
+        self.assertIn(b'Job 2', page)
+        self.assertIn(b'Previous', page)
+        self.assertIn(b'Next', page)
+
+        page = self.app.get('/services?per_page=5').data
+        self.assertIn(b'Job 1', page)
+        self.assertNotIn(b'after=', page)
+
+    def test_service_summary_tracks_writes(self):
+        """Test that triggers keep the summary counters in step with the services table"""
+        self.seed_services([
+            ('Oil Change', 50.0, 'Pending', '2024-03-01 09:00:00'),
+            ('Brakes', 150.0, 'Pending', '2024-03-02 09:00:00'),
+        ])
+        conn = get_db_connection()
+        conn.execute("UPDATE services SET status = 'Completed' WHERE id = 1")
+        conn.execute("DELETE FROM services WHERE id = 2")
+        conn.commit()
+        summary = ServiceRepository(conn).summary()
+        conn.close()
+        self.assertEqual(summary['total_services'], 1)
+        self.assertEqual(summary['completed_services'], 1)
+        self.assertEqual(summary['pending_services'], 0)
+        self.assertEqual(summary['total_revenue'], 50.0)
+        self.assertEqual(summary['avg_service_cost'], 50.0)
+
+    def test_rebuild_summary_command_fixes_drift(self):
+        """Test that the rebuild command recomputes counters from scratch"""
+        self.seed_services([('Oil Change', 50.0, 'Completed', '2024-03-01 09:00:00')])
+        conn = get_db_connection()
+        conn.execute("UPDATE service_summary SET service_count = 7")
+        conn.commit()
+        conn.close()
+        result = app.test_cli_runner().invoke(args=['rebuild-summary'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('total_services: 28 -> 1', result.output)
+        result = app.test_cli_runner().invoke(args=['rebuild-summary'])
+        self.assertIn('no drift', result.output)
+
+    def test_service_search_uses_fts_prefix_and_ranking(self):
+        """Test that service search matches prefixes and ranks type matches first"""
+        self.seed_services([
+            ('Engine tune', 80.0, 'Pending', '2024-03-01 09:00:00'),
+            ('Brake pads', 120.0, 'Pending', '2024-03-02 09:00:00'),
+            ('Inspection', 40.0, 'Pending', '2024-03-03 09:00:00'),
+        ])
+        conn = get_db_connection()
+        conn.execute("UPDATE services SET description = 'check engine light' WHERE id = 3")
+        conn.execute("UPDATE services SET type = 'Brake discs' WHERE id = 2")
+        conn.commit()
+        conn.close()
+        self.login_admin()
+
+        response = self.app.get('/services?search=eng')
+        body = response.get_data(as_text=True)
+        self.assertIn('Engine tune', body)
+        self.assertIn('check engine light', body)
+        self.assertLess(body.index('Engine tune'), body.index('Inspection'))
+
+        response = self.app.get('/services?search=disc')
+        self.assertIn(b'Brake discs', response.data)
+        self.assertNotIn(b'Engine tune', response.data)
+        self.assertNotIn(b'Brake pads', self.app.get('/services?search=pads').data)
+
+    def test_service_search_falls_back_to_like(self):
+        """Test that search still works when the FTS5 index is unavailable"""
+        self.seed_services([('Engine tune', 80.0, 'Pending', '2024-03-01 09:00:00')])
+        self.login_admin()
+        _fts_available[app.config['DATABASE']] = False
+        try:
+            response = self.app.get('/services?search=ngine')
+        finally:
+            _fts_available.clear()
+        self.assertIn(b'Engine tune', response.data)
+
+    def test_bulk_import_json_resolves_references(self):
+        """Test that a JSON upload links rows by ref and reports per-row errors"""
+        document = {
+            'customers': [
+                {'ref': 'c1', 'name': 'Alice', 'phone': '555-123-4567'},
+                {'ref': 'c2', 'name': 'Bob', 'phone': '123'},
+            ],
+            'cars': [
+                {'ref': 'car1', 'name': 'Honda', 'model': 'Civic', 'year': 2019,
+                 'engine_type': 'Petrol', 'customer_ref': 'c1', 'license_plate': 'ABC123'},
+                {'name': 'Ford', 'model': 'Focus', 'year': 2019, 'engine_type': 'Petrol', 'customer_ref': 'c2'},
+            ],
+            'services': [
+                {'type': 'Oil Change', 'cost': 45, 'car_ref': 'car1', 'created_at': '2024-05-01'},
+                {'type': 'Brakes', 'cost': 150, 'status': 'Completed', 'license_plate': 'ABC123'},
+                {'type': 'Free check', 'cost': 0, 'car_ref': 'car1'},
+            ],
+        }
+        self.login_admin()
+        response = self.app.post('/import', data={
+            'file': (io.BytesIO(json.dumps(document).encode()), 'branch.json'),
+        }, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()
+        self.assertEqual(results['customers']['inserted'], 1)
+        self.assertEqual(results['customers']['errors'][0]['row'], 2)
+        self.assertEqual(results['cars']['inserted'], 1)
+        self.assertIn("Unknown customer_ref 'c2'", results['cars']['errors'][0]['error'])
+        self.assertEqual(results['services']['inserted'], 2)
+        self.assertEqual(results['services']['errors'][0]['row'], 3)
+
+        conn = get_db_connection()
+        rows = conn.execute("""
+            SELECT s.type, s.created_at, cu.name FROM services s
+            JOIN cars c ON s.car_id = c.id JOIN customers cu ON c.customer_id = cu.id
+            ORDER BY s.id
+        """).fetchall()
+        summary = ServiceRepository(conn).summary()
+        conn.close()
+        self.assertEqual([tuple(r) for r in rows], [
+            ('Oil Change', '2024-05-01 00:00:00', 'Alice'),
+            ('Brakes', rows[1]['created_at'], 'Alice'),
+        ])
+        self.assertEqual(summary['total_services'], 2)
+
+    def test_bulk_import_cli_csv_in_chunks(self):
+        """Test that the CLI imports a CSV file across several chunked transactions"""
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as f:
+            f.write('name,phone\n')
+            for i in range(25):
+                f.write(f'Customer {i},555-000-{i:04d}\n')
+        app.config['IMPORT_CHUNK_SIZE'] = 10
+        jobs = get_commit_queue().stats()['jobs']
+        try:
+            result = app.test_cli_runner().invoke(args=['import-data', path, '--kind', 'customers'])
+        finally:
+            app.config['IMPORT_CHUNK_SIZE'] = 5000
+            os.unlink(path)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('customers: 25 inserted, 0 rejected', result.output)
+        # One queued write per chunk
+        self.assertEqual(get_commit_queue().stats()['jobs'] - jobs, 3)
+        conn = get_db_connection()
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM customers').fetchone()[0], 25)
+        conn.close()
+
+    def api_tokens(self, username='admin', password='2079'):
+        """Log in through the JSON API and return the issued tokens"""
+        response = self.app.post('/api/v1/auth/login', json={'username': username, 'password': password})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_api_requires_token(self):
+        """Test that API list endpoints reject requests without a JWT"""
+        self.assertEqual(self.app.get('/api/v1/services').status_code, 401)
+        add_admin_user()
+        response = self.app.post('/api/v1/auth/login', json={'username': 'admin', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_api_services_paginated_with_field_selection(self):
+        """Test that the services API pages results and returns only the requested fields"""
+        self.seed_services([
+            ('Oil Change', 50.0, 'Completed', '2024-03-01 09:00:00'),
+            ('Brakes', 200.0, 'Pending', '2024-03-02 09:00:00'),
+            ('Tyres', 300.0, 'Cancelled', '2024-03-03 09:00:00'),
+        ])
+        add_admin_user()
+        headers = {'Authorization': f"Bearer {self.api_tokens()['access_token']}"}
+        response = self.app.get('/api/v1/services?per_page=2&fields=id,type,status', headers=headers)
+        body = response.get_json()
+        self.assertEqual(body['data'], [
+            {'id': 3, 'type': 'Tyres', 'status': 'Cancelled'},
+            {'id': 2, 'type': 'Brakes', 'status': 'Pending'},
+        ])
+        self.assertIsNone(body['prev'])
+        body = self.app.get(body['next'], headers=headers).get_json()
+        self.assertEqual([row['type'] for row in body['data']], ['Oil Change'])
+        self.assertIsNone(body['next'])
+
+        response = self.app.get('/api/v1/services?fields=password', headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_status_reports_outcome_per_service(self):
+        """Test that bulk start/complete moves only allowed services and reports each id's outcome"""
+        self.seed_services([
+            ('Oil Change', 50.0, 'Pending', '2024-03-01 09:00:00'),
+            ('Brakes', 200.0, 'In Progress', '2024-03-02 09:00:00'),
+            ('Tyres', 300.0, 'Cancelled', '2024-03-03 09:00:00'),
+            ('Battery', 120.0, 'Completed', '2024-03-04 09:00:00'),
+        ])
+        add_admin_user()
+        headers = {'Authorization': f"Bearer {self.api_tokens()['access_token']}"}
+        response = self.app.post('/api/v1/services/status', headers=headers,
+                                 json={'status': 'Completed', 'ids': [1, 2, 3, 4, 99, 2]})
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body['updated'], 2)
+        self.assertEqual([(r['id'], r['outcome'], r['previous_status']) for r in body['results']], [
+            (1, 'updated', 'Pending'),
+            (2, 'updated', 'In Progress'),
+            (3, 'not_allowed', 'Cancelled'),
+            (4, 'unchanged', 'Completed'),
+            (99, 'not_found', None),
+        ])
+        conn = get_db_connection()
+        rows = ServiceRepository(conn).get_many([1, 2, 3])
+        conn.close()
+        self.assertEqual([rows[i]['status'] for i in (1, 2, 3)], ['Completed', 'Completed', 'Cancelled'])
+        self.assertTrue(rows[1]['end_date'] and rows[2]['end_date'])
+        self.assertIsNone(rows[3]['end_date'])
+
+        for payload in ({'status': 'Cancelled', 'ids': [1]}, {'status': 'Completed', 'ids': []},
+                        {'status': 'Completed', 'ids': ['1']}):
+            self.assertEqual(self.app.post('/api/v1/services/status', headers=headers, json=payload).status_code, 400)
+
+        self.seed_services([('Wipers', 20.0, 'Pending', '2024-03-05 09:00:00')])
+        self.login_admin()
+        page = self.app.get('/services').data
+        self.assertIn(b'name="service_ids" value="5"', page)
+        self.assertNotIn(b'name="service_ids" value="1"', page)
+        response = self.app.post('/services/bulk_status', data={'status': 'In Progress', 'service_ids': ['5', '1']},
+                                 follow_redirects=True)
+        self.assertIn(b'1 service(s) started. Skipped: 1 not allowed from their current status.', response.data)
+        self.assertIn(b'Please select at least one service.',
+                      self.app.post('/services/bulk_status', data={'status': 'Completed'}, follow_redirects=True).data)
+
+    def test_api_applies_role_rules(self):
+        """Test that API users see the same data and permissions as the HTML views"""
+        self.seed_services([
+            ('Oil Change', 50.0, 'Completed', '2024-03-01 09:00:00'),
+            ('Tyres', 300.0, 'Cancelled', '2024-03-03 09:00:00'),
+        ])
+        add_employee_user()
+        tokens = self.api_tokens('sa05_e60', 'saif2079')
+        headers = {'Authorization': f"Bearer {tokens['access_token']}"}
+        body = self.app.get('/api/v1/services', headers=headers).get_json()
+        self.assertEqual([row['type'] for row in body['data']], ['Oil Change'])
+        self.assertEqual(self.app.get('/api/v1/report/summary', headers=headers).status_code, 403)
+
+        response = self.app.post('/api/v1/auth/refresh',
+                                 headers={'Authorization': f"Bearer {tokens['refresh_token']}"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access_token', response.get_json())
+
+        # A database failure is reported as a JSON error rather than an unhandled exception
+        conn = get_db_connection()
+        conn.execute("ALTER TABLE users RENAME TO users_moved")
+        conn.commit()
+        conn.close()
+        response = self.app.post('/api/v1/auth/refresh',
+                                 headers={'Authorization': f"Bearer {tokens['refresh_token']}"})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.get_json()['error'], 'Database error. Please try again.')
+
+    def test_api_report_summary_for_admin(self):
+        """Test that admins can read the KPI summary through the API"""
+        self.seed_services([('Oil Change', 50.0, 'Completed', '2024-03-01 09:00:00')])
+        add_admin_user()
+        headers = {'Authorization': f"Bearer {self.api_tokens()['access_token']}"}
+        body = self.app.get('/api/v1/report/summary', headers=headers).get_json()
+        self.assertEqual(body['completed_services'], 1)
+        self.assertEqual(body['total_revenue'], 50.0)
+
+    def test_conditional_get_returns_304_until_data_changes(self):
+        """Test that list pages answer 304 until their tables are written"""
+        self.login_admin()
+        response = self.app.get('/customers')
+        etag = response.headers['ETag']
+        self.assertEqual(response.headers['Cache-Control'], 'private, no-cache')
+
+        response = self.app.get('/customers', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+        # A different filter is a different representation
+        response = self.app.get('/customers?per_page=5', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+        conn = get_db_connection()
+        conn.execute("INSERT INTO customers (name, phone) VALUES ('New', '1234567890')")
+        conn.commit()
+        conn.close()
+        response = self.app.get('/customers', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_conditional_get_separates_roles_and_keeps_flashes(self):
+        """Test that admin and user variants never share validators and flashes are not swallowed"""
+        self.login_admin()
+        admin_etag = self.app.get('/services').headers['ETag']
+
+        add_employee_user()
+        self.app.get('/logout', follow_redirects=True)
+        self.app.post('/login', data={'username': 'sa05_e60', 'password': 'saif2079'})
+        response = self.app.get('/services', headers={'If-None-Match': admin_etag})
+        self.assertEqual(response.status_code, 200)
+        user_etag = response.headers['ETag']
+
+        self.app.post('/start_service/999')  # flashes 'Service not found.'
+        response = self.app.get('/services', headers={'If-None-Match': user_etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Service not found.', response.data)
+
+    @unittest.skipUnless(importlib.util.find_spec('PIL'), 'Pillow is required to build assets')
+    def test_build_assets_fingerprints_and_precompresses(self):
+        """Test that built assets resolve through url_for and are served immutable and precompressed"""
+        from PIL import Image
+        with tempfile.TemporaryDirectory() as static_folder:
+            Image.new('RGB', (1000, 500), 'orange').save(os.path.join(static_folder, 'bg.png'))
+            os.makedirs(os.path.join(static_folder, 'css'))
+            with open(os.path.join(static_folder, 'css', 'style.css'), 'w') as f:
+                f.write('body { color: red; }\n' * 50)
+
+            manifest = assets.build_assets(static_folder)
+            self.assertEqual([v['width'] for v in manifest['bg.png']['variants']], [640, 1000])
+            self.assertIn('webp', manifest['bg.png']['variants'][0])
+            for variant in manifest['bg.png']['variants']:
+                with Image.open(os.path.join(static_folder, variant['jpeg'])) as fallback:
+                    self.assertEqual((fallback.format, fallback.width), ('JPEG', variant['width']))
+            self.assertEqual(assets.load_manifest(static_folder), manifest)
+
+            site = Flask('assets_test', static_folder=static_folder, static_url_path='/static')
+            assets.init_app(site)
+            with site.test_request_context():
+                css_url = url_for('static', filename='css/style.css')
+                rules = site.jinja_env.globals['responsive_background']('body', 'bg.png')
+            self.assertRegex(css_url, r'^/static/dist/css/style\.[0-9a-f]{10}\.css$')
+            self.assertIn('@media (max-width: 640px)', rules)
+            self.assertIn('type("image/webp")', rules)
+            small_rule = next(rule for rule in rules.splitlines() if '640px' in rule)
+            self.assertRegex(small_rule, r'background-image: url\("/static/dist/bg-640\.[0-9a-f]{10}\.jpg"\);')
+            self.assertNotIn('.png', rules)
+
+            client = site.test_client()
+            response = client.get(css_url, headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(response.mimetype, 'text/css')
+            self.assertIn('immutable', response.headers['Cache-Control'])
+            self.assertEqual(gzip.decompress(response.data), b'body { color: red; }\n' * 50)
+            response.close()
+
+            response = client.get(css_url, headers={'Accept-Encoding': 'identity'})
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.assertIn('Accept-Encoding', response.headers['Vary'])
+            response.close()
+
+    def test_template_fingerprint_covers_asset_manifest(self):
+        """Test that rebuilding assets changes the fingerprint used in page ETags"""
+        static_folder = app.static_folder
+        with tempfile.TemporaryDirectory() as directory:
+            app.static_folder = directory
+            try:
+                before = _template_fingerprint()
+                os.makedirs(os.path.join(directory, assets.DIST_DIR))
+                with open(os.path.join(directory, assets.DIST_DIR, assets.MANIFEST_NAME), 'w') as f:
+                    json.dump({'js/typeahead.js': {'file': 'dist/js/typeahead.0123456789.js'}}, f)
+                self.assertNotEqual(_template_fingerprint(), before)
+            finally:
+                app.static_folder = static_folder
+
+    def test_templates_fall_back_to_original_backgrounds(self):
+        """Test that pages still reference the source images when no manifest is built"""
+        manifest = app.extensions['asset_manifest']
+        app.extensions['asset_manifest'] = {}
+        try:
+            response = self.app.get('/login')
+        finally:
+            app.extensions['asset_manifest'] = manifest
+        self.assertIn(b'url("/static/login-bg.png")', response.data)
+
+    def test_lookup_cache_invalidated_by_writes(self):
+        """Test that lookup results are cached until a write bumps the table version, even from another connection"""
+        self.login_admin()
+        self.app.post('/customers', data={'name': 'Alice Smith', 'phone': '1234567890'})
+        lookup_cache.clear()
+        before = lookup_cache.stats()
+
+        self.app.get('/lookup/customers?q=a')
+        response = self.app.get('/lookup/customers?q=A')
+        self.assertEqual([row['name'] for row in response.get_json()['data']], ['Alice Smith'])
+        stats = lookup_cache.stats()
+        self.assertEqual(stats['misses'] - before['misses'], 1)
+        self.assertEqual(stats['hits'] - before['hits'], 1)
+
+        # A write through a separate connection (as another worker would) invalidates the entry
+        conn = get_db_connection()
+        conn.execute("INSERT INTO customers (name, phone) VALUES ('Alan Jones', '0987654321')")
+        conn.commit()
+        conn.close()
+        response = self.app.get('/lookup/customers?q=a')
+        self.assertEqual([row['name'] for row in response.get_json()['data']], ['Alan Jones', 'Alice Smith'])
+        self.assertEqual(lookup_cache.stats()['stale'] - before['stale'], 1)
+
+        self.assertEqual(self.app.get('/db_stats').get_json()['lookup_cache']['entries'], 1)
+
+    def test_lookup_prefix_search(self):
+        """Test customer and car typeahead matching, escaping and limits"""
+        response = self.app.get('/lookup/customers?q=a')
+        self.assertEqual(response.status_code, 302)
+        self.login_admin()
+
+        conn = get_db_connection()
+        conn.executemany("INSERT INTO customers (name, phone) VALUES (?, ?)",
+                         [('Alice Smith', '5551234567'), ('Bob 100%', '5559876543'), ('Bobby', '7770000000')])
+        conn.executemany(
+            "INSERT INTO cars (name, model, year, engine_type, customer_id, license_plate) VALUES (?, ?, ?, ?, ?, ?)",
+            [('Toyota', 'Corolla', 2020, 'Petrol', 1, 'ABC-123'), ('Honda', 'Civic', 2019, 'Petrol', 2, None),
+             ('Ford', 'Focus', 2018, 'Diesel', 3, 'XYZ-9')])
+        conn.commit()
+        conn.close()
+
+        def names(url):
+            return [row['name'] for row in self.app.get(url).get_json()['data']]
+
+        self.assertEqual(names('/lookup/customers?q=bob'), ['Bob 100%', 'Bobby'])
+        self.assertEqual(names('/lookup/customers?q=Bob 100%25'), ['Bob 100%'])
+        self.assertEqual(names('/lookup/customers?q=Bob_'), [])
+        self.assertEqual(names('/lookup/customers?q=555'), ['Alice Smith', 'Bob 100%'])
+        self.assertEqual(names('/lookup/customers?limit=1'), ['Alice Smith'])
+        self.assertEqual(names('/lookup/cars?q=civ'), ['Honda'])
+        self.assertEqual(names('/lookup/cars?q=abc'), ['Toyota'])
+        self.assertEqual(names('/lookup/cars?q=bob'), ['Ford', 'Honda'])
+
+        car = self.app.get('/lookup/cars?q=toy').get_json()['data'][0]
+        self.assertEqual(car['label'], 'Alice Smith - Toyota Corolla (2020) [ABC-123]')
+        self.assertEqual(self.app.get('/lookup/users').status_code, 404)
+
+    def test_forms_do_not_embed_reference_lists(self):
+        """Test that the cars and services pages no longer grow with the customer and car tables"""
+        self.login_admin()
+        conn = get_db_connection()
+        conn.execute("INSERT INTO customers (name, phone) VALUES ('Hidden Customer', '1234567890')")
+        conn.execute("INSERT INTO cars (name, model, year, engine_type, customer_id) VALUES ('Hidden', 'Car', 2020, 'Petrol', 1)")
+        conn.commit()
+        conn.close()
+        for page in ('/cars', '/services'):
+            response = self.app.get(page)
+            self.assertIn(b'data-lookup-url', response.data)
+            self.assertNotIn(b'Hidden Customer', response.data.split(b'</form>')[0])
+
+    def test_versioned_cache_bounds(self):
+        """Test LRU eviction and that oversized results are not retained"""
+        cache = VersionedCache(max_entries=2, max_rows=3)
+        cache.get_or_load('a', {'t': 1}, lambda: [{'id': 1}])
+        cache.get_or_load('b', {'t': 1}, lambda: [{'id': 2}])
+        cache.get_or_load('a', {'t': 1}, lambda: self.fail('should be cached'))
+        cache.get_or_load('c', {'t': 1}, lambda: [{'id': 3}])  # evicts 'b'
+        rows = cache.get_or_load('big', {'t': 1}, lambda: [{'id': i} for i in range(4)])
+        self.assertEqual(len(rows), 4)
+        stats = cache.stats()
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['uncacheable'], 1)
+        self.assertEqual((stats['hits'], stats['misses']), (1, 4))
+
+    def test_login_rate_limited_per_username(self):
+        """Test that repeated attempts for one username are throttled before any hashing"""
+        add_admin_user()
+        for _ in range(app.config['LOGIN_RATE_USER_BURST']):
+            response = self.app.post('/login', data={'username': 'admin', 'password': 'wrong'})
+            self.assertEqual(response.status_code, 200)
+
+        operations = password_hasher.stats()['operations']
+        response = self.app.post('/login', data={'username': 'Admin', 'password': '2079'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+        self.assertIn(b'Too many login attempts', response.data)
+        self.assertEqual(password_hasher.stats()['operations'], operations)
+
+        # Other usernames are unaffected
+        add_employee_user()
+        response = self.app.post('/api/v1/auth/login', json={'username': 'sa05_e60', 'password': 'saif2079'})
+        self.assertEqual(response.status_code, 200)
+        response = self.app.post('/api/v1/auth/login', json={'username': 'admin', 'password': '2079'})
+        self.assertEqual(response.status_code, 429)
+
+    def test_successful_logins_are_not_throttled(self):
+        """Test that only failed password checks are charged to the login limits"""
+        add_admin_user()
+        limited = login_user_limiter.stats()['limited']
+        for _ in range(app.config['LOGIN_RATE_USER_BURST'] + 1):
+            response = self.app.post('/login', data={'username': 'admin', 'password': '2079'})
+            self.assertEqual(response.status_code, 302)
+            self.app.get('/logout')
+        for _ in range(app.config['LOGIN_RATE_USER_BURST'] + 1):
+            response = self.app.post('/api/v1/auth/login', json={'username': 'admin', 'password': '2079'})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(login_user_limiter.stats()['limited'], limited)
+
+    def test_logins_rejected_while_hashing_is_busy_are_not_charged(self):
+        """Test that a login turned away before its password is checked gives back its rate-limit token"""
+        add_admin_user()
+        limited = login_user_limiter.stats()['limited']
+
+        def busy(stored, password):
+            raise HashingBusy('no capacity')
+
+        password_hasher.verify = busy
+        try:
+            for _ in range(app.config['LOGIN_RATE_USER_BURST'] + 1):
+                self.assertEqual(self.app.post('/login', data={'username': 'admin', 'password': '2079'}).status_code, 503)
+                response = self.app.post('/api/v1/auth/login', json={'username': 'admin', 'password': '2079'})
+                self.assertEqual(response.status_code, 503)
+        finally:
+            del password_hasher.verify
+        self.assertEqual(login_user_limiter.stats()['limited'], limited)
+        self.assertEqual(self.app.post('/login', data={'username': 'admin', 'password': '2079'}).status_code, 302)
+
+    def test_token_bucket_refills(self):
+        """Test burst capacity and refill of the token bucket limiter"""
+        limiter = TokenBucketLimiter(capacity=2, refill_per_second=1000, max_keys=1)
+        self.assertEqual(limiter.consume('a'), 0)
+        self.assertEqual(limiter.consume('a'), 0)
+        limiter = TokenBucketLimiter(capacity=1, refill_per_second=0.5)
+        self.assertEqual(limiter.consume('a'), 0)
+        self.assertAlmostEqual(limiter.consume('a'), 2, delta=0.01)
+        self.assertEqual(limiter.consume('b'), 0)
+        self.assertEqual(limiter.stats()['limited'], 1)
+        limiter.refund('b')
+        self.assertEqual(limiter.consume('b'), 0)
+
+    def test_seed_users_not_rehashed(self):
+        """Test that seeding existing users skips password hashing"""
+        self.assertTrue(add_admin_user())
+        operations = password_hasher.stats()['operations']
+        self.assertTrue(add_admin_user())
+        self.assertEqual(password_hasher.stats()['operations'], operations)
+
+    def test_password_hasher_bounds_pending_work(self):
+        """Test that checks beyond the executor's capacity fail fast and timings are recorded"""
+        import threading
+        hasher = PasswordHasher(max_workers=1, max_pending=0, timeout=5)
+        started, release = threading.Event(), threading.Event()
+
+        def hold_worker():
+            started.set()
+            release.wait()
+
+        worker = threading.Thread(target=hasher._run, args=(hold_worker,))
+        worker.start()
+        started.wait()
+        try:
+            with self.assertRaises(HashingBusy):
+                hasher.verify('pbkdf2:sha256:1$salt$hash', 'password')
+        finally:
+            release.set()
+            worker.join()
+        self.assertTrue(hasher.verify(hasher.hash('secret'), 'secret'))
+        stats = hasher.stats()
+        self.assertEqual((stats['operations'], stats['rejected']), (3, 1))
+        hasher.shutdown()
+
+    def test_login_writes_are_queued_and_batched(self):
+        """Test that last_login and audit events are written by the write-behind queue, not the request"""
+        add_admin_user()
+        write_queue.flush()
+        written = write_queue.stats()['written']
+        # Hold off the background flusher so the queued state can be inspected
+        with write_queue._flush_lock:
+            self.app.post('/login', data={'username': 'admin', 'password': 'wrong'})
+            self.app.post('/login', data={'username': 'admin', 'password': '2079'})
+            self.app.post('/api/v1/auth/login', json={'username': 'admin', 'password': '2079'})
+
+            # Two successful logins coalesce into one last_login update
+            self.assertEqual(write_queue.stats()['pending'], 4)
+            conn = get_db_connection()
+            self.assertIsNone(conn.execute("SELECT last_login FROM users WHERE username = 'admin'").fetchone()[0])
+
+        write_queue.flush()
+        self.assertEqual(write_queue.stats()['written'] - written, 4)
+        self.assertIsNotNone(conn.execute("SELECT last_login FROM users WHERE username = 'admin'").fetchone()[0])
+        events = [(row['event'], row['detail']) for row in
+                  conn.execute("SELECT event, detail FROM audit_log ORDER BY id")]
+        conn.close()
+        self.assertEqual(events, [('login_failed', None), ('login', None), ('login', 'api')])
+
+    def test_write_behind_coalesces_and_retries(self):
+        """Test keyed coalescing, retry after a busy database, one reused connection and the final flush on close"""
+        conn = get_db_connection()
+        conn.execute("CREATE TABLE stamps (name TEXT PRIMARY KEY, seen TEXT)")
+        conn.execute("INSERT INTO stamps VALUES ('page', NULL)")
+        conn.commit()
+        conn.close()
+
+        connections = []
+
+        def connect():
+            connections.append(get_db_connection())
+            return connections[-1]
+
+        queue = WriteBehindQueue(connect, interval=60)
+        for seen in ('09:00', '09:01', '09:02'):
+            queue.put("UPDATE stamps SET seen = ? WHERE name = ?", (seen, 'page'), key=('stamp', 'page'))
+
+        blocker = get_db_connection()
+        blocker.execute("PRAGMA busy_timeout = 0")
+        blocker.execute("BEGIN IMMEDIATE")
+        queue.connect = lambda: sqlite3.connect(app.config['DATABASE'], timeout=0)
+        self.assertEqual(queue.flush(), 0)
+        blocker.rollback()
+        blocker.close()
+        queue.connect = connect
+
+        self.assertEqual(queue.flush(), 1)
+        queue.put("UPDATE stamps SET seen = ? WHERE name = ?", ('09:03', 'page'), key=('stamp', 'page'))
+        self.assertEqual(queue.flush(), 1)
+        queue.put("UPDATE stamps SET seen = ? WHERE name = ?", ('09:04', 'page'), key=('stamp', 'page'))
+        queue.close()
+        # Every flush after the failed one went through the same connection, closed with the queue
+        self.assertEqual(len(connections), 1)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            connections[0].execute("SELECT 1")
+        conn = get_db_connection()
+        self.assertEqual(conn.execute("SELECT seen FROM stamps").fetchone()[0], '09:04')
+        conn.close()
+        stats = queue.stats()
+        self.assertEqual((stats['written'], stats['coalesced'], stats['failures'], stats['pending']), (3, 2, 1, 0))
+
+    def test_benchmark_generator_and_runner(self):
+        """Test that the synthetic data is consistent and every benchmarked route can be timed"""
+        conn = get_db_connection()
+        counts = generate(conn, customers=20, cars_per_customer=2.0, services=200, days=30, seed=1)
+        self.assertEqual((counts['customers'], counts['services']), (20, 200))
+        self.assertGreaterEqual(counts['cars'], 20)
+        orphans = conn.execute("""
+            SELECT COUNT(*) FROM services s LEFT JOIN cars c ON s.car_id = c.id WHERE c.id IS NULL
+        """).fetchone()[0]
+        summary = ServiceRepository(conn).summary()
+        conn.close()
+        self.assertEqual(orphans, 0)
+        self.assertEqual(summary['total_services'], 200)
+
+        results = run_benchmarks(app, [('services', '/services'), ('report', '/report')],
+                                 clients=2, requests=6, warmup=1)
+        for result in results.values():
+            self.assertEqual(result['status_codes'], {'200': 6})
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertIn('rss_delta_kb', result)
+            self.assertIn('process_peak_rss_kb', result)
+        self.assertEqual(percentile([1, 2, 3, 4], 0.5), 2)
+        self.assertEqual(percentile([1, 2, 3, 4], 0.99), 4)
+
+    def test_server_timing_and_query_count_flag(self):
+        """Test that each response reports db/render/total time and chatty routes are flagged"""
+        self.login_admin()
+        response = self.app.get('/dashboard')
+        timing = response.headers['Server-Timing']
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ queries", render;dur=[\d.]+, total;dur=[\d.]+$')
+        self.assertNotRegex(timing, r'render;dur=0\.00,')
+        # Streamed pages send the header before rendering, so it covers the time to first byte
+        self.assertTrue(self.app.get('/services').headers['Server-Timing'].endswith('desc="to first byte"'))
+
+        limit = app.config['MAX_QUERIES_PER_REQUEST']
+        app.config['MAX_QUERIES_PER_REQUEST'] = 1
+        try:
+            with self.assertLogs('instrumentation', 'WARNING') as logs:
+                self.app.get('/services')
+        finally:
+            app.config['MAX_QUERIES_PER_REQUEST'] = limit
+        self.assertIn('(manage_services) issued', logs.output[0])
+        self.assertIn('manage_services', self.app.get('/db_stats').get_json()['routes_over_query_limit'])
+
+    def test_cursor_iteration_counts_as_db_time(self):
+        """Test that stepping a cursor with a for loop, as the exports do, is timed as db work"""
+        conn = sqlite3.connect(':memory:', factory=instrumentation.InstrumentedConnection)
+        stats = instrumentation.RequestStats()
+        token = instrumentation._current.set(stats)
+        try:
+            cursor = conn.execute("""
+                WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 20000)
+                SELECT i, printf('%08d', i) FROM n
+            """)
+            executed = stats.db_seconds
+            self.assertEqual(sum(1 for _ in cursor), 20000)
+        finally:
+            instrumentation._current.reset(token)
+            conn.close()
+        self.assertGreater(stats.db_seconds, executed)
+        self.assertEqual(stats.queries, 1)
+
+    def test_slow_query_log_normalizes_sql(self):
+        """Test that statements over the threshold are logged with literals stripped and the parameter count"""
+        threshold = instrumentation.slow_query_seconds
+        instrumentation.slow_query_seconds = 0
+        try:
+            conn = get_db_connection()
+            with self.assertLogs('instrumentation', 'WARNING') as logs:
+                conn.execute("SELECT  id FROM customers\n WHERE name = 'Bob' AND id > ?", (5,)).fetchall()
+            conn.close()
+        finally:
+            instrumentation.slow_query_seconds = threshold
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("1 params): SELECT id FROM customers WHERE name = ? AND id > ?", logs.output[0])
+
+    def test_metrics_endpoint_exposes_prometheus_text(self):
+        """Test request counters, latency histograms, pool, file size and row count metrics"""
+        self.seed_services([('Oil Change', 50, 'Pending', '2024-03-01 10:00:00')])
+        self.app.get('/login')
+        self.app.get('/login')
+        self.app.get('/no-such-page')
+        response = self.app.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        body = response.get_data(as_text=True)
+        self.assertRegex(body, r'workshop_http_requests_total\{endpoint="login",method="GET",status="200"\} [2-9]')
+        self.assertIn('workshop_http_requests_total{endpoint="unmatched",method="GET",status="404"}', body)
+        self.assertIn('# TYPE workshop_http_request_duration_seconds histogram', body)
+        self.assertRegex(body, r'workshop_http_request_duration_seconds_bucket\{endpoint="login",le="\+Inf"\} [2-9]')
+        self.assertIn('workshop_table_rows{table="services"} 1', body)
+        self.assertIn('workshop_table_rows{table="customers"} 1', body)
+        self.assertRegex(body, r'workshop_db_file_size_bytes\{file="db"\} [1-9]')
+        self.assertIn('workshop_db_pool_connections{state="in_use"} 1', body)
+        self.assertIn('workshop_http_requests_in_flight 1', body)
+
+        # Later scrapes only recount tables whose version moved, and never count services
+        statements = []
+        pool = get_pool()
+        conn = pool.acquire()
+        conn.set_trace_callback(statements.append)
+        pool.release(conn)
+        self.app.get('/metrics')
+        conn = get_db_connection()
+        conn.execute("INSERT INTO customers (name, phone) VALUES ('Second Customer', '1234567891')")
+        conn.commit()
+        conn.close()
+        body = self.app.get('/metrics').get_data(as_text=True)
+        self.assertIn('workshop_table_rows{table="customers"} 2', body)
+        counts = [sql for sql in statements if 'COUNT(*)' in sql]
+        self.assertEqual(counts, ['SELECT COUNT(*) FROM customers'])
+
+        app.config['METRICS_TOKEN'] = 'secret'
+        try:
+            self.assertEqual(self.app.get('/metrics').status_code, 401)
+            response = self.app.get('/metrics', headers={'Authorization': 'Bearer secret'})
+            self.assertEqual(response.status_code, 200)
+        finally:
+            app.config['METRICS_TOKEN'] = None
+        app.config['METRICS_REQUIRE_TOKEN'] = True
+        try:
+            self.assertEqual(self.app.get('/metrics').status_code, 403)
+        finally:
+            app.config['METRICS_REQUIRE_TOKEN'] = False
+
+    def test_metrics_work_without_fcntl(self):
+        """Test that metrics import and aggregate where fcntl is missing, as on Windows"""
+        saved = sys.modules.get('fcntl')
+        sys.modules['fcntl'] = None  # makes "import fcntl" raise ImportError
+        try:
+            spec = importlib.util.spec_from_file_location('metrics_without_fcntl', metrics.__file__)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        finally:
+            if saved is None:
+                del sys.modules['fcntl']
+            else:
+                sys.modules['fcntl'] = saved
+        self.assertIsNone(module.fcntl)
+        with tempfile.TemporaryDirectory() as directory:
+            registry = module.MetricsRegistry(directory)
+            registry.observe_request('dashboard', 'GET', 200, 0.01)
+            key = ('workshop_http_requests_total', (('endpoint', 'dashboard'), ('method', 'GET'), ('status', '200')))
+            self.assertEqual(registry.collect()['counters'][key], 1)
+            self.assertFalse(os.path.exists(os.path.join(directory, module.LOCK_FILE)))
+
+    def test_metrics_aggregate_across_processes(self):
+        """Test that counters and histograms sum over worker snapshots, including archived ones, and dead workers' gauges are dropped"""
+        finished = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                                  capture_output=True, text=True)
+        dead_pid = int(finished.stdout)
+        with tempfile.TemporaryDirectory() as directory:
+            other = metrics.MetricsRegistry(directory)
+            other.observe_request('dashboard', 'GET', 200, 0.02)
+            other.inc_in_flight(3)
+            snapshot = other.snapshot()
+            snapshot['pid'] = dead_pid
+            with open(os.path.join(directory, f'metrics-{dead_pid}.json'), 'w') as f:
+                json.dump(snapshot, f)
+
+            # A file left by an exited worker whose pid now belongs to this process
+            reused = other.snapshot()
+            reused['start'] = -1
+            with open(os.path.join(directory, f'metrics-{os.getpid()}--1.json'), 'w') as f:
+                json.dump(reused, f)
+
+            registry = metrics.MetricsRegistry(directory)
+            registry.observe_request('dashboard', 'GET', 200, 0.2)
+            registry.inc_in_flight(1)
+            collected = registry.collect()
+            # Exited workers are folded into the archive once and their files removed
+            names = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+            self.assertEqual(len(names), 2)
+            self.assertIn(metrics.ARCHIVE_FILE, names)
+            self.assertEqual(registry.collect()['counters'], collected['counters'])
+
+        key = ('workshop_http_requests_total', (('endpoint', 'dashboard'), ('method', 'GET'), ('status', '200')))
+        self.assertEqual(collected['counters'][key], 3)
+        buckets, total, count = collected['histograms'][('workshop_http_request_duration_seconds',
+                                                         (('endpoint', 'dashboard'),))]
+        self.assertEqual(count, 3)
+        self.assertAlmostEqual(total, 0.24)
+        self.assertEqual(buckets[metrics.LATENCY_BUCKETS.index(0.025)], 2)
+        self.assertEqual(collected['gauges'][('workshop_http_requests_in_flight', ())], 1)
+        self.assertEqual(collected['gauges'][('workshop_metrics_processes', ())], 1)
+
+    def test_migrations_track_user_version(self):
+        """Test that a current schema needs no migration work and a second run is a no-op"""
+        conn = get_db_connection()
+        self.assertEqual(schema_version(conn), SCHEMA_VERSION)
+        statements = []
+        conn.set_trace_callback(statements.append)
+        self.assertEqual(migrate(conn), [])
+        conn.set_trace_callback(None)
+        conn.close()
+        # Lines starting with "--" trace the pragma run inside the one SELECT
+        statements = [sql for sql in statements if not sql.startswith('--')]
+        self.assertEqual(len(statements), 1)
+        self.assertIn('pragma_user_version', statements[0])
+
+    def test_migrations_retry_a_deferred_step(self):
+        """Test that a step this SQLite build cannot run is left unapplied, skipped past and retried later"""
+        def no_fts5(cursor):
+            raise MigrationDeferred('no such module: fts5')
+
+        index = next(i for i, (version, _, _) in enumerate(MIGRATIONS) if version == 5)
+        fts_step = MIGRATIONS[index]
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            conn = sqlite3.connect(path)
+            MIGRATIONS[index] = (5, fts_step[1], no_fts5)
+            try:
+                self.assertEqual(migrate(conn), [version for version, _, _ in MIGRATIONS if version != 5])
+                self.assertEqual(migrate(conn), [])
+            finally:
+                MIGRATIONS[index] = fts_step
+            self.assertEqual(schema_version(conn), SCHEMA_VERSION)
+            self.assertEqual(conn.execute("SELECT version FROM deferred_migrations").fetchall(), [(5,)])
+            self.assertIsNone(conn.execute("SELECT name FROM sqlite_master WHERE name = 'services_fts'").fetchone())
+
+            self.assertEqual(migrate(conn), [5])
+            self.assertIsNotNone(conn.execute("SELECT name FROM sqlite_master WHERE name = 'services_fts'").fetchone())
+            self.assertIsNone(conn.execute("SELECT name FROM sqlite_master WHERE name = 'deferred_migrations'").fetchone())
+            self.assertEqual(migrate(conn), [])
+            conn.close()
+        finally:
+            os.unlink(path)
+
+    def test_fts_probe_only_caches_a_missing_index(self):
+        """Test that a transient error while probing the search index is not remembered"""
+        class FailingCursor:
+            def __init__(self, message):
+                self.message = message
+
+            def execute(self, sql):
+                raise sqlite3.OperationalError(self.message)
+
+        _fts_available.clear()
+        with app.app_context():
+            self.assertFalse(services_fts_available(FailingCursor('database is locked')))
+            self.assertNotIn(app.config['DATABASE'], _fts_available)
+            self.assertTrue(services_fts_available(get_db().cursor()))
+            _fts_available.clear()
+            self.assertFalse(services_fts_available(FailingCursor('no such table: services_fts')))
+            self.assertFalse(services_fts_available(get_db().cursor()))
+        _fts_available.clear()
+
+    def test_migrations_upgrade_legacy_database(self):
+        """Test that a database built by the old models schema is upgraded in place"""
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            conn = sqlite3.connect(path)
+            conn.executescript('''
+                CREATE TABLE customers (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, phone TEXT,
+                                        created_at TEXT DEFAULT CURRENT_TIMESTAMP);
+                CREATE TABLE cars (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, model TEXT, year INTEGER,
+                                   engine_type TEXT, customer_id INTEGER, created_at TEXT DEFAULT CURRENT_TIMESTAMP);
+                CREATE TABLE services (id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT, cost REAL, status TEXT,
+                                       car_id INTEGER, created_at TEXT DEFAULT CURRENT_TIMESTAMP);
+                INSERT INTO customers (name, phone, created_at) VALUES ('Ann', '555-0100', '2024-01-01 09:00:00');
+                INSERT INTO cars (name, model, year, engine_type, customer_id) VALUES ('Ford', 'Focus', 2015, 'Petrol', 1);
+                INSERT INTO services (type, cost, status, car_id, created_at)
+                VALUES ('Oil Change', 40.0, 'Completed', 1, '2024-01-02 09:00:00');
+            ''')
+            conn.commit()
+            self.assertEqual(migrate(conn), [version for version, _, _ in MIGRATIONS])
+            self.assertEqual(schema_version(conn), SCHEMA_VERSION)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(services)")]
+            self.assertIn('updated_at', columns)
+            self.assertEqual(conn.execute("SELECT updated_at FROM services").fetchone()[0], '2024-01-02 09:00:00')
+            self.assertEqual(conn.execute("SELECT service_count FROM service_summary WHERE status = 'Completed'")
+                             .fetchone()[0], 1)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM users").fetchone()[0], 0)
+            conn.close()
+
+            workshop.init_db(path)
+            self.assertEqual(len(workshop.get_all_customers(path)), 1)
+        finally:
+            os.unlink(path)
+
+    def test_repositories_batch_operations(self):
+        """Test batched inserts, id-list reads and status updates through the repositories"""
+        conn = get_db_connection()
+        customers = CustomerRepository(conn)
+        customer_id = customers.insert(name='Ann', phone='555-0100', email='', address='')
+        cars = CarRepository(conn)
+        car_id = cars.insert(name='Ford', model='Focus', year=2015, engine_type='Petrol', customer_id=customer_id)
+        services = ServiceRepository(conn)
+        stamp = '2024-03-01 09:00:00'
+        self.assertEqual(services.insert_many([
+            ('Oil Change', 40.0, status, car_id, '', stamp, None, stamp, stamp)
+            for status in ('Pending', 'In Progress', 'Completed')
+        ]), 3)
+        conn.commit()
+
+        statements = []
+        conn.set_trace_callback(statements.append)
+        rows = services.get_many([1, 2, 3, 99])
+        services.get_many([1])
+        conn.set_trace_callback(None)
+        self.assertEqual(sorted(rows), [1, 2, 3])
+        self.assertEqual(len(statements), 2)
+
+        self.assertEqual(services.update_status_many([1, 2, 3, 99], 'Completed'), {1, 2})
+        self.assertFalse(services.update_status(3, 'In Progress'))
+        conn.commit()
+        rows = services.get_many([1, 2, 3])
+        self.assertTrue(all(row['status'] == 'Completed' for row in rows.values()))
+        self.assertIsNotNone(rows[1]['end_date'])
+        self.assertIsNone(rows[3]['end_date'])
+        self.assertEqual(cars.service_count(car_id), 3)
+        self.assertEqual(customers.car_count(customer_id), 1)
+        conn.close()
+
+    def test_database_executor_reads_and_writes(self):
+        """Test that writes commit on the single writer thread and failed writes roll back"""
+        executor = DatabaseExecutor(get_db_connection, readers=2)
+        try:
+            insert = lambda conn, name: CustomerRepository(conn).insert(name=name, phone='555-0100', email='', address='')
+            executor.write(insert, 'Ann').result()
+
+            def failing(conn):
+                insert(conn, 'Bob')
+                raise sqlite3.IntegrityError('rejected')
+            with self.assertRaises(sqlite3.IntegrityError):
+                executor.write(failing).result()
+
+            count = lambda conn: conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+            self.assertEqual(asyncio.run(executor.aread(count)), 1)
+            stats = executor.stats()
+            self.assertEqual((stats['writes'], stats['reads'], stats['failures']), (2, 1, 1))
+        finally:
+            executor.shutdown()
+
+    def test_commit_queue_groups_writes(self):
+        """Test that queued writes share one commit and a failing write rolls back alone"""
+        queue = CommitQueue(get_db_connection, max_batch=16, max_delay=0.05)
+        try:
+            insert = lambda conn, name: CustomerRepository(conn).insert(name=name, phone='555-0100', email='', address='')
+
+            def failing(conn):
+                insert(conn, 'Bob')
+                raise sqlite3.IntegrityError('rejected')
+
+            futures = [queue.submit(insert, f'Customer {i}') for i in range(5)]
+            futures.insert(2, queue.submit(failing))
+            with self.assertRaises(sqlite3.IntegrityError):
+                futures[2].result(5)
+            ids = [future.result(5) for i, future in enumerate(futures) if i != 2]
+            self.assertEqual(len(set(ids)), 5)
+
+            conn = get_db_connection()
+            names = [row['name'] for row in conn.execute("SELECT name FROM customers ORDER BY id")]
+            conn.close()
+            self.assertEqual(names, [f'Customer {i}' for i in range(5)])
+            stats = queue.stats()
+            self.assertEqual((stats['jobs'], stats['failed_jobs'], stats['batches']), (6, 1, 1))
+        finally:
+            queue.close()
+
+    def test_commit_queue_withdraws_timed_out_writes(self):
+        """Test that a write still waiting when its caller times out is never applied"""
+        queue = CommitQueue(get_db_connection, max_delay=0, timeout=0.05)
+        started, release = threading.Event(), threading.Event()
+        def block(conn):
+            started.set()
+            return release.wait(5)
+        try:
+            blocker = queue.submit(block)
+            started.wait(5)
+            with self.assertRaises(CommitTimeout):
+                queue.execute(lambda conn: CustomerRepository(conn).insert(name='Late', phone='555-0100',
+                                                                           email='', address=''))
+            release.set()
+            self.assertTrue(blocker.result(5))
+        finally:
+            queue.close()
+        conn = get_db_connection()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0], 0)
+        conn.close()
+
+    def test_commit_queues_in_several_processes_share_the_database(self):
+        """Test that per-process commit queues in concurrent workers all commit, waiting on busy_timeout"""
+        script = """
+import sys, time
+from commit_queue import CommitQueue
+from database import connect
+from repositories import CustomerRepository
+
+path, worker = sys.argv[1], sys.argv[2]
+queue = CommitQueue(lambda: connect(path, busy_timeout_ms=30000), max_delay=0.001)
+
+def insert(conn, i):
+    CustomerRepository(conn).insert(name=f'Worker {worker} {i}', phone='555-0100', email='', address='')
+    if i % 10 == 0:
+        time.sleep(0.01)  # hold the write lock so the other workers have to wait for it
+
+futures = [queue.submit(insert, i) for i in range(100)]
+for future in futures:
+    future.result()
+queue.close()
+"""
+        workers = [subprocess.Popen([sys.executable, '-c', script, app.config['DATABASE'], str(worker)],
+                                    cwd=os.path.dirname(os.path.abspath(__file__)),
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                   for worker in range(4)]
+        for worker in workers:
+            _, stderr = worker.communicate(timeout=60)
+            self.assertEqual(worker.returncode, 0, stderr)
+        conn = get_db_connection()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0], 400)
+        conn.close()
+
+    def test_asgi_status_board_long_poll(self):
+        """Test that the ASGI status board authenticates, answers at once and long-polls until a change"""
+        self.seed_services([('Oil Change', 50.0, 'Pending', '2024-03-01 09:00:00')])
+        forwarded = []
+
+        async def wsgi(scope, receive, send):
+            forwarded.append(scope['path'])
+
+        app.config['STATUS_BOARD_POLL_INTERVAL'] = 0.05
+        executor = DatabaseExecutor(get_db_connection, readers=2)
+        application = WorkshopASGI(app, executor, wsgi=wsgi)
+        cookie = app.session_interface.get_signing_serializer(app).dumps({'username': 'admin', 'role': 'admin'})
+        headers = [(b'cookie', f"{app.config['SESSION_COOKIE_NAME']}={cookie}".encode())]
+
+        async def call(path, query=b'', headers=headers):
+            messages = []
+            async def send(message):
+                messages.append(message)
+            scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query, 'headers': headers}
+            await application(scope, None, send)
+            if not messages:
+                return None, None
+            return messages[0]['status'], json.loads(messages[1]['body']) if len(messages) > 1 else None
+
+        def complete(conn):
+            ServiceRepository(conn).update_status_many([1], 'Completed')
+
+        async def scenario():
+            self.assertEqual((await call('/status_board', headers=[]))[0], 401)
+            status, board = await call('/status_board')
+            self.assertEqual(status, 200)
+            self.assertEqual([s['type'] for s in board['services']['Pending']], ['Oil Change'])
+            version = board['version']
+
+            poll = asyncio.create_task(call('/status_board', f'since={version}'.encode()))
+            await asyncio.sleep(0.1)
+            self.assertFalse(poll.done())
+            await executor.awrite(complete)
+            status, changed = await asyncio.wait_for(poll, 5)
+            self.assertGreater(changed['version'], version)
+            self.assertEqual(changed['services']['Pending'], [])
+            self.assertEqual(changed['summary']['completed_services'], 1)
+
+            await call('/dashboard')
+
+        try:
+            asyncio.run(scenario())
+        finally:
+            app.config['STATUS_BOARD_POLL_INTERVAL'] = 1.0
+            executor.shutdown()
+        self.assertEqual(forwarded, ['/dashboard'])
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
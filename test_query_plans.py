@@ -0,0 +1,250 @@
+import re
+import unittest
+import tempfile
+import os
+import random
+from flask.testing import FlaskClient
+from app import app, login_user_limiter, login_ip_limiter, init_db, get_db_connection, get_pool, get_commit_queue, get_report_snapshot, close_pool, add_admin_user, add_employee_user, issue_tokens
+
+# Routes exercised as an admin and as a regular user; every SELECT they issue is checked
+ADMIN_ROUTES = [
+    '/customers',
+    '/customers?per_page=10',
+    '/cars',
+    '/services',
+    '/services?status_filter=Pending',
+    '/services?customer_filter=Customer+5',
+    '/services?customer_filter=Customer+5&status_filter=Completed',
+    '/services?search=brake',
+    '/services?search=brake&status_filter=Pending',
+    '/report',
+    '/report?status=Completed',
+    '/report?date_from=2024-03-01&date_to=2024-03-10',
+    '/report?status=Pending&date_from=2024-03-01',
+    '/report?granularity=day&date_from=2024-03-01&date_to=2024-03-10',
+    '/report?granularity=week&status=Completed&date_from=2024-02-01',
+    '/report/export?format=csv&status=Completed',
+    '/dashboard',
+    '/lookup/customers?q=cust',
+    '/lookup/customers?q=123',
+    '/lookup/customers',
+    '/lookup/cars?q=mod',
+    '/lookup/cars',
+    '/status_board',
+]
+
+# JSON API routes exercised with an admin access token
+ADMIN_API_ROUTES = [
+    '/api/v1/report/rollups?granularity=week&status=Completed&date_from=2024-02-01',
+    '/api/v1/report/rollups?granularity=day&date_to=2024-03-31',
+]
+
+USER_ROUTES = [
+    '/services',
+    '/services?status_filter=In+Progress',
+    '/dashboard',
+]
+
+# Tables whose size is fixed by the schema, not by the data, and may be scanned in full
+CONSTANT_SIZE_TABLES = {'service_summary', 'table_versions'}
+
+# A temp B-tree sort is only acceptable over rows already narrowed by an index
+# search: one customer's services, the FTS matches being ordered by bm25, the
+# union of LIMIT-ed index range scans behind the typeahead lookups, or the single
+# page of ids picked for an empty typeahead term
+BOUNDED_SORT_MARKERS = ('services_fts MATCH', 'cu.name =', ' UNION ', 'COLLATE NOCASE LIMIT')
+
+
+class BufferedClient(FlaskClient):
+    """Test client that reads and closes every response body, as a WSGI server would
+
+    Streamed pages hold their request context until closed; left unread,
+    they would be closed by the garbage collector in the middle of a later
+    request.
+    """
+
+    def open(self, *args, **kwargs):
+        kwargs.setdefault('buffered', True)
+        return super().open(*args, **kwargs)
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    """Regression suite for the query plans of the SQL issued by the views"""
+
+    def setUp(self):
+        """Create a seeded database and trace every statement the app runs"""
+        self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
+        app.config['TESTING'] = True
+        with app.app_context():
+            init_db()
+        add_admin_user()
+        add_employee_user()
+        self.seed()
+        # Seeding the users opened the commit queue; start afresh so its connection is traced too
+        close_pool()
+
+        # Route all requests through one traced pooled connection
+        self.statements = []
+        pool = get_pool()
+        conn = pool.acquire()
+        conn.set_trace_callback(self.statements.append)
+        pool.release(conn)
+        # Form writes run on the commit queue's own connection
+        queue = get_commit_queue()
+        connect = queue.connect
+        def traced_connect():
+            conn = connect()
+            conn.set_trace_callback(self.statements.append)
+            return conn
+        queue.connect = traced_connect
+        # Reports read the snapshot, which has the same schema and indexes plus its own metadata row
+        snapshot = get_report_snapshot()
+        snapshot_connect = snapshot.connect
+        def traced_snapshot(**kwargs):
+            conn = snapshot_connect(**kwargs)
+            if conn is not None:
+                conn.set_trace_callback(
+                    lambda sql: snapshot.META_TABLE in sql or self.statements.append(sql))
+            return conn
+        snapshot.connect = traced_snapshot
+        self.app = BufferedClient(app, app.response_class)
+        login_user_limiter.reset()
+        login_ip_limiter.reset()
+
+    def tearDown(self):
+        """Clean up after each test"""
+        close_pool()
+        os.close(self.db_fd)
+        os.unlink(app.config['DATABASE'])
+        if os.path.exists(app.config['DATABASE'] + '.report'):
+            os.unlink(app.config['DATABASE'] + '.report')
+
+    def seed(self):
+        """Insert enough rows that the planner prefers indexes over scans"""
+        rng = random.Random(42)
+        conn = get_db_connection()
+        conn.executemany(
+            "INSERT INTO customers (name, phone, created_at) VALUES (?, ?, ?)",
+            [(f'Customer {i}', '1234567890', f'2024-01-{i % 28 + 1:02d} 10:{i % 60:02d}:00')
+             for i in range(500)],
+        )
+        conn.executemany(
+            "INSERT INTO cars (name, model, year, engine_type, customer_id, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(f'Make {i % 20}', f'Model {i % 7}', 2020, 'Petrol', i % 500 + 1, f'2024-02-{i % 28 + 1:02d} 09:00:00')
+             for i in range(1000)],
+        )
+        conn.executemany(
+            "INSERT INTO services (type, cost, status, car_id, description, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(rng.choice(['Oil Change', 'Brake Pads', 'Tyre Rotation']), rng.randint(20, 500),
+              rng.choice(['Pending', 'In Progress', 'Completed', 'Cancelled']), i % 1000 + 1,
+              'routine work', f'2024-03-{i % 28 + 1:02d} {i % 24:02d}:00:00')
+             for i in range(5000)],
+        )
+        conn.commit()
+        conn.execute('ANALYZE')
+        conn.close()
+
+    def login(self, username, password):
+        response = self.app.post('/login', data={'username': username, 'password': password})
+        self.assertEqual(response.status_code, 302)
+
+    def traced_selects(self):
+        """Return the distinct application SELECTs traced so far"""
+        selects = []
+        for statement in self.statements:
+            sql = ' '.join(statement.split())
+            # Skip FTS5's own shadow-table statements
+            if not sql.upper().startswith('SELECT') or "'main'." in sql or sql in selects:
+                continue
+            selects.append(sql)
+        return selects
+
+    def plan_problems(self, conn, sql):
+        """Return the plan steps that are unbounded scans or unbounded temp B-tree sorts
+
+        Walking an index is still a scan: it is only acceptable when the
+        statement has a LIMIT and the scanned rows reach it in index order,
+        without a sort at the same level, or when the table is constant-size.
+        Everything else must be an index SEARCH.
+        """
+        problems = []
+        plan = [(row[1], row[3]) for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+        sorted_levels = {parent for parent, detail in plan if detail.startswith('USE TEMP B-TREE FOR ORDER BY')}
+        has_limit = re.search(r'\bLIMIT\b', sql) is not None
+        for parent, detail in plan:
+            # Scanning a co-routine's output is fine; its own steps are checked separately
+            if detail.startswith('SCAN (subquery-'):
+                continue
+            if detail.startswith('SCAN ') and 'VIRTUAL TABLE' not in detail:
+                bounded = has_limit and parent not in sorted_levels
+                if detail.split()[1] not in CONSTANT_SIZE_TABLES and not bounded:
+                    problems.append(detail)
+            if 'USE TEMP B-TREE' in detail and not any(marker in sql for marker in BOUNDED_SORT_MARKERS):
+                problems.append(detail)
+        return problems
+
+    def assert_plans(self, routes, headers=None):
+        for route in routes:
+            response = self.app.get(route, headers=headers)
+            self.assertEqual(response.status_code, 200, route)
+
+        selects = self.traced_selects()
+        self.assertTrue(selects)
+        conn = get_db_connection()
+        try:
+            for sql in selects:
+                with self.subTest(sql=sql[:120]):
+                    self.assertEqual(self.plan_problems(conn, sql), [])
+        finally:
+            conn.close()
+
+    def test_admin_query_plans(self):
+        """Test that admin pages use indexes for filtering and ordering"""
+        self.login('admin', '2079')
+        self.assert_plans(ADMIN_ROUTES)
+
+    def test_admin_api_query_plans(self):
+        """Test that admin API endpoints use indexes for filtering and ordering"""
+        with app.app_context():
+            token = issue_tokens({'id': 1, 'username': 'admin', 'role': 'admin'})['access_token']
+        self.assert_plans(ADMIN_API_ROUTES, headers={'Authorization': f'Bearer {token}'})
+
+    def test_user_query_plans(self):
+        """Test that the non-admin services view uses indexes"""
+        self.login('sa05_e60', 'saif2079')
+        self.assert_plans(USER_ROUTES)
+
+    def test_plan_check_rejects_unbounded_scans(self):
+        """Test that index walks and growing rollup tables only pass when LIMIT bounds them"""
+        conn = get_db_connection()
+        try:
+            for sql in ("SELECT id FROM customers ORDER BY name COLLATE NOCASE",
+                        "SELECT period, revenue FROM service_rollup_daily",
+                        "SELECT id FROM cars ORDER BY name COLLATE NOCASE, model LIMIT 10"):
+                with self.subTest(sql=sql):
+                    self.assertNotEqual(self.plan_problems(conn, sql), [])
+            for sql in ("SELECT id FROM customers ORDER BY name COLLATE NOCASE LIMIT 10",
+                        "SELECT status, service_count FROM service_summary"):
+                with self.subTest(sql=sql):
+                    self.assertEqual(self.plan_problems(conn, sql), [])
+        finally:
+            conn.close()
+
+    def test_delete_checks_use_indexes(self):
+        """Test that the existence checks before deletes are index lookups"""
+        self.login('admin', '2079')
+        self.app.post('/delete_customer/5')
+        self.app.post('/delete_car/5')
+        self.app.post('/start_service/5')
+        selects = self.traced_selects()
+        self.assertTrue(any('FROM cars WHERE customer_id' in sql for sql in selects))
+        conn = get_db_connection()
+        try:
+            for sql in selects:
+                with self.subTest(sql=sql[:120]):
+                    self.assertEqual(self.plan_problems(conn, sql), [])
+        finally:
+            conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import re
+from datetime import datetime
+
+SERVICE_STATUSES = ['Pending', 'In Progress', 'Completed', 'Cancelled']
+
+def validate_phone(phone):
+    """Validate phone number format"""
+    phone_pattern = re.compile(r'^\+?[\d\s\-\(\)]{10,}$')
+    return bool(phone_pattern.match(phone))
+
+def validate_email(email):
+    """Validate email format"""
+    email_pattern = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+    return bool(email_pattern.match(email))
+
+def validate_year(year):
+    """Validate year (must be reasonable for a car)"""
+    try:
+        year_int = int(year)
+        return 1900 <= year_int <= datetime.now().year + 1
+    except (ValueError, TypeError):
+        return False
+
+def validate_cost(cost):
+    """Validate cost (must be positive number)"""
+    try:
+        cost_float = float(cost)
+        return cost_float > 0
+    except (ValueError, TypeError):
+        return False
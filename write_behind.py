@@ -0,0 +1,165 @@
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """Background queue for low-priority writes, flushed in batched transactions
+
+    Writes that nothing reads back immediately (last-login stamps, audit
+    events) are queued instead of committed in the request. A daemon thread
+    flushes them every ``interval`` seconds, or sooner once ``max_batch``
+    writes are pending, in a single transaction on one connection that it
+    keeps open between flushes.
+
+    Writes sharing a ``key`` are coalesced so only the latest is written.
+    Writes without a key are kept in order.
+    """
+
+    def __init__(self, connect, interval=1.0, max_batch=500, max_pending=10000):
+        self.connect = connect
+        self.interval = interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self._pending = OrderedDict()
+        self._sequence = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.RLock()
+        self._conn = None
+        self._thread = None
+        self._stopping = False
+        self._enqueued = 0
+        self._coalesced = 0
+        self._written = 0
+        self._dropped = 0
+        self._flushes = 0
+        self._failures = 0
+
+    def put(self, sql, params=(), key=None):
+        """Queue a write; a later write with the same ``key`` replaces this one"""
+        with self._cond:
+            if key is None:
+                self._sequence += 1
+                key = ('_seq', self._sequence)
+            elif key in self._pending:
+                self._coalesced += 1
+                del self._pending[key]
+            self._pending[key] = (sql, tuple(params))
+            self._added()
+
+    def _added(self):
+        self._enqueued += 1
+        while len(self._pending) > self.max_pending:
+            self._pending.popitem(last=False)
+            self._dropped += 1
+            logger.warning("Write-behind queue full; dropped the oldest pending write")
+        if len(self._pending) >= self.max_batch:
+            self._cond.notify()
+        self._ensure_started()
+
+    def _ensure_started(self):
+        if self._thread is None and not self._stopping:
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._pending) < self.max_batch:
+                    self._cond.wait(self.interval)
+                if self._stopping:
+                    return
+            self.flush()
+
+    def flush(self):
+        """Write everything pending now in one transaction; return the number of writes applied"""
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, OrderedDict()
+            if not batch:
+                return 0
+
+            started = time.monotonic()
+            try:
+                if self._conn is None:
+                    self._conn = self.connect()
+                    if self._conn is None:
+                        raise sqlite3.OperationalError("no database connection")
+                self._conn.execute("BEGIN IMMEDIATE")
+                for sql, params in batch.values():
+                    self._conn.execute(sql, params)
+                self._conn.commit()
+            except sqlite3.OperationalError as e:
+                # Usually a busy database; put the batch back ahead of newer writes and retry later
+                logger.warning(f"Write-behind flush of {len(batch)} writes failed, will retry: {e}")
+                self._disconnect()
+                self._requeue(batch)
+                return 0
+            except sqlite3.Error as e:
+                logger.error(f"Write-behind flush of {len(batch)} writes failed, dropping them: {e}")
+                self._disconnect()
+                with self._cond:
+                    self._failures += 1
+                    self._dropped += len(batch)
+                return 0
+
+            with self._cond:
+                self._flushes += 1
+                self._written += len(batch)
+            logger.debug(f"Write-behind flushed {len(batch)} writes in {time.monotonic() - started:.4f}s")
+            return len(batch)
+
+    def _disconnect(self):
+        # A failed flush may leave the connection mid-transaction or broken; the next one opens afresh
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+
+    def _requeue(self, batch):
+        with self._cond:
+            self._failures += 1
+            # Newer writes win over the failed ones they share a key with
+            batch.update(self._pending)
+            self._pending = batch
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+                self._dropped += 1
+
+    def release(self):
+        """Flush what is pending and close the connection, e.g. before the database file is removed
+
+        The next flush opens a new connection through ``connect``.
+        """
+        with self._flush_lock:
+            self.flush()
+            self._disconnect()
+
+    def close(self):
+        """Stop the background thread, flush whatever is still pending and close the connection"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self.release()
+
+    def stats(self):
+        """Return a snapshot of queue counters"""
+        with self._cond:
+            return {
+                'pending': len(self._pending),
+                'enqueued': self._enqueued,
+                'coalesced': self._coalesced,
+                'written': self._written,
+                'dropped': self._dropped,
+                'flushes': self._flushes,
+                'failures': self._failures,
+            }